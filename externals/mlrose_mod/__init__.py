@@ -4,10 +4,14 @@
 # License: BSD 3 clause
 
 from .algorithms import (hill_climb, random_hill_climb, simulated_annealing,
-                         genetic_alg, mimic)
-from .decay import GeomDecay, ArithDecay, ExpDecay, CustomSchedule
+                         lockstep_simulated_annealing,
+                         late_acceptance_hill_climb, tabu_search,
+                         genetic_alg, permutation_genetic_alg, mimic)
+from .decay import (GeomDecay, ArithDecay, ExpDecay, CalibratedDecay,
+                    CustomSchedule)
 from .fitness import (OneMax, FlipFlop, FourPeaks, SixPeaks, ContinuousPeaks,
                       Knapsack, TravellingSales, Queens, MaxKColor, 
                       CustomFitness)
 from .neural import NeuralNetwork, LinearRegression, LogisticRegression
-from .opt_probs import DiscreteOpt, ContinuousOpt, TSPOpt
+from .opt_probs import (DiscreteOpt, ContinuousOpt, TSPOpt, BundleOpt,
+                        NoFeasibleSwap)
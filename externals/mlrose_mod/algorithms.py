@@ -33,7 +33,8 @@ def hill_climb(problem, max_iters=np.inf, restarts=0, init_state=None,
         third return value.
     random_state: int, default: None
         If random_state is a positive integer, random_state is the seed used
-        by np.random.seed(); otherwise, the random seed is not set.
+        by problem.rng.seed() (np.random.seed() unless the problem has its
+        own generator); otherwise, the random seed is not set.
 
     Returns
     -------
@@ -63,7 +64,7 @@ def hill_climb(problem, max_iters=np.inf, restarts=0, init_state=None,
 
     # Set random seed
     if isinstance(random_state, int) and random_state > 0:
-        np.random.seed(random_state)
+        problem.rng.seed(random_state)
 
     best_fitness = -1*np.inf
     best_state = None
@@ -112,7 +113,9 @@ def hill_climb(problem, max_iters=np.inf, restarts=0, init_state=None,
 
 
 def random_hill_climb(problem, max_attempts=10, max_iters=np.inf, restarts=0,
-                      init_state=None, curve=False, random_state=None, swap=True):
+                      init_state=None, curve=False, random_state=None, swap=True,
+                      checkpoint=None, checkpoint_interval=0, resume=None,
+                      callback=None):
     """Use randomized hill climbing to find the optimum for a given
     optimization problem.
 
@@ -138,7 +141,21 @@ def random_hill_climb(problem, max_attempts=10, max_iters=np.inf, restarts=0,
         third return value.
     random_state: int, default: None
         If random_state is a positive integer, random_state is the seed used
-        by np.random.seed(); otherwise, the random seed is not set.
+        by problem.rng.seed() (np.random.seed() unless the problem has its
+        own generator); otherwise, the random seed is not set.
+    checkpoint: callable, default: None
+        Function called every :code:`checkpoint_interval` iterations with a
+        dictionary of the algorithm state, including the state of problem.rng.
+    checkpoint_interval: int, default: 0
+        Number of iterations between calls of :code:`checkpoint`.
+    resume: dict, default: None
+        Algorithm state passed to :code:`checkpoint` by a previous run with
+        the same arguments. The run continues from this state, giving the
+        same result as if it had not been interrupted (the fitness curve
+        only contains the iterations after the state was saved).
+    callback: callable, default: None
+        Function called at the end of every iteration with the number of
+        iterations and whether the neighbor was accepted.
 
     Returns
     -------
@@ -172,23 +189,36 @@ def random_hill_climb(problem, max_attempts=10, max_iters=np.inf, restarts=0,
 
     # Set random seed
     if isinstance(random_state, int) and random_state > 0:
-        np.random.seed(random_state)
+        problem.rng.seed(random_state)
 
     best_fitness = -1*np.inf
     best_state = None
+    first_restart = 0
+
+    if resume is not None:
+        best_fitness = resume['best_fitness']
+        best_state = resume['best_state']
+        first_restart = resume['restart']
 
     if curve:
         fitness_curve = []
 
-    for _ in range(restarts + 1):
+    for restart in range(first_restart, restarts + 1):
         # Initialize optimization problem and attempts counter
-        if init_state is None:
-            problem.reset()
+        if resume is not None and restart == first_restart:
+            problem.state = np.copy(resume['state'])
+            problem.fitness = resume['fitness']
+            attempts = resume['attempts']
+            iters = resume['iters']
+            problem.rng.set_state(resume['random_state'])
         else:
-            problem.set_state(init_state)
+            if init_state is None:
+                problem.reset()
+            else:
+                problem.set_state(init_state)
 
-        attempts = 0
-        iters = 0
+            attempts = 0
+            iters = 0
 
         while (attempts < max_attempts) and (iters < max_iters):
             iters += 1
@@ -205,13 +235,26 @@ def random_hill_climb(problem, max_attempts=10, max_iters=np.inf, restarts=0,
             if next_fitness > problem.get_fitness():
                 problem.set_state(next_state)
                 attempts = 0
+                accepted = True
 
             else:
                 attempts += 1
+                accepted = False
+
+            if callback is not None:
+                callback(iters, accepted)
 
             if curve:
                 fitness_curve.append(problem.get_fitness())
 
+            if checkpoint is not None and iters % checkpoint_interval == 0:
+                checkpoint({'state': problem.get_state(),
+                            'fitness': problem.get_fitness(),
+                            'attempts': attempts, 'iters': iters,
+                            'restart': restart, 'best_state': best_state,
+                            'best_fitness': best_fitness,
+                            'random_state': problem.rng.get_state()})
+
         # Update best state and best fitness
         if problem.get_fitness() > best_fitness:
             best_fitness = problem.get_fitness()
@@ -227,7 +270,9 @@ def random_hill_climb(problem, max_attempts=10, max_iters=np.inf, restarts=0,
 
 def simulated_annealing(problem, schedule=GeomDecay(), max_attempts=10,
                         max_iters=np.inf, init_state=None, curve=False,
-                        random_state=None, swap=True):
+                        random_state=None, swap=True, checkpoint=None,
+                        checkpoint_interval=0, resume=None, callback=None,
+                        init_fitness=None):
     """Use simulated annealing to find the optimum for a given
     optimization problem.
 
@@ -239,6 +284,8 @@ def simulated_annealing(problem, schedule=GeomDecay(), max_attempts=10,
         :code:`TSPOpt()`.
     schedule: schedule object, default: :code:`mlrose.GeomDecay()`
         Schedule used to determine the value of the temperature parameter.
+        If the schedule has an :code:`update` method, it is called at every
+        iteration with delta E and whether the neighbor was accepted.
     max_attempts: int, default: 10
         Maximum number of attempts to find a better neighbor at each step.
     max_iters: int, default: np.inf
@@ -253,7 +300,25 @@ def simulated_annealing(problem, schedule=GeomDecay(), max_attempts=10,
         third return value.
     random_state: int, default: None
         If random_state is a positive integer, random_state is the seed used
-        by np.random.seed(); otherwise, the random seed is not set.
+        by problem.rng.seed() (np.random.seed() unless the problem has its
+        own generator); otherwise, the random seed is not set.
+    checkpoint: callable, default: None
+        Function called every :code:`checkpoint_interval` iterations with a
+        dictionary of the algorithm state, including the state of problem.rng.
+    checkpoint_interval: int, default: 0
+        Number of iterations between calls of :code:`checkpoint`.
+    resume: dict, default: None
+        Algorithm state passed to :code:`checkpoint` by a previous run with
+        the same arguments. The run continues from this state, giving the
+        same result as if it had not been interrupted (the fitness curve
+        only contains the iterations after the state was saved).
+    callback: callable, default: None
+        Function called at the end of every iteration with the number of
+        iterations and whether the neighbor was accepted.
+    init_fitness: float, default: None
+        Fitness of init_state (as returned by :code:`problem.get_fitness()`),
+        if it has already been evaluated. init_state is then not evaluated
+        again.
 
     Returns
     -------
@@ -283,13 +348,19 @@ def simulated_annealing(problem, schedule=GeomDecay(), max_attempts=10,
 
     # Set random seed
     if isinstance(random_state, int) and random_state > 0:
-        np.random.seed(random_state)
+        problem.rng.seed(random_state)
 
     # Initialize problem, time and attempts counter
-    if init_state is None:
+    if resume is not None:
+        problem.state = np.copy(resume['state'])
+        problem.fitness = resume['fitness']
+        problem.rng.set_state(resume['random_state'])
+        if 'schedule' in resume:
+            schedule = resume['schedule']
+    elif init_state is None:
         problem.reset()
     else:
-        problem.set_state(init_state)
+        problem.set_state(init_state, init_fitness)
 
     if curve:
         fitness_curve = []
@@ -297,6 +368,10 @@ def simulated_annealing(problem, schedule=GeomDecay(), max_attempts=10,
     attempts = 0
     iters = 0
 
+    if resume is not None:
+        attempts = resume['attempts']
+        iters = resume['iters']
+
     while (attempts < max_attempts) and (iters < max_iters):
         temp = schedule.evaluate(iters)
         iters += 1
@@ -318,16 +393,31 @@ def simulated_annealing(problem, schedule=GeomDecay(), max_attempts=10,
 
             # If best neighbor is an improvement or random value is less
             # than prob, move to that state and reset attempts counter
-            if (delta_e > 0) or (np.random.uniform() < prob):
+            if (delta_e > 0) or (problem.random_uniform() < prob):
                 problem.set_state(next_state)
                 attempts = 0
+                accepted = True
 
             else:
                 attempts += 1
+                accepted = False
+
+            if hasattr(schedule, 'update'):
+                schedule.update(delta_e, accepted)
+
+            if callback is not None:
+                callback(iters, accepted)
 
         if curve:
             fitness_curve.append(problem.get_fitness())
 
+        if checkpoint is not None and iters % checkpoint_interval == 0:
+            checkpoint({'state': problem.get_state(),
+                        'fitness': problem.get_fitness(),
+                        'attempts': attempts, 'iters': iters,
+                        'random_state': problem.rng.get_state(),
+                        'schedule': schedule})
+
     best_fitness = problem.get_maximize()*problem.get_fitness()
     best_state = problem.get_state()
 
@@ -337,6 +427,514 @@ def simulated_annealing(problem, schedule=GeomDecay(), max_attempts=10,
     return best_state, best_fitness
 
 
+def lockstep_simulated_annealing(problem, n_chains=8, schedule=GeomDecay(),
+                                 max_attempts=10, max_iters=np.inf,
+                                 init_states=None, random_states=None,
+                                 checkpoint=None, checkpoint_interval=0,
+                                 resume=None):
+    """Use simulated annealing of several independent chains, advanced in
+    lockstep, to find the optimum for a given optimization problem. At each
+    iteration one random neighbor of each chain is proposed, the fitness of
+    all of them is evaluated with a single call of
+    :code:`problem.eval_fitness_batch()`, and each neighbor is accepted with
+    the usual probability.
+
+    Each chain draws its random numbers from its own generator, so its
+    trajectory only depends on its seed and initial state, and not on the
+    other chains. The current and best states of the chains are kept in
+    :code:`problem.population` and :code:`problem.best_population` (with
+    fitness values :code:`problem.pop_fitness` and
+    :code:`problem.best_pop_fitness`), such that they are available if the
+    algorithm is interrupted.
+
+    Parameters
+    ----------
+    problem: optimization object
+        Object containing fitness function optimization problem to be solved.
+        Must implement :code:`random_neighbor_swap(state)` and
+        :code:`permutation_to_state()`, as :code:`DiscreteOpt()` and
+        :code:`BundleOpt()` do.
+    n_chains: int, default: 8
+        Number of chains. Must be greater than 0.
+    schedule: schedule object, default: :code:`mlrose.GeomDecay()`
+        Schedule used to determine the value of the temperature parameter,
+        which is the same for all chains. If the schedule has an
+        :code:`update` method, it is called at every iteration with delta E
+        and whether the neighbor was accepted, for each chain.
+    max_attempts: int, default: 10
+        Maximum number of consecutive rejected neighbors. The algorithm stops
+        when every chain has reached it.
+    max_iters: int, default: np.inf
+        Maximum number of iterations of the algorithm.
+    init_states: array, default: None
+        2-D Numpy array containing the starting state of each chain, with one
+        state per row. If :code:`None`, then each chain starts from a random
+        ordering drawn with its own generator.
+    random_states: list, default: None
+        Seed of the generator of each chain. If :code:`None`, then the seeds
+        are drawn with problem.rng.
+    checkpoint: callable, default: None
+        Function called every :code:`checkpoint_interval` iterations with a
+        dictionary of the algorithm state, including the state of the
+        generators.
+    checkpoint_interval: int, default: 0
+        Number of iterations between calls of :code:`checkpoint`.
+    resume: dict, default: None
+        Algorithm state passed to :code:`checkpoint` by a previous run with
+        the same arguments. The run continues from this state, giving the
+        same result as if it had not been interrupted.
+
+    Returns
+    -------
+    best_state: array
+        Numpy array containing state that optimizes the fitness function,
+        out of the best states of all chains.
+    best_fitness: float
+        Value of fitness function at best state.
+    """
+    if (not isinstance(n_chains, int)) or (n_chains <= 0):
+        raise Exception("""n_chains must be a positive integer.""")
+
+    if (not isinstance(max_attempts, int) and not max_attempts.is_integer()) \
+       or (max_attempts < 0):
+        raise Exception("""max_attempts must be a positive integer.""")
+
+    if (not isinstance(max_iters, int) and max_iters != np.inf
+            and not max_iters.is_integer()) or (max_iters < 0):
+        raise Exception("""max_iters must be a positive integer.""")
+
+    if init_states is not None and np.shape(init_states) \
+       != (n_chains, problem.get_length()):
+        raise Exception("""init_states must have one state of the same"""
+                        + """ length as problem for each chain.""")
+
+    if random_states is not None and len(random_states) != n_chains:
+        raise Exception("""random_states must have one seed for each"""
+                        + """ chain.""")
+
+    # Initialize chains, their generators and attempts counters
+    if resume is not None:
+        states = np.copy(resume['states'])
+        fitness = np.copy(resume['fitness'])
+        best_states = np.copy(resume['best_states'])
+        best_fitness = np.copy(resume['best_fitness'])
+        generators = []
+        for generator_state in resume['generators']:
+            generators.append(np.random.RandomState())
+            generators[-1].set_state(generator_state)
+        attempts = np.copy(resume['attempts'])
+        iters = resume['iters']
+        if 'schedule' in resume:
+            schedule = resume['schedule']
+    else:
+        if random_states is None:
+            random_states = list(problem.rng.randint(2**31 - 1, size=n_chains))
+
+        generators = [np.random.RandomState(seed) for seed in random_states]
+
+        if init_states is None:
+            states = np.array([problem.permutation_to_state(
+                generator.permutation(problem.get_length()))
+                for generator in generators])
+        else:
+            states = np.copy(init_states)
+
+        fitness = problem.eval_fitness_batch(states)
+        best_states = np.copy(states)
+        best_fitness = np.copy(fitness)
+        attempts = np.zeros(n_chains, dtype=int)
+        iters = 0
+
+    problem.population = states
+    problem.pop_fitness = fitness
+    problem.best_population = best_states
+    problem.best_pop_fitness = best_fitness
+
+    while np.any(attempts < max_attempts) and (iters < max_iters):
+        temp = schedule.evaluate(iters)
+        iters += 1
+
+        if temp == 0:
+            break
+
+        # Find a random neighbor of each chain, and the random value used to
+        # accept it, with the generator of the chain, which replaces that of
+        # the problem while the neighbor is drawn
+        next_states = np.empty_like(states)
+        uniforms = np.empty(n_chains)
+        problem_rng = problem.rng
+        try:
+            for chain in range(n_chains):
+                problem.rng = generators[chain]
+                next_states[chain] = problem.random_neighbor_swap(
+                    states[chain])
+                uniforms[chain] = generators[chain].uniform()
+        finally:
+            problem.rng = problem_rng
+
+        next_fitness = problem.eval_fitness_batch(next_states)
+
+        # Calculate delta E and change prob
+        delta_e = next_fitness - fitness
+        with np.errstate(over='ignore'):
+            prob = np.exp(delta_e/temp)
+
+        accepted = (delta_e > 0) | (uniforms < prob)
+        states[accepted] = next_states[accepted]
+        fitness[accepted] = next_fitness[accepted]
+        attempts[accepted] = 0
+        attempts[~accepted] += 1
+
+        if hasattr(schedule, 'update'):
+            for chain in range(n_chains):
+                schedule.update(delta_e[chain], accepted[chain])
+
+        improved = fitness > best_fitness
+        best_states[improved] = states[improved]
+        best_fitness[improved] = fitness[improved]
+
+        if checkpoint is not None and iters % checkpoint_interval == 0:
+            checkpoint({'states': states, 'fitness': fitness,
+                        'best_states': best_states,
+                        'best_fitness': best_fitness,
+                        'generators': [generator.get_state()
+                                       for generator in generators],
+                        'attempts': attempts, 'iters': iters,
+                        'schedule': schedule})
+
+    best_chain = np.argmax(best_fitness)
+
+    return best_states[best_chain], \
+        problem.get_maximize()*best_fitness[best_chain]
+
+
+def late_acceptance_hill_climb(problem, history_length=1000, max_attempts=10,
+                               max_iters=np.inf, init_state=None, curve=False,
+                               random_state=None, checkpoint=None,
+                               checkpoint_interval=0, resume=None,
+                               callback=None):
+    """Use late acceptance hill climbing to find the optimum for a given
+    optimization problem. A random neighbor is accepted if it is at least as
+    fit as the current state, or as the state :code:`history_length`
+    iterations earlier.
+
+    Parameters
+    ----------
+    problem: optimization object
+        Object containing fitness function optimization problem to be solved.
+        For example, :code:`DiscreteOpt()`, :code:`ContinuousOpt()` or
+        :code:`TSPOpt()`.
+    history_length: int, default: 1000
+        Number of iterations after which the fitness of the current state is
+        used as the acceptance threshold. Must be greater than 0.
+    max_attempts: int, default: 10
+        Maximum number of consecutive rejected neighbors.
+    max_iters: int, default: np.inf
+        Maximum number of iterations of the algorithm.
+    init_state: array, default: None
+        1-D Numpy array containing starting state for algorithm.
+        If :code:`None`, then a random state is used.
+    curve: bool, default: False
+        Boolean to keep fitness values for a curve.
+        If :code:`False`, then no curve is stored.
+        If :code:`True`, then a history of fitness values is provided as a
+        third return value.
+    random_state: int, default: None
+        If random_state is a positive integer, random_state is the seed used
+        by problem.rng.seed() (np.random.seed() unless the problem has its
+        own generator); otherwise, the random seed is not set.
+    checkpoint: callable, default: None
+        Function called every :code:`checkpoint_interval` iterations with a
+        dictionary of the algorithm state, including the state of problem.rng.
+    checkpoint_interval: int, default: 0
+        Number of iterations between calls of :code:`checkpoint`.
+    resume: dict, default: None
+        Algorithm state passed to :code:`checkpoint` by a previous run with
+        the same arguments. The run continues from this state, giving the
+        same result as if it had not been interrupted (the fitness curve
+        only contains the iterations after the state was saved).
+    callback: callable, default: None
+        Function called at the end of every iteration with the number of
+        iterations and whether the neighbor was accepted.
+
+    Returns
+    -------
+    best_state: array
+        Numpy array containing state that optimizes the fitness function.
+    best_fitness: float
+        Value of fitness function at best state.
+    fitness_curve: array
+        Numpy array containing the fitness at every iteration.
+        Only returned if input argument :code:`curve` is :code:`True`.
+
+    References
+    ----------
+    Burke, E. K. and Y. Bykov (2017). The late acceptance hill-climbing
+    heuristic. *European Journal of Operational Research*, 258(1), 70-78.
+    """
+    if (not isinstance(history_length, int)) or (history_length <= 0):
+        raise Exception("""history_length must be a positive integer.""")
+
+    if (not isinstance(max_attempts, int) and not max_attempts.is_integer()) \
+       or (max_attempts < 0):
+        raise Exception("""max_attempts must be a positive integer.""")
+
+    if (not isinstance(max_iters, int) and max_iters != np.inf
+            and not max_iters.is_integer()) or (max_iters < 0):
+        raise Exception("""max_iters must be a positive integer.""")
+
+    if init_state is not None and len(init_state) != problem.get_length():
+        raise Exception("""init_state must have same length as problem.""")
+
+    # Set random seed
+    if isinstance(random_state, int) and random_state > 0:
+        problem.rng.seed(random_state)
+
+    # Initialize problem, fitness history and counters
+    if resume is not None:
+        problem.state = np.copy(resume['state'])
+        problem.fitness = resume['fitness']
+        history = np.copy(resume['history'])
+        best_state = resume['best_state']
+        best_fitness = resume['best_fitness']
+        attempts = resume['attempts']
+        iters = resume['iters']
+        problem.rng.set_state(resume['random_state'])
+    else:
+        if init_state is None:
+            problem.reset()
+        else:
+            problem.set_state(init_state)
+
+        history = np.full(history_length, problem.get_fitness())
+        best_state = np.copy(problem.get_state())
+        best_fitness = problem.get_fitness()
+        attempts = 0
+        iters = 0
+
+    if curve:
+        fitness_curve = []
+
+    while (attempts < max_attempts) and (iters < max_iters):
+        index = iters % history_length
+        iters += 1
+
+        # Find random neighbor and evaluate fitness
+        next_state = problem.random_neighbor_swap()
+        next_fitness = problem.eval_fitness(next_state)
+
+        # Accept the neighbor if it is no worse than the current state or
+        # the state history_length iterations ago
+        if (next_fitness >= history[index]) \
+           or (next_fitness >= problem.get_fitness()):
+            problem.set_state(next_state)
+            attempts = 0
+            accepted = True
+
+        else:
+            attempts += 1
+            accepted = False
+
+        history[index] = problem.get_fitness()
+
+        if problem.get_fitness() > best_fitness:
+            best_fitness = problem.get_fitness()
+            best_state = np.copy(problem.get_state())
+
+        if callback is not None:
+            callback(iters, accepted)
+
+        if curve:
+            fitness_curve.append(problem.get_fitness())
+
+        if checkpoint is not None and iters % checkpoint_interval == 0:
+            checkpoint({'state': problem.get_state(),
+                        'fitness': problem.get_fitness(),
+                        'history': history, 'best_state': best_state,
+                        'best_fitness': best_fitness,
+                        'attempts': attempts, 'iters': iters,
+                        'random_state': problem.rng.get_state()})
+
+    best_fitness = problem.get_maximize()*best_fitness
+
+    if curve:
+        return best_state, best_fitness, np.asarray(fitness_curve)
+
+    return best_state, best_fitness
+
+
+def tabu_search(problem, n_neighbors=20, tabu_tenure=50, max_attempts=10,
+                max_iters=np.inf, init_state=None, curve=False,
+                random_state=None, checkpoint=None, checkpoint_interval=0,
+                resume=None, callback=None):
+    """Use tabu search to find the optimum for a given optimization problem.
+    At each iteration the fittest of a sample of random neighbors is
+    accepted, even if it is less fit than the current state, unless it moves
+    an element that was moved in the last :code:`tabu_tenure` iterations
+    (and is not fitter than the best state found so far).
+
+    Parameters
+    ----------
+    problem: optimization object
+        Object containing fitness function optimization problem to be solved.
+        Must implement :code:`get_moved()`, as :code:`DiscreteOpt()` and
+        :code:`BundleOpt()` do.
+    n_neighbors: int, default: 20
+        Number of random neighbors sampled at each iteration. Must be
+        greater than 0.
+    tabu_tenure: int, default: 50
+        Number of iterations for which the elements moved by an accepted
+        neighbor may not be moved again.
+    max_attempts: int, default: 10
+        Maximum number of consecutive iterations without improving the best
+        state.
+    max_iters: int, default: np.inf
+        Maximum number of iterations of the algorithm.
+    init_state: array, default: None
+        1-D Numpy array containing starting state for algorithm.
+        If :code:`None`, then a random state is used.
+    curve: bool, default: False
+        Boolean to keep fitness values for a curve.
+        If :code:`False`, then no curve is stored.
+        If :code:`True`, then a history of fitness values is provided as a
+        third return value.
+    random_state: int, default: None
+        If random_state is a positive integer, random_state is the seed used
+        by problem.rng.seed() (np.random.seed() unless the problem has its
+        own generator); otherwise, the random seed is not set.
+    checkpoint: callable, default: None
+        Function called every :code:`checkpoint_interval` iterations with a
+        dictionary of the algorithm state, including the state of problem.rng.
+    checkpoint_interval: int, default: 0
+        Number of iterations between calls of :code:`checkpoint`.
+    resume: dict, default: None
+        Algorithm state passed to :code:`checkpoint` by a previous run with
+        the same arguments. The run continues from this state, giving the
+        same result as if it had not been interrupted (the fitness curve
+        only contains the iterations after the state was saved).
+    callback: callable, default: None
+        Function called at the end of every iteration with the number of
+        iterations and whether a neighbor was accepted.
+
+    Returns
+    -------
+    best_state: array
+        Numpy array containing state that optimizes the fitness function.
+    best_fitness: float
+        Value of fitness function at best state.
+    fitness_curve: array
+        Numpy array containing the fitness at every iteration.
+        Only returned if input argument :code:`curve` is :code:`True`.
+
+    References
+    ----------
+    Glover, F. (1989). Tabu search - part I. *ORSA Journal on Computing*,
+    1(3), 190-206.
+    """
+    if (not isinstance(n_neighbors, int)) or (n_neighbors <= 0):
+        raise Exception("""n_neighbors must be a positive integer.""")
+
+    if (not isinstance(tabu_tenure, int)) or (tabu_tenure < 0):
+        raise Exception("""tabu_tenure must be a positive integer.""")
+
+    if (not isinstance(max_attempts, int) and not max_attempts.is_integer()) \
+       or (max_attempts < 0):
+        raise Exception("""max_attempts must be a positive integer.""")
+
+    if (not isinstance(max_iters, int) and max_iters != np.inf
+            and not max_iters.is_integer()) or (max_iters < 0):
+        raise Exception("""max_iters must be a positive integer.""")
+
+    if init_state is not None and len(init_state) != problem.get_length():
+        raise Exception("""init_state must have same length as problem.""")
+
+    # Set random seed
+    if isinstance(random_state, int) and random_state > 0:
+        problem.rng.seed(random_state)
+
+    # Initialize problem, tabu list and counters
+    if resume is not None:
+        problem.state = np.copy(resume['state'])
+        problem.fitness = resume['fitness']
+        tabu_until = np.copy(resume['tabu_until'])
+        best_state = resume['best_state']
+        best_fitness = resume['best_fitness']
+        attempts = resume['attempts']
+        iters = resume['iters']
+        problem.rng.set_state(resume['random_state'])
+    else:
+        if init_state is None:
+            problem.reset()
+        else:
+            problem.set_state(init_state)
+
+        # Last iteration at which each element is tabu
+        tabu_until = np.zeros(problem.get_length(), dtype=int)
+        best_state = np.copy(problem.get_state())
+        best_fitness = problem.get_fitness()
+        attempts = 0
+        iters = 0
+
+    if curve:
+        fitness_curve = []
+
+    while (attempts < max_attempts) and (iters < max_iters):
+        iters += 1
+
+        # Find the fittest neighbor that is not tabu, or that improves on the
+        # best state
+        chosen = None
+        for i in range(n_neighbors):
+            next_state = problem.random_neighbor_swap()
+            next_fitness = problem.eval_fitness(next_state)
+            moved = problem.get_moved(problem.get_state(), next_state)
+
+            if np.any(tabu_until[moved] >= iters) \
+               and next_fitness <= best_fitness:
+                continue
+
+            if chosen is None or next_fitness > chosen_fitness:
+                chosen = i
+                chosen_state = next_state
+                chosen_fitness = next_fitness
+                chosen_moved = moved
+
+        accepted = chosen is not None
+        if accepted:
+            # The fitness of the neighbor is known, so it is not evaluated
+            # again
+            problem.set_state(chosen_state, chosen_fitness)
+            tabu_until[chosen_moved] = iters + tabu_tenure
+
+        if problem.get_fitness() > best_fitness:
+            best_fitness = problem.get_fitness()
+            best_state = np.copy(problem.get_state())
+            attempts = 0
+        else:
+            attempts += 1
+
+        if callback is not None:
+            callback(iters, accepted)
+
+        if curve:
+            fitness_curve.append(problem.get_fitness())
+
+        if checkpoint is not None and iters % checkpoint_interval == 0:
+            checkpoint({'state': problem.get_state(),
+                        'fitness': problem.get_fitness(),
+                        'tabu_until': tabu_until, 'best_state': best_state,
+                        'best_fitness': best_fitness,
+                        'attempts': attempts, 'iters': iters,
+                        'random_state': problem.rng.get_state()})
+
+    best_fitness = problem.get_maximize()*best_fitness
+
+    if curve:
+        return best_state, best_fitness, np.asarray(fitness_curve)
+
+    return best_state, best_fitness
+
+
 def genetic_alg(problem, pop_size=200, mutation_prob=0.1, max_attempts=10,
                 max_iters=np.inf, curve=False, random_state=None):
     """Use a standard genetic algorithm to find the optimum for a given
@@ -364,7 +962,8 @@ def genetic_alg(problem, pop_size=200, mutation_prob=0.1, max_attempts=10,
         third return value.
     random_state: int, default: None
         If random_state is a positive integer, random_state is the seed used
-        by np.random.seed(); otherwise, the random seed is not set.
+        by problem.rng.seed() (np.random.seed() unless the problem has its
+        own generator); otherwise, the random seed is not set.
 
     Returns
     -------
@@ -403,7 +1002,7 @@ def genetic_alg(problem, pop_size=200, mutation_prob=0.1, max_attempts=10,
 
     # Set random seed
     if isinstance(random_state, int) and random_state > 0:
-        np.random.seed(random_state)
+        problem.rng.seed(random_state)
 
     if curve:
         fitness_curve = []
@@ -425,7 +1024,7 @@ def genetic_alg(problem, pop_size=200, mutation_prob=0.1, max_attempts=10,
 
         for _ in range(pop_size):
             # Select parents
-            selected = np.random.choice(pop_size, size=2,
+            selected = problem.rng.choice(pop_size, size=2,
                                         p=problem.get_mate_probs())
             parent_1 = problem.get_population()[selected[0]]
             parent_2 = problem.get_population()[selected[1]]
@@ -461,6 +1060,194 @@ def genetic_alg(problem, pop_size=200, mutation_prob=0.1, max_attempts=10,
     return best_state, best_fitness
 
 
+def permutation_genetic_alg(problem, pop_size=100, mutation_prob=0.2,
+                            crossover='order', n_elite=2, tournament_size=3,
+                            max_attempts=10, max_iters=np.inf,
+                            init_state=None, curve=False, random_state=None,
+                            checkpoint=None, checkpoint_interval=0,
+                            resume=None):
+    """Use a genetic algorithm whose children are always valid states to
+    find the optimum for a given optimization problem. Parents are chosen by
+    tournament selection and combined with :code:`problem.crossover()`, and
+    the fittest members of each generation are kept unchanged. The fitness of
+    each generation is evaluated with a single call of
+    :code:`problem.eval_fitness_batch()`.
+
+    Parameters
+    ----------
+    problem: optimization object
+        Object containing fitness function optimization problem to be solved.
+        Must implement :code:`permutation_to_state()`, :code:`crossover()` and
+        :code:`random_swap()`, as :code:`DiscreteOpt()` and
+        :code:`BundleOpt()` do.
+    pop_size: int, default: 100
+        Size of population to be used in genetic algorithm.
+    mutation_prob: float, default: 0.2
+        Probability that a child is mutated by a random swap.
+    crossover: string, default: 'order'
+        Crossover method passed to :code:`problem.crossover()`.
+    n_elite: int, default: 2
+        Number of the fittest members of each generation that are copied to
+        the next one.
+    tournament_size: int, default: 3
+        Number of randomly chosen members of the population, the fittest of
+        which is selected as a parent.
+    max_attempts: int, default: 10
+        Maximum number of consecutive generations without improving the best
+        state.
+    max_iters: int, default: np.inf
+        Maximum number of generations of the algorithm.
+    init_state: array, default: None
+        1-D Numpy array containing a state included in the first generation.
+        If :code:`None`, then all states of the first generation are random.
+    curve: bool, default: False
+        Boolean to keep fitness values for a curve.
+        If :code:`False`, then no curve is stored.
+        If :code:`True`, then a history of fitness values is provided as a
+        third return value.
+    random_state: int, default: None
+        If random_state is a positive integer, random_state is the seed used
+        by problem.rng.seed() (np.random.seed() unless the problem has its
+        own generator); otherwise, the random seed is not set.
+    checkpoint: callable, default: None
+        Function called every :code:`checkpoint_interval` generations with a
+        dictionary of the algorithm state, including the state of problem.rng.
+    checkpoint_interval: int, default: 0
+        Number of generations between calls of :code:`checkpoint`.
+    resume: dict, default: None
+        Algorithm state passed to :code:`checkpoint` by a previous run with
+        the same arguments. The run continues from this state, giving the
+        same result as if it had not been interrupted (the fitness curve
+        only contains the generations after the state was saved).
+
+    Returns
+    -------
+    best_state: array
+        Numpy array containing state that optimizes the fitness function.
+    best_fitness: float
+        Value of fitness function at best state.
+    fitness_curve: array
+        Numpy array containing the best fitness at every generation.
+        Only returned if input argument :code:`curve` is :code:`True`.
+    """
+    if pop_size < 0:
+        raise Exception("""pop_size must be a positive integer.""")
+    elif not isinstance(pop_size, int):
+        if pop_size.is_integer():
+            pop_size = int(pop_size)
+        else:
+            raise Exception("""pop_size must be a positive integer.""")
+
+    if (mutation_prob < 0) or (mutation_prob > 1):
+        raise Exception("""mutation_prob must be between 0 and 1.""")
+
+    if (not isinstance(n_elite, int)) or (n_elite < 0) \
+       or (n_elite >= pop_size):
+        raise Exception("""n_elite must be a positive integer less than"""
+                        + """ pop_size.""")
+
+    if (not isinstance(tournament_size, int)) or (tournament_size <= 0):
+        raise Exception("""tournament_size must be a positive integer.""")
+
+    if (not isinstance(max_attempts, int) and not max_attempts.is_integer()) \
+       or (max_attempts < 0):
+        raise Exception("""max_attempts must be a positive integer.""")
+
+    if (not isinstance(max_iters, int) and max_iters != np.inf
+            and not max_iters.is_integer()) or (max_iters < 0):
+        raise Exception("""max_iters must be a positive integer.""")
+
+    if init_state is not None and len(init_state) != problem.get_length():
+        raise Exception("""init_state must have same length as problem.""")
+
+    # Set random seed
+    if isinstance(random_state, int) and random_state > 0:
+        problem.rng.seed(random_state)
+
+    # Initialize population and counters
+    if resume is not None:
+        population = np.copy(resume['population'])
+        pop_fitness = np.copy(resume['pop_fitness'])
+        best_state = resume['best_state']
+        best_fitness = resume['best_fitness']
+        attempts = resume['attempts']
+        iters = resume['iters']
+        problem.rng.set_state(resume['random_state'])
+    else:
+        population = np.array(
+            [problem.permutation_to_state(
+                problem.rng.permutation(problem.get_length()))
+             for _ in range(pop_size)])
+        if init_state is not None:
+            population[0] = init_state
+        pop_fitness = problem.eval_fitness_batch(population)
+
+        best_state = np.copy(population[np.argmax(pop_fitness)])
+        best_fitness = np.max(pop_fitness)
+        attempts = 0
+        iters = 0
+
+    if curve:
+        fitness_curve = []
+
+    while (attempts < max_attempts) and (iters < max_iters):
+        iters += 1
+
+        # Copy the fittest members, and fill the rest of the next generation
+        # with the children of parents chosen by tournament
+        elite = np.argsort(-pop_fitness, kind='stable')[:n_elite]
+        children = []
+
+        for _ in range(pop_size - n_elite):
+            parents = []
+            for _ in range(2):
+                entrants = problem.rng.choice(pop_size, size=tournament_size)
+                parents.append(population[
+                    entrants[np.argmax(pop_fitness[entrants])]])
+
+            child = problem.crossover(parents[0], parents[1], crossover)
+
+            # Mutate child, unless this takes it further above max_inputs
+            if problem.rng.uniform() < mutation_prob:
+                mutant = problem.random_swap(state=child)
+                if problem.max_inputs is None or \
+                   problem.get_excess_inputs(mutant) \
+                   <= problem.get_excess_inputs(child):
+                    child = mutant
+
+            children.append(child)
+
+        children = np.array(children)
+        population = np.concatenate((population[elite], children))
+        pop_fitness = np.concatenate((pop_fitness[elite],
+                                      problem.eval_fitness_batch(children)))
+
+        if np.max(pop_fitness) > best_fitness:
+            best_fitness = np.max(pop_fitness)
+            best_state = np.copy(population[np.argmax(pop_fitness)])
+            attempts = 0
+        else:
+            attempts += 1
+
+        if curve:
+            fitness_curve.append(best_fitness)
+
+        if checkpoint is not None and iters % checkpoint_interval == 0:
+            checkpoint({'population': population,
+                        'pop_fitness': pop_fitness,
+                        'best_state': best_state,
+                        'best_fitness': best_fitness,
+                        'attempts': attempts, 'iters': iters,
+                        'random_state': problem.rng.get_state()})
+
+    best_fitness = problem.get_maximize()*best_fitness
+
+    if curve:
+        return best_state, best_fitness, np.asarray(fitness_curve)
+
+    return best_state, best_fitness
+
+
 def mimic(problem, pop_size=200, keep_pct=0.2, max_attempts=10,
           max_iters=np.inf, curve=False, random_state=None, fast_mimic=False):
     """Use MIMIC to find the optimum for a given optimization problem.
@@ -486,7 +1273,8 @@ def mimic(problem, pop_size=200, keep_pct=0.2, max_attempts=10,
         third return value.
     random_state: int, default: None
         If random_state is a positive integer, random_state is the seed used
-        by np.random.seed(); otherwise, the random seed is not set.
+        by problem.rng.seed() (np.random.seed() unless the problem has its
+        own generator); otherwise, the random seed is not set.
     fast_mimic: bool, default: False
         Activate fast mimic mode to compute the mutual information in
         vectorized form. Faster speed but requires more memory.
@@ -535,7 +1323,7 @@ def mimic(problem, pop_size=200, keep_pct=0.2, max_attempts=10,
 
     # Set random seed
     if isinstance(random_state, int) and random_state > 0:
-        np.random.seed(random_state)
+        problem.rng.seed(random_state)
 
     if curve:
         fitness_curve = []
@@ -228,6 +228,248 @@ class ExpDecay:
         return temp
 
 
+class CalibratedDecay:
+    """
+    Schedule for exponentially decaying the simulated annealing
+    temperature parameter T from an initial to a final temperature,
+    both calibrated from the fitness changes of sampled neighbors,
+    according to the formula:
+
+    .. math::
+
+        T(t) = c \\, T_{0} \\left(\\frac{T_{f}}{T_{0}}\\right)^{\\min(t/n, 1)}
+
+    where:
+
+    * :math:`T_{0}` is the temperature at which a worsening neighbor is
+      accepted with mean probability :code:`init_acceptance`;
+    * :math:`T_{f}` is the temperature at which a worsening neighbor is
+      accepted with mean probability :code:`final_acceptance`;
+    * :math:`n` is the number of steps of the decay; and
+    * :math:`c` is a correction factor, equal to 1 unless
+      :code:`acceptance_band` is set.
+
+    :math:`T_{0}` and :math:`T_{f}` are set by :code:`calibrate`, which must
+    be called before the schedule is used. If :code:`acceptance_band` is
+    set, every :code:`adapt_interval` worsening neighbors :math:`c` is
+    multiplied (divided) by :code:`adapt_rate` if the fraction of them that
+    was accepted is below (above) the band.
+
+    Parameters
+    ----------
+    n_steps: int, default: 10000
+        Number of steps over which T decays from :math:`T_{0}` to
+        :math:`T_{f}`. Must be greater than 0.
+    init_acceptance: float, default: 0.5
+        Target acceptance probability of worsening neighbors at t = 0.
+        Must be between 0 and 1.
+    final_acceptance: float, default: 0.001
+        Target acceptance probability of worsening neighbors at t = n.
+        Must be between 0 and init_acceptance.
+    n_samples: int, default: 200
+        Number of random neighbors sampled by :code:`calibrate`.
+    acceptance_band: list, default: None
+        Lower and upper bounds on the fraction of worsening neighbors
+        accepted. If :code:`None`, then T is not adapted.
+    adapt_interval: int, default: 100
+        Number of worsening neighbors between adaptations of T.
+    adapt_rate: float, default: 1.2
+        Factor by which T is changed at each adaptation. Must be greater
+        than 1.
+    default_temp: float, default: 1.0
+        Value of both :math:`T_{0}` and :math:`T_{f}` if none of the
+        sampled neighbors is worse than the state, e.g. on a flat start.
+        Must be greater than 0.
+
+    Example
+    -------
+    .. highlight:: python
+    .. code-block:: python
+
+       >>> import mlrose
+       >>> schedule = mlrose.CalibratedDecay(n_steps=100)
+       >>> schedule.calibrate(problem)
+       >>> best_state, best_fitness = mlrose.simulated_annealing(
+       ...     problem, schedule=schedule)
+    """
+
+    def __init__(self, n_steps=10000, init_acceptance=0.5,
+                 final_acceptance=0.001, n_samples=200, acceptance_band=None,
+                 adapt_interval=100, adapt_rate=1.2, default_temp=1.0):
+
+        self.n_steps = n_steps
+        self.init_acceptance = init_acceptance
+        self.final_acceptance = final_acceptance
+        self.n_samples = n_samples
+        self.acceptance_band = acceptance_band
+        self.adapt_interval = adapt_interval
+        self.adapt_rate = adapt_rate
+        self.default_temp = default_temp
+
+        self.init_temp = None
+        self.final_temp = None
+        self.factor = 1.0
+        self.n_worse = 0
+        self.n_accepted = 0
+
+        if self.n_steps <= 0:
+            raise Exception("""n_steps must be greater than 0.""")
+
+        if not 0 < self.init_acceptance < 1:
+            raise Exception("""init_acceptance must be between 0 and 1.""")
+
+        if not 0 < self.final_acceptance < self.init_acceptance:
+            raise Exception("""final_acceptance must be between 0 and"""
+                            + """ init_acceptance.""")
+
+        if self.n_samples <= 0:
+            raise Exception("""n_samples must be greater than 0.""")
+
+        if self.default_temp <= 0:
+            raise Exception("""default_temp must be greater than 0.""")
+
+        if self.acceptance_band is not None:
+            if len(self.acceptance_band) != 2 \
+               or not 0 <= self.acceptance_band[0] \
+               < self.acceptance_band[1] <= 1:
+                raise Exception("""acceptance_band must be a pair of"""
+                                + """ increasing values between 0 and 1.""")
+
+            if self.adapt_interval <= 0:
+                raise Exception("""adapt_interval must be greater than 0.""")
+
+            if self.adapt_rate <= 1:
+                raise Exception("""adapt_rate must be greater than 1.""")
+
+    @staticmethod
+    def find_temperature(losses, acceptance):
+        """Find the temperature at which the mean acceptance probability
+        of a set of worsening neighbors equals a target value.
+
+        Parameters
+        ----------
+        losses: array
+            Numpy array of the (positive) fitness decreases of the
+            neighbors.
+        acceptance: float
+            Target mean acceptance probability.
+
+        Returns
+        -------
+        temp: float
+            Temperature parameter giving the target acceptance.
+        """
+        # The mean acceptance increases monotonically with T, so bisect in
+        # log(T) between bounds where it is certainly too low and too high
+        low = np.log(np.min(losses)) - np.log(-np.log(acceptance)) - 10
+        high = np.log(np.max(losses)) - np.log(-np.log(acceptance)) + 10
+
+        for _ in range(100):
+            middle = 0.5*(low + high)
+            if np.mean(np.exp(-losses/np.exp(middle))) < acceptance:
+                low = middle
+            else:
+                high = middle
+
+        return np.exp(0.5*(low + high))
+
+    def calibrate(self, problem, init_state=None):
+        """Set the initial and final temperatures from the fitness changes
+        of random neighbors of a state. The state of the problem is not
+        changed, but each neighbor is evaluated with the fitness function.
+        If no neighbor is worse than the state, both temperatures are set
+        to :code:`default_temp`.
+
+        Parameters
+        ----------
+        problem: optimization object
+            Object containing the optimization problem to be solved. The
+            neighbors are generated with :code:`random_neighbor_swap()`.
+        init_state: array, default: None
+            1-D Numpy array containing the state whose neighbors are
+            sampled. If :code:`None`, then the current state is used.
+
+        Returns
+        -------
+        init_temp: float
+            Calibrated initial temperature.
+        final_temp: float
+            Calibrated final temperature.
+        """
+        if init_state is not None:
+            problem.set_state(init_state)
+
+        losses = []
+        for _ in range(self.n_samples):
+            next_fitness = problem.eval_fitness(problem.random_neighbor_swap())
+            delta_e = next_fitness - problem.get_fitness()
+            if delta_e < 0:
+                losses.append(-delta_e)
+
+        if len(losses) == 0:
+            self.init_temp = self.default_temp
+            self.final_temp = self.default_temp
+            return self.init_temp, self.final_temp
+
+        losses = np.array(losses)
+        self.init_temp = self.find_temperature(losses, self.init_acceptance)
+        self.final_temp = self.find_temperature(losses,
+                                                self.final_acceptance)
+
+        return self.init_temp, self.final_temp
+
+    def evaluate(self, t):
+        """Evaluate the temperature parameter at time t.
+
+        Parameters
+        ----------
+        t: int
+            Time at which the temperature paramter T is evaluated.
+
+        Returns
+        -------
+        temp: float
+            Temperature parameter at time t.
+        """
+        if self.init_temp is None:
+            raise Exception("""calibrate must be called before the"""
+                            + """ schedule is evaluated.""")
+
+        fraction = min(t/self.n_steps, 1.0)
+        temp = self.factor*self.init_temp \
+            * (self.final_temp/self.init_temp)**fraction
+
+        return temp
+
+    def update(self, delta_e, accepted):
+        """Record whether a neighbor was accepted, adapting the temperature
+        if :code:`acceptance_band` is set.
+
+        Parameters
+        ----------
+        delta_e: float
+            Fitness change of the neighbor.
+        accepted: bool
+            Whether the neighbor was accepted.
+        """
+        if self.acceptance_band is None or delta_e >= 0:
+            return
+
+        self.n_worse += 1
+        if accepted:
+            self.n_accepted += 1
+
+        if self.n_worse == self.adapt_interval:
+            rate = self.n_accepted/self.n_worse
+            if rate < self.acceptance_band[0]:
+                self.factor *= self.adapt_rate
+            elif rate > self.acceptance_band[1]:
+                self.factor /= self.adapt_rate
+
+            self.n_worse = 0
+            self.n_accepted = 0
+
+
 class CustomSchedule:
     """Class for generating your own temperature schedule.
 
@@ -960,6 +960,19 @@ class CustomFitness:
         Specifies problem type as 'discrete', 'continuous', 'tsp' or 'either'
         (denoting either discrete or continuous).
 
+    fitness_fn_batch: callable, default: None
+        Function for calculating the fitness of many states at once, with
+        the signature :code:`fitness_fn_batch(states, **kwargs)`, where
+        :code:`states` is a 2-D array with one state per row. If None,
+        :code:`fitness_fn` is called for each state in turn.
+
+    commit_fn: callable, default: None
+        Function called with a state when it becomes the current state of
+        the problem without being evaluated again, i.e. when its fitness
+        is passed to :code:`set_state()`. Fitness functions that keep the
+        last evaluated state can use it to make this state their current
+        one.
+
     kwargs: additional arguments
         Additional parameters to be passed to the fitness function.
 
@@ -978,11 +991,14 @@ class CustomFitness:
         150
     """
 
-    def __init__(self, fitness_fn, problem_type='either', **kwargs):
+    def __init__(self, fitness_fn, problem_type='either',
+                 fitness_fn_batch=None, commit_fn=None, **kwargs):
 
         if problem_type not in ['discrete', 'continuous', 'tsp', 'either']:
             raise Exception("""problem_type does not exist.""")
         self.fitness_fn = fitness_fn
+        self.fitness_fn_batch = fitness_fn_batch
+        self.commit_fn = commit_fn
         self.problem_type = problem_type
         self.kwargs = kwargs
 
@@ -1003,6 +1019,39 @@ class CustomFitness:
         fitness = self.fitness_fn(state, **self.kwargs)
         return fitness
 
+    def evaluate_batch(self, states):
+        """Evaluate the fitness of a batch of state vectors.
+
+        Parameters
+        ----------
+        states: array
+            2-D array of states for evaluation, with one state per row.
+
+        Returns
+        -------
+        fitness: array
+            Array of the fitness value of each state.
+        """
+        if self.fitness_fn_batch is None:
+            fitness = np.array([self.fitness_fn(state, **self.kwargs)
+                                for state in states])
+        else:
+            fitness = np.asarray(self.fitness_fn_batch(states, **self.kwargs))
+
+        return fitness
+
+    def commit(self, state):
+        """Pass a state that has become the current state of the problem,
+        without being evaluated again, to :code:`commit_fn`.
+
+        Parameters
+        ----------
+        state: array
+            New current state.
+        """
+        if self.commit_fn is not None:
+            self.commit_fn(state)
+
     def get_prob_type(self):
         """ Return the problem type.
 
@@ -11,6 +11,73 @@ from scipy.sparse.csgraph import minimum_spanning_tree, depth_first_tree
 from .fitness import TravellingSales
 import time
 
+class NoFeasibleSwap(Exception):
+    """Raised by :code:`random_neighbor_swap` when :code:`max_rejections`
+    consecutive swaps all increase the number of lpGBTs above
+    :code:`max_inputs`, e.g. from a state in which every bundle is full."""
+    pass
+
+class ProposalRandom:
+    """Counter-based random numbers for the proposed neighbors of a
+    minimisation.
+
+    The uniform random numbers of proposal n are drawn from a Philox
+    generator with key seed, starting at counter n*n_values/4, so they are a
+    pure function of (seed, n). A minimisation can therefore be continued
+    from any proposal without drawing the random numbers of the earlier
+    ones. The numbers are generated in batches of batch_size proposals.
+
+    Parameters
+    ----------
+    seed: int
+        Key of the Philox generator.
+    counter: int, default: 0
+        Index of the next proposal.
+    n_values: int, default: 8
+        Number of uniform random numbers of each proposal. Must be a
+        multiple of 4, the number of 64-bit values of each Philox counter.
+    batch_size: int, default: 4096
+        Number of proposals whose random numbers are generated together.
+    """
+
+    def __init__(self, seed, counter=0, n_values=8, batch_size=4096):
+
+        if n_values % 4 != 0:
+            raise Exception("""n_values must be a multiple of 4.""")
+
+        self.seed = seed
+        self.counter = counter
+        self.n_values = n_values
+        self.batch_size = batch_size
+        self.batch = None
+        self.batch_start = 0
+        self.values = None
+
+    def next(self):
+        """Return the random numbers of the next proposal, and advance the
+        counter.
+
+        Returns
+        -------
+        values: array
+            n_values uniform random numbers in [0, 1).
+        """
+        position = self.counter - self.batch_start
+
+        if self.batch is None or not 0 <= position < self.batch_size:
+            bit_generator = np.random.Philox(
+                key=self.seed, counter=self.counter*self.n_values//4)
+            self.batch = np.random.Generator(bit_generator).random(
+                (self.batch_size, self.n_values))
+            self.batch_start = self.counter
+            position = 0
+
+        self.values = self.batch[position]
+        self.counter += 1
+
+        return self.values
+
+
 class OptProb:
     """Base class for optimisation problems.
 
@@ -23,9 +90,12 @@ class OptProb:
     maximize: bool, default: True
         Whether to maximize the fitness function.
         Set :code:`False` for minimization problem.
+    random_state: np.random.RandomState, default: None
+        Generator of the random numbers of the problem, and of the
+        algorithms applied to it (:code:`rng`). If None, np.random is used.
     """
 
-    def __init__(self, length, fitness_fn, maximize=True):
+    def __init__(self, length, fitness_fn, maximize=True, random_state=None):
 
         if length < 0:
             raise Exception("""length must be a positive integer.""")
@@ -44,6 +114,8 @@ class OptProb:
         self.population = []
         self.pop_fitness = []
         self.mate_probs = []
+        self.proposal_rng = None
+        self.rng = np.random if random_state is None else random_state
 
         if maximize:
             self.maximize = 1.0
@@ -70,11 +142,7 @@ class OptProb:
         best: array
             State vector defining best neighbor.
         """
-        fitness_list = []
-
-        for neigh in self.neighbors:
-            fitness = self.eval_fitness(neigh)
-            fitness_list.append(fitness)
+        fitness_list = self.eval_fitness_batch(self.neighbors)
 
         best = self.neighbors[np.argmax(fitness_list)]
 
@@ -100,6 +168,33 @@ class OptProb:
 
         return fitness
 
+    def eval_fitness_batch(self, states):
+        """Evaluate the fitness of a batch of state vectors in one call.
+
+        Parameters
+        ----------
+        states: array
+            2-D array of state vectors for evaluation, with one state per
+            row.
+
+        Returns
+        -------
+        fitness: array
+            Array of the fitness value of each state.
+        """
+        states = np.asarray(states)
+
+        if states.ndim != 2 or states.shape[1] != self.length:
+            raise Exception("state length must match problem length")
+
+        if hasattr(self.fitness_fn, 'evaluate_batch'):
+            fitness = self.maximize*self.fitness_fn.evaluate_batch(states)
+        else:
+            fitness = self.maximize*np.array([self.fitness_fn.evaluate(state)
+                                              for state in states])
+
+        return fitness
+
     def eval_mate_probs(self):
         """
         Calculate the probability of each member of the population reproducing.
@@ -188,6 +283,36 @@ class OptProb:
         """
         return self.state
 
+    def set_proposal_rng(self, seed, counter=0):
+        """Draw the random numbers of each proposed neighbor from a
+        counter-based generator, rather than :code:`rng`, such that proposal n
+        is a pure function of (seed, n).
+
+        Parameters
+        ----------
+        seed: int
+            Key of the generator.
+        counter: int, default: 0
+            Index of the next proposal.
+        """
+        self.proposal_rng = ProposalRandom(seed, counter)
+
+    def random_uniform(self):
+        """Return a uniform random number in [0, 1), e.g. for the acceptance
+        of a neighbor. If a counter-based generator is set, this is the last
+        random number of the latest proposal, otherwise it is drawn with
+        :code:`rng`.
+
+        Returns
+        -------
+        value: float
+            Random number.
+        """
+        if self.proposal_rng is None:
+            return self.rng.uniform()
+
+        return self.proposal_rng.values[-1]
+
     def set_population(self, new_population):
         """ Change the current population to a specified new population and get
         the fitness of all members.
@@ -200,15 +325,9 @@ class OptProb:
         self.population = new_population
 
         # Calculate fitness
-        pop_fitness = []
+        self.pop_fitness = self.eval_fitness_batch(self.population)
 
-        for i in range(len(self.population)):
-            fitness = self.eval_fitness(self.population[i])
-            pop_fitness.append(fitness)
-
-        self.pop_fitness = np.array(pop_fitness)
-
-    def set_state(self, new_state):
+    def set_state(self, new_state, fitness=None):
         """
         Change the current state vector to a specified value
         and get its fitness.
@@ -217,12 +336,21 @@ class OptProb:
         ----------
         new_state: array
             New state vector value.
+        fitness: float, default: None
+            Fitness of new_state, if it has already been evaluated. The state
+            is then not evaluated again, and is instead passed to the
+            :code:`commit()` method of the fitness function, if it has one.
         """
         if len(new_state) != self.length:
             raise Exception("""new_state length must match problem length""")
 
         self.state = new_state
-        self.fitness = self.eval_fitness(self.state)
+        if fitness is None:
+            self.fitness = self.eval_fitness(self.state)
+        else:
+            self.fitness = fitness
+            if hasattr(self.fitness_fn, 'commit'):
+                self.fitness_fn.commit(self.state)
 
 
 class DiscreteOpt(OptProb):
@@ -244,11 +372,54 @@ class DiscreteOpt(OptProb):
         Number of unique values that each element in the state vector
         can take. Assumes values are integers in the range 0 to
         (max_val - 1), inclusive.
+
+    minigroups: dict, default: None
+        Dictionary of the lpGBTs in each minigroup, used to split the
+        state into bundles.
+
+    nBundles: int, default: 24
+        Number of bundles the state is split into.
+
+    bundle_boundaries_fn: callable, default: None
+        Function returning the position of the first element of each
+        bundle, with the length of the state appended, with the signature
+        :code:`bundle_boundaries_fn(state)`. If None, the split is
+        calculated from the sizes of the minigroups.
+
+    max_inputs: int, default: None
+        Maximum number of lpGBTs in a bundle. If not None,
+        :code:`random_neighbor_swap` rejects (before any fitness evaluation)
+        swaps that increase the number of lpGBTs above this limit, summed
+        over all bundles. Starting from a state that respects the limit,
+        every neighbor therefore also respects it.
+
+    max_rejections: int, default: 100000
+        Maximum number of consecutive rejected swaps before
+        :code:`NoFeasibleSwap` is raised.
+
+    bundle_weights_fn: callable, default: None
+        Function returning a non-negative weight for each bundle of the
+        state, with the signature :code:`bundle_weights_fn(state)`. If not
+        None, :code:`random_neighbor_swap` chooses the first bundle of each
+        swap with a probability increasing with its weight above that of
+        the lowest bundle, e.g. its contribution to the fitness. Otherwise
+        both bundles are chosen uniformly.
+
+    uniform_fraction: float, default: 0.1
+        Fraction of the probability of choosing each bundle that is shared
+        uniformly between all bundles when :code:`bundle_weights_fn` is
+        used, such that every swap remains possible.
+
+    random_state: np.random.RandomState, default: None
+        Generator of the random numbers of the problem, and of the
+        algorithms applied to it. If None, np.random is used.
     """
 
-    def __init__(self, length, fitness_fn, maximize=True, max_val=2, minigroups=None, nBundles=24):
+    def __init__(self, length, fitness_fn, maximize=True, max_val=2, minigroups=None, nBundles=24,
+                 bundle_boundaries_fn=None, max_inputs=None, max_rejections=100000,
+                 bundle_weights_fn=None, uniform_fraction=0.1, random_state=None):
         
-        OptProb.__init__(self, length, fitness_fn, maximize)
+        OptProb.__init__(self, length, fitness_fn, maximize, random_state)
 
         if self.fitness_fn.get_prob_type() == 'continuous':
             raise Exception("""fitness_fn must have problem type 'discrete',"""
@@ -275,6 +446,18 @@ class DiscreteOpt(OptProb):
         self.mimic_speed = False
         self.minigroups = minigroups
         self.nBundles = nBundles
+        self.bundle_boundaries_fn = bundle_boundaries_fn
+        self.max_inputs = max_inputs
+        self.max_rejections = max_rejections
+        self.n_rejected = 0
+        self.bundle_weights_fn = bundle_weights_fn
+        self.uniform_fraction = uniform_fraction
+
+        # Number of lpGBTs in each minigroup, indexed by minigroup
+        if minigroups is not None:
+            self.weights = np.zeros(max(minigroups.keys())+1, dtype=int)
+            for minigroup, lpgbts in minigroups.items():
+                self.weights[minigroup] = len(lpgbts)
 
     def eval_node_probs(self):
         """Update probability density estimates.
@@ -432,7 +615,7 @@ class DiscreteOpt(OptProb):
             # If last nodes list is empty, select random node than has not
             # previously been selected
             if len(last) == 0:
-                inds = [np.random.choice(list(set(np.arange(self.length)) -
+                inds = [self.rng.choice(list(set(np.arange(self.length)) -
                                               set(sample_order)))]
             else:
                 for i in last:
@@ -492,7 +675,7 @@ class DiscreteOpt(OptProb):
         state: array
             Randomly generated state vector.
         """
-        state = np.random.randint(0, self.max_val, self.length)
+        state = self.rng.randint(0, self.max_val, self.length)
 
         return state
 
@@ -506,55 +689,306 @@ class DiscreteOpt(OptProb):
         
         return indices    
     
-    def getBundles(self,combination):
+    def getBundleBoundaries(self,combination):
+
+        if self.bundle_boundaries_fn is not None:
+            return self.bundle_boundaries_fn(combination)
 
-        minigroups = self.minigroups
         nBundles = self.nBundles
-        weights = np.array([ len(minigroups[x]) for x in combination ])
+        weights = self.weights[combination]
         cumulative_arr = weights.cumsum() / weights.sum()
-        idx = np.searchsorted(cumulative_arr, np.linspace(0, 1, nBundles, endpoint=False)[1:])
 
         #Method 1
         #idx = np.searchsorted(cumulative_arr, np.linspace(0, 1, nBundles, endpoint=False)[1:])
         #Method 2 (improved)
         idx = self.find_nearest(cumulative_arr, np.linspace(0, 1, nBundles, endpoint=False)[1:])
 
-        bundles = np.array_split(combination,idx)
+        return np.concatenate(([0], idx, [len(combination)])).astype(int)
+
+    def getBundles(self,combination):
+
+        boundaries = self.getBundleBoundaries(combination)
+        bundles = np.array_split(combination,boundaries[1:-1])
         return bundles
     
-    def random_neighbor_swap(self):
-        """Return random neighbor of current state vector.
+    def permutation_to_state(self, permutation):
+        """Return the state corresponding to an ordering of the minigroups.
+
+        Parameters
+        ----------
+        permutation: array
+            Ordering of the minigroups, which is split into bundles.
+
+        Returns
+        -------
+        state: array
+            State vector, which for DiscreteOpt is the ordering itself.
+        """
+        return permutation
+
+    def get_moved(self, state, neighbor):
+        """Return the minigroups moved between a state and its neighbor.
+
+        Parameters
+        ----------
+        state: array
+            State vector.
+        neighbor: array
+            State vector of a neighbor of state.
+
+        Returns
+        -------
+        moved: array
+            Minigroups at the positions that differ, i.e. those that were
+            swapped.
+        """
+        return state[state != neighbor]
+
+    def crossover(self, parent_1, parent_2, method='order'):
+        """Create a child ordering of the minigroups from two parent
+        orderings, such that the child is also a permutation.
+
+        Parameters
+        ----------
+        parent_1: array
+            State vector for parent 1.
+        parent_2: array
+            State vector for parent 2.
+        method: string, default: 'order'
+            Either 'order', for order crossover (the child keeps a random
+            slice of parent 1, with the other minigroups in the order they
+            have in parent 2), or 'pmx', for partially mapped crossover (the
+            child keeps a random slice of parent 1, and the other minigroups
+            keep their positions in parent 2 where possible).
+
+        Returns
+        -------
+        child: array
+            Child state vector produced from parents 1 and 2.
+        """
+        if len(parent_1) != self.length or len(parent_2) != self.length:
+            raise Exception("""Lengths of parents must match problem length""")
+
+        start, end = np.sort(self.rng.choice(self.length + 1, size=2,
+                                              replace=False))
+
+        # Whether each minigroup is in the slice taken from parent 1
+        in_slice = np.zeros(self.length, dtype=bool)
+        in_slice[parent_1[start:end]] = True
+
+        if method == 'order':
+            child = np.empty_like(parent_1)
+            child[start:end] = parent_1[start:end]
+
+            # Fill the positions after the slice (wrapping around) with the
+            # other minigroups, in their order in parent 2 from the same point
+            positions = np.roll(np.arange(self.length), -end)
+            positions = positions[(positions < start) | (positions >= end)]
+            others = np.roll(parent_2, -end)
+            child[positions] = others[~in_slice[others]]
+
+        elif method == 'pmx':
+            child = np.copy(parent_2)
+            child[start:end] = parent_1[start:end]
+
+            # A minigroup of parent 2 outside the slice that is already in the
+            # slice is replaced by following the mapping between the slices
+            position_1 = np.empty(self.length, dtype=int)
+            position_1[parent_1] = np.arange(self.length)
+            outside = np.concatenate((np.arange(start), np.arange(end, self.length)))
+
+            for i in outside[in_slice[parent_2[outside]]]:
+                value = parent_2[i]
+                while start <= position_1[value] < end:
+                    value = parent_2[position_1[value]]
+                child[i] = value
+
+        else:
+            raise Exception("""method must be 'order' or 'pmx'.""")
+
+        return child
+
+    def get_excess_inputs(self, state):
+        """Return the number of lpGBTs above max_inputs, summed over all
+        bundles.
+
+        Parameters
+        ----------
+        state: array
+            State vector.
+
+        Returns
+        -------
+        excess: int
+            Number of lpGBTs above the limit.
+        """
+        boundaries = self.getBundleBoundaries(state)
+        cumulative = np.concatenate(([0], np.cumsum(self.weights[state])))
+        inputs = cumulative[boundaries[1:]] - cumulative[boundaries[:-1]]
+
+        excess = np.sum(np.maximum(inputs - self.max_inputs, 0))
+
+        return excess
+
+    def random_neighbor_swap(self, state=None):
+        """Return random neighbor of current state vector, obtained by
+        swapping two nodes in different bundles. If max_inputs is set, swaps
+        that increase the number of lpGBTs above max_inputs are rejected and
+        counted in n_rejected.
+
+        Parameters
+        ----------
+        state: array, default: None
+            State vector whose neighbor is returned, with the bundles of the
+            swap chosen uniformly. If None, the current state is used, with
+            the bundles chosen as given by :code:`get_bundle_probs`.
 
         Returns
         -------
         neighbor: array
             State vector of random neighbor.
         """
+        if state is None:
+            state = self.state
+            bundle_probs = self.get_bundle_probs()
+        else:
+            bundle_probs = None
 
-        neighbor = np.copy(self.state)
+        neighbor = self.random_swap(bundle_probs, state)
 
-        bundles = self.getBundles(neighbor)
+        if self.max_inputs is not None:
+            excess = self.get_excess_inputs(state)
+            rejections = 0
 
-        #Randomly pick two of the bundles
-        bundle1,bundle2 = np.random.choice(np.arange(len(bundles)),
-                                         size=2, replace=False)
+            while self.get_excess_inputs(neighbor) > excess:
+                self.n_rejected += 1
+                rejections += 1
+                if rejections >= self.max_rejections:
+                    raise NoFeasibleSwap("""No swap found that respects"""
+                                         + """ max_inputs.""")
+
+                neighbor = self.random_swap(bundle_probs, state)
 
-        node1 = np.random.choice(np.arange(len(bundles[bundle1])))
-        node2 = np.random.choice(np.arange(len(bundles[bundle2])))
+        return neighbor
+
+    def get_bundle_probs(self):
+        """Return the probability of choosing each bundle of the current
+        state as the first bundle of a swap.
+
+        Returns
+        -------
+        bundle_probs: array
+            Probability of each bundle, or None if the bundles are chosen
+            uniformly.
+        """
+        if self.bundle_weights_fn is None:
+            return None
+
+        weights = np.asarray(self.bundle_weights_fn(self.state), dtype=float)
+        weights = weights - np.min(weights)
+        bundle_probs = np.full(len(weights), 1./len(weights))
+
+        if np.sum(weights) > 0:
+            bundle_probs = (1 - self.uniform_fraction)*weights/np.sum(weights) \
+                + self.uniform_fraction*bundle_probs
+
+        return bundle_probs
 
-        temp = bundles[bundle1][node1]
-        bundles[bundle1][node1] = bundles[bundle2][node2]
-        bundles[bundle2][node2] = temp
+    def random_swap(self, bundle_probs=None, state=None):
+        """Return random neighbor of current state vector, obtained by
+        swapping two nodes in different bundles.
 
-        neighbor = np.hstack(bundles)
+        Parameters
+        ----------
+        bundle_probs: array, default: None
+            Probability of choosing each bundle as the first bundle of the
+            swap, as returned by :code:`get_bundle_probs`. The second bundle
+            is chosen uniformly from the others. If None, both bundles are
+            chosen uniformly.
+        state: array, default: None
+            State vector whose neighbor is returned. If None, the current
+            state is used.
+
+        Returns
+        -------
+        neighbor: array
+            State vector of random neighbor.
+        """
+        if state is None:
+            state = self.state
 
-        # node1, node2 = np.random.choice(np.arange(self.length),
+        neighbor = np.copy(state)
+
+        boundaries = self.getBundleBoundaries(neighbor)
+        bundle_sizes = np.diff(boundaries)
+
+        #Randomly pick two of the bundles
+        if self.proposal_rng is not None:
+            bundle1, bundle2, node1, node2 = self.counter_swap(
+                bundle_probs, bundle_sizes)
+        else:
+            if bundle_probs is None:
+                bundle1,bundle2 = self.rng.choice(np.arange(len(bundle_sizes)),
+                                                 size=2, replace=False)
+            else:
+                bundle1 = self.rng.choice(len(bundle_sizes), p=bundle_probs)
+                bundle2 = self.rng.choice(np.delete(np.arange(len(bundle_sizes)),
+                                                     bundle1))
+
+            node1 = self.rng.choice(np.arange(bundle_sizes[bundle1]))
+            node2 = self.rng.choice(np.arange(bundle_sizes[bundle2]))
+
+        #Swap the two nodes in place
+        position1 = boundaries[bundle1] + node1
+        position2 = boundaries[bundle2] + node2
+        neighbor[position1] = state[position2]
+        neighbor[position2] = state[position1]
+
+        # node1, node2 = self.rng.choice(np.arange(self.length),
         #                                  size=2, replace=False)
         
         # neighbor[node1] = self.state[node2]
         # neighbor[node2] = self.state[node1]
         return neighbor
 
+    def counter_swap(self, bundle_probs, bundle_sizes):
+        """Return the two bundles of a swap, and the position of the node
+        to be swapped in each, from the random numbers of the next proposal
+        of the counter-based generator.
+
+        Parameters
+        ----------
+        bundle_probs: array
+            Probability of choosing each bundle as the first bundle, or None
+            if both bundles are chosen uniformly.
+        bundle_sizes: array
+            Number of nodes in each bundle.
+
+        Returns
+        -------
+        bundle1, bundle2, node1, node2: int
+            Bundles of the swap, and positions of the nodes in the bundles.
+        """
+        values = self.proposal_rng.next()
+        n_bundles = len(bundle_sizes)
+
+        if bundle_probs is None:
+            bundle1 = int(values[0]*n_bundles)
+        else:
+            bundle1 = min(int(np.searchsorted(np.cumsum(bundle_probs),
+                                              values[0], side='right')),
+                          n_bundles - 1)
+
+        # The second bundle is chosen uniformly from the others
+        bundle2 = int(values[1]*(n_bundles - 1))
+        if bundle2 >= bundle1:
+            bundle2 += 1
+
+        node1 = int(values[2]*bundle_sizes[bundle1])
+        node2 = int(values[3]*bundle_sizes[bundle2])
+
+        return bundle1, bundle2, node1, node2
+
     def random_neighbor_swap_probability(self):
         """Return random neighbor of current state vector.
 
@@ -564,15 +998,15 @@ class DiscreteOpt(OptProb):
             State vector of random neighbor.
         """
         neighbor = np.copy(self.state)
-        node1 = np.random.choice(np.arange(self.length),
+        node1 = self.rng.choice(np.arange(self.length),
                                         size=1, replace=False)
 
         probs = []
         for i in range (self.length):
             probs.append(math.sqrt(abs(i-node1)))
         norm = [x / sum(probs) for x in probs]
-        node2 = np.random.choice(np.arange(self.length),size=1,p=norm)
-        # node1, node2 = np.random.choice(np.arange(self.length),
+        node2 = self.rng.choice(np.arange(self.length),size=1,p=norm)
+        # node1, node2 = self.rng.choice(np.arange(self.length),
         #                                 size=2, replace=False)
         
         neighbor[node1] = self.state[node2]
@@ -590,7 +1024,7 @@ class DiscreteOpt(OptProb):
             State vector of random neighbor.
         """
         neighbor = np.copy(self.state)
-        i = np.random.randint(0, self.length)
+        i = self.rng.randint(0, self.length)
 
         if self.max_val == 2:
             neighbor[i] = np.abs(neighbor[i] - 1)
@@ -598,7 +1032,7 @@ class DiscreteOpt(OptProb):
         else:
             vals = list(np.arange(self.max_val))
             vals.remove(neighbor[i])
-            neighbor[i] = vals[np.random.randint(0, self.max_val-1)]
+            neighbor[i] = vals[self.rng.randint(0, self.max_val-1)]
 
         return neighbor
 
@@ -619,17 +1053,13 @@ class DiscreteOpt(OptProb):
                 raise Exception("""pop_size must be a positive integer.""")
 
         population = []
-        pop_fitness = []
 
         for _ in range(pop_size):
             state = self.random()
-            fitness = self.eval_fitness(state)
-
             population.append(state)
-            pop_fitness.append(fitness)
 
         self.population = np.array(population)
-        self.pop_fitness = np.array(pop_fitness)
+        self.pop_fitness = self.eval_fitness_batch(self.population)
 
     def reproduce(self, parent_1, parent_2, mutation_prob=0.1):
         """Create child state vector from two parent state vectors.
@@ -657,17 +1087,17 @@ class DiscreteOpt(OptProb):
 
         # Reproduce parents
         if self.length > 1:
-            _n = np.random.randint(self.length - 1)
+            _n = self.rng.randint(self.length - 1)
             child = np.array([0]*self.length)
             child[0:_n+1] = parent_1[0:_n+1]
             child[_n+1:] = parent_2[_n+1:]
-        elif np.random.randint(2) == 0:
+        elif self.rng.randint(2) == 0:
             child = np.copy(parent_1)
         else:
             child = np.copy(parent_2)
 
         # Mutate child
-        rand = np.random.uniform(size=self.length)
+        rand = self.rng.uniform(size=self.length)
         mutate = np.where(rand < mutation_prob)[0]
 
         if self.max_val == 2:
@@ -678,7 +1108,7 @@ class DiscreteOpt(OptProb):
             for i in mutate:
                 vals = list(np.arange(self.max_val))
                 vals.remove(child[i])
-                child[i] = vals[np.random.randint(0, self.max_val-1)]
+                child[i] = vals[self.rng.randint(0, self.max_val-1)]
 
         return child
 
@@ -713,7 +1143,7 @@ class DiscreteOpt(OptProb):
         new_sample = np.zeros([sample_size, self.length])
 
         # Get value of first element in new samples
-        new_sample[:, 0] = np.random.choice(self.max_val, sample_size,
+        new_sample[:, 0] = self.rng.choice(self.max_val, sample_size,
                                             p=self.node_probs[0, 0])
 
         # Get sample order
@@ -726,7 +1156,7 @@ class DiscreteOpt(OptProb):
 
             for j in range(self.max_val):
                 inds = np.where(new_sample[:, par_ind] == j)[0]
-                new_sample[inds, i] = np.random.choice(self.max_val,
+                new_sample[inds, i] = self.rng.choice(self.max_val,
                                                        len(inds),
                                                        p=self.node_probs[i, j])
 
@@ -835,7 +1265,7 @@ class ContinuousOpt(OptProb):
         state: array
             Randomly generated state vector.
         """
-        state = np.random.uniform(self.min_val, self.max_val, self.length)
+        state = self.rng.uniform(self.min_val, self.max_val, self.length)
 
         return state
 
@@ -849,9 +1279,9 @@ class ContinuousOpt(OptProb):
         """
         while True:
             neighbor = np.copy(self.state)
-            i = np.random.randint(0, self.length)
+            i = self.rng.randint(0, self.length)
 
-            neighbor[i] += self.step*np.random.choice([-1, 1])
+            neighbor[i] += self.step*self.rng.choice([-1, 1])
 
             if neighbor[i] > self.max_val:
                 neighbor[i] = self.max_val
@@ -881,17 +1311,13 @@ class ContinuousOpt(OptProb):
                 raise Exception("""pop_size must be a positive integer.""")
 
         population = []
-        pop_fitness = []
 
         for _ in range(pop_size):
             state = self.random()
-            fitness = self.eval_fitness(state)
-
             population.append(state)
-            pop_fitness.append(fitness)
 
         self.population = np.array(population)
-        self.pop_fitness = np.array(pop_fitness)
+        self.pop_fitness = self.eval_fitness_batch(self.population)
 
     def reproduce(self, parent_1, parent_2, mutation_prob=0.1):
         """Create child state vector from two parent state vectors.
@@ -921,21 +1347,21 @@ class ContinuousOpt(OptProb):
 
         # Reproduce parents
         if self.length > 1:
-            _n = np.random.randint(self.length - 1)
+            _n = self.rng.randint(self.length - 1)
             child = np.array([0.0]*self.length)
             child[0:_n+1] = parent_1[0:_n+1]
             child[_n+1:] = parent_2[_n+1:]
-        elif np.random.randint(2) == 0:
+        elif self.rng.randint(2) == 0:
             child = np.copy(parent_1)
         else:
             child = np.copy(parent_2)
 
         # Mutate child
-        rand = np.random.uniform(size=self.length)
+        rand = self.rng.uniform(size=self.length)
         mutate = np.where(rand < mutation_prob)[0]
 
         for i in mutate:
-            child[i] = np.random.uniform(self.min_val, self.max_val)
+            child[i] = self.rng.uniform(self.min_val, self.max_val)
 
         return child
 
@@ -1062,7 +1488,7 @@ class TSPOpt(DiscreteOpt):
         state: array
             Randomly generated state vector.
         """
-        state = np.random.permutation(self.length)
+        state = self.rng.permutation(self.length)
 
         return state
 
@@ -1080,7 +1506,7 @@ class TSPOpt(DiscreteOpt):
         node_probs = np.copy(self.node_probs)
 
         # Get value of first element in new sample
-        state[0] = np.random.choice(self.length, p=node_probs[0, 0])
+        state[0] = self.rng.choice(self.length, p=node_probs[0, 0])
         remaining.remove(state[0])
         node_probs[:, :, state[0]] = 0
 
@@ -1095,11 +1521,11 @@ class TSPOpt(DiscreteOpt):
             probs = node_probs[i, par_value]
 
             if np.sum(probs) == 0:
-                next_node = np.random.choice(remaining)
+                next_node = self.rng.choice(remaining)
 
             else:
                 adj_probs = self.adjust_probs(probs)
-                next_node = np.random.choice(self.length, p=adj_probs)
+                next_node = self.rng.choice(self.length, p=adj_probs)
 
             state[i] = next_node
             remaining.remove(next_node)
@@ -1116,7 +1542,7 @@ class TSPOpt(DiscreteOpt):
             State vector of random neighbor.
         """
         neighbor = np.copy(self.state)
-        node1, node2 = np.random.choice(np.arange(self.length),
+        node1, node2 = self.rng.choice(np.arange(self.length),
                                         size=2, replace=False)
 
         neighbor[node1] = self.state[node2]
@@ -1152,24 +1578,24 @@ class TSPOpt(DiscreteOpt):
 
         # Reproduce parents
         if self.length > 1:
-            _n = np.random.randint(self.length - 1)
+            _n = self.rng.randint(self.length - 1)
             child = np.array([0]*self.length)
             child[0:_n+1] = parent_1[0:_n+1]
 
             unvisited = \
                 [node for node in parent_2 if node not in parent_1[0:_n+1]]
             child[_n+1:] = unvisited
-        elif np.random.randint(2) == 0:
+        elif self.rng.randint(2) == 0:
             child = np.copy(parent_1)
         else:
             child = np.copy(parent_2)
 
         # Mutate child
-        rand = np.random.uniform(size=self.length)
+        rand = self.rng.uniform(size=self.length)
         mutate = np.where(rand < mutation_prob)[0]
 
         if len(mutate) > 0:
-            mutate_perm = np.random.permutation(mutate)
+            mutate_perm = self.rng.permutation(mutate)
             temp = np.copy(child)
 
             for i in range(len(mutate)):
@@ -1208,3 +1634,284 @@ class TSPOpt(DiscreteOpt):
         new_sample = np.array(new_sample)
 
         return new_sample
+
+
+class BundleOpt(DiscreteOpt):
+    """Class for defining the assignment of minigroups to bundles, where
+    the state gives the bundle of each minigroup (rather than an ordering
+    of the minigroups that is split into bundles, as in DiscreteOpt).
+
+    Parameters
+    ----------
+    length: int
+        Number of elements in state vector. Must equal the number of
+        minigroups, which are numbered from 0 to (length - 1).
+
+    fitness_fn: fitness function object
+        Object to implement fitness function for optimization.
+
+    maximize: bool, default: True
+        Whether to maximize the fitness function.
+        Set :code:`False` for minimization problem.
+
+    minigroups: dict, default: None
+        Dictionary of the lpGBTs in each minigroup.
+
+    nBundles: int, default: 24
+        Number of bundles. Each element of the state vector takes values in
+        the range 0 to (nBundles - 1), inclusive.
+
+    max_inputs: int, default: None
+        Maximum number of lpGBTs in a bundle. If not None,
+        :code:`random_neighbor_swap` rejects neighbors that increase the
+        number of lpGBTs above this limit, summed over all bundles.
+
+    max_rejections: int, default: 100000
+        Maximum number of consecutive rejected neighbors before
+        :code:`NoFeasibleSwap` is raised.
+
+    bundle_weights_fn: callable, default: None
+        Function returning a non-negative weight for each bundle of the
+        state, as in DiscreteOpt.
+
+    uniform_fraction: float, default: 0.1
+        Fraction of the probability of choosing each bundle that is shared
+        uniformly between all bundles when :code:`bundle_weights_fn` is
+        used.
+
+    move_prob: float, default: 0.5
+        Probability that a neighbor is obtained by moving one minigroup to
+        another bundle, rather than by swapping two minigroups between
+        bundles.
+
+    random_state: np.random.RandomState, default: None
+        Generator of the random numbers of the problem, and of the
+        algorithms applied to it. If None, np.random is used.
+    """
+
+    def __init__(self, length, fitness_fn, maximize=True, minigroups=None,
+                 nBundles=24, max_inputs=None, max_rejections=100000,
+                 bundle_weights_fn=None, uniform_fraction=0.1, move_prob=0.5,
+                 random_state=None):
+
+        DiscreteOpt.__init__(self, length, fitness_fn, maximize,
+                             max_val=nBundles, minigroups=minigroups,
+                             nBundles=nBundles, max_inputs=max_inputs,
+                             max_rejections=max_rejections,
+                             bundle_weights_fn=bundle_weights_fn,
+                             uniform_fraction=uniform_fraction,
+                             random_state=random_state)
+
+        if (move_prob < 0) or (move_prob > 1):
+            raise Exception("""move_prob must be between 0 and 1.""")
+
+        self.move_prob = move_prob
+
+    def getBundles(self, state):
+        """Return the minigroups in each bundle.
+
+        Parameters
+        ----------
+        state: array
+            State vector.
+
+        Returns
+        -------
+        bundles: list
+            List of arrays of the minigroups in each bundle.
+        """
+        order = np.argsort(state, kind='stable')
+        boundaries = np.cumsum(np.bincount(state, minlength=self.nBundles))
+
+        return np.split(order, boundaries[:-1])
+
+    def permutation_to_state(self, permutation):
+        """Return the state with the bundles given by splitting an ordering
+        of the minigroups, as in DiscreteOpt.
+
+        Parameters
+        ----------
+        permutation: array
+            Ordering of the minigroups.
+
+        Returns
+        -------
+        state: array
+            Bundle of each minigroup.
+        """
+        state = np.zeros(self.length, dtype=int)
+        for bundle, minigroups in enumerate(DiscreteOpt.getBundles(self, permutation)):
+            state[minigroups] = bundle
+
+        return state
+
+    def get_moved(self, state, neighbor):
+        """Return the minigroups moved between a state and its neighbor.
+
+        Parameters
+        ----------
+        state: array
+            State vector.
+        neighbor: array
+            State vector of a neighbor of state.
+
+        Returns
+        -------
+        moved: array
+            Minigroups whose bundle differs.
+        """
+        return np.flatnonzero(state != neighbor)
+
+    def crossover(self, parent_1, parent_2, method=None):
+        """Create a child state from two parent states, by keeping a random
+        subset of the bundles of parent 1. The other minigroups are kept
+        together as in parent 2, each group of them being placed in the
+        remaining bundle with the fewest lpGBTs, and split if this would take
+        a bundle above max_inputs.
+
+        Parameters
+        ----------
+        parent_1: array
+            State vector for parent 1.
+        parent_2: array
+            State vector for parent 2.
+        method: string, default: None
+            Not used, as there is only one crossover for BundleOpt.
+
+        Returns
+        -------
+        child: array
+            Child state vector produced from parents 1 and 2.
+        """
+        if len(parent_1) != self.length or len(parent_2) != self.length:
+            raise Exception("""Lengths of parents must match problem length""")
+
+        weights = self.weights[:self.length]
+
+        kept = np.zeros(self.nBundles, dtype=bool)
+        kept[self.rng.choice(self.nBundles, size=self.rng.randint(1, self.nBundles),
+                              replace=False)] = True
+
+        child = np.copy(parent_1)
+        inputs = np.bincount(parent_1, weights=weights, minlength=self.nBundles)
+        inputs[~kept] = 0
+        free = np.flatnonzero(~kept)
+
+        # Bundle of the child in which each bundle of parent 2 is placed
+        placed = {}
+        others = np.flatnonzero(~kept[parent_1])
+        for minigroup in others[np.argsort(parent_2[others], kind='stable')]:
+            bundle = placed.get(parent_2[minigroup])
+            if bundle is None or (self.max_inputs is not None and
+                                  inputs[bundle] + weights[minigroup] > self.max_inputs):
+                bundle = free[np.argmin(inputs[free])]
+                placed[parent_2[minigroup]] = bundle
+
+            child[minigroup] = bundle
+            inputs[bundle] += weights[minigroup]
+
+        return child
+
+    def get_excess_inputs(self, state):
+        """Return the number of lpGBTs above max_inputs, summed over all
+        bundles.
+
+        Parameters
+        ----------
+        state: array
+            State vector.
+
+        Returns
+        -------
+        excess: int
+            Number of lpGBTs above the limit.
+        """
+        inputs = np.bincount(state, weights=self.weights[:self.length],
+                             minlength=self.nBundles)
+
+        return np.sum(np.maximum(inputs - self.max_inputs, 0))
+
+    def random_swap(self, bundle_probs=None, state=None):
+        """Return random neighbor of current state vector, obtained either by
+        moving one minigroup to another bundle, or by swapping two minigroups
+        in different bundles.
+
+        Parameters
+        ----------
+        bundle_probs: array, default: None
+            Probability of choosing each bundle as the bundle from which a
+            minigroup is moved, as returned by :code:`get_bundle_probs`. The
+            other bundle is chosen uniformly from the others. If None, both
+            bundles are chosen uniformly.
+        state: array, default: None
+            State vector whose neighbor is returned. If None, the current
+            state is used.
+
+        Returns
+        -------
+        neighbor: array
+            State vector of random neighbor.
+        """
+        if state is None:
+            state = self.state
+
+        neighbor = np.copy(state)
+
+        if self.proposal_rng is not None:
+            bundle1, bundle2, position1, position2 = self.counter_swap(
+                bundle_probs, np.bincount(state, minlength=self.nBundles))
+        else:
+            if bundle_probs is None:
+                bundle1 = self.rng.randint(self.nBundles)
+            else:
+                bundle1 = self.rng.choice(self.nBundles, p=bundle_probs)
+            bundle2 = self.rng.choice(np.delete(np.arange(self.nBundles),
+                                                 bundle1))
+
+        minigroups1 = np.flatnonzero(state == bundle1)
+        minigroups2 = np.flatnonzero(state == bundle2)
+
+        # An empty bundle can only receive a minigroup
+        if len(minigroups1) == 0:
+            bundle1, bundle2 = bundle2, bundle1
+            minigroups1, minigroups2 = minigroups2, minigroups1
+            if self.proposal_rng is not None:
+                position1, position2 = position2, position1
+
+        # If both bundles are empty, a minigroup of one of the non-empty
+        # bundles is moved to the second, such that the neighbor always
+        # differs from the state
+        if len(minigroups1) == 0:
+            nonempty = np.flatnonzero(np.bincount(state,
+                                                  minlength=self.nBundles))
+            if self.proposal_rng is not None:
+                values = self.proposal_rng.values
+                bundle1 = nonempty[int(values[0]*len(nonempty))]
+                minigroups1 = np.flatnonzero(state == bundle1)
+                position1 = int(values[2]*len(minigroups1))
+            else:
+                bundle1 = self.rng.choice(nonempty)
+                minigroups1 = np.flatnonzero(state == bundle1)
+
+        if self.proposal_rng is not None:
+            # A further random number of the proposal decides between a
+            # move and a swap
+            node1 = minigroups1[position1]
+            move = (len(minigroups2) == 0
+                    or self.proposal_rng.values[4] < self.move_prob)
+        else:
+            node1 = self.rng.choice(minigroups1)
+            move = (len(minigroups2) == 0
+                    or self.rng.uniform() < self.move_prob)
+
+        if move:
+            neighbor[node1] = bundle2
+        else:
+            if self.proposal_rng is not None:
+                node2 = minigroups2[position2]
+            else:
+                node2 = self.rng.choice(minigroups2)
+            neighbor[node1] = bundle2
+            neighbor[node2] = bundle1
+
+        return neighbor
@@ -11,7 +11,8 @@ import pickle
 from scipy import optimize
 from process import loadDataFile,loadConfiguration
 from process import getPhiSplitIndices
-from process import getMinilpGBTGroups,getBundles,getBundledlpgbtHists,getMiniModuleGroups
+from process import getMinilpGBTGroups,getBundledlpgbtHists,getMiniModuleGroups
+from process import getMiniGroupIndex,sumGroupedHists,getBundledlpgbtHistsArray
 from rotate import rotate_to_sector_0
 from geometryCorrections import applyGeometryCorrectionsNumpy,loadSiliconNTCCorrectionFile,applyGeometryCorrectionsTCPtRawData
 from fluctuation_postprocess import plotMeanMax, plotTruncation, studyTruncationOptions, plot_Truncation_tc_Pt
@@ -19,34 +20,22 @@ import time
 import yaml
 import sys, os
 
-def getMiniGroupHistsNumpy(module_hists, minigroups_modules):
-    
-    minigroup_hists = []
+def getMiniGroupModuleOrder(minigroups_modules):
+    #List of modules ordered by minigroup, and the boundaries between minigroups in this list,
+    #such that the minigroup histograms can be formed with a single sum (see getMiniGroupHistsNumpy)
 
-    minigroup_hists_phidivisionX = {}
-    minigroup_hists_phidivisionY = {}
+    minigroup_ids = sorted(minigroups_modules.keys())
+    module_order = [ tuple(module) for minigroup in minigroup_ids for module in minigroups_modules[minigroup] ]
+    minigroup_boundaries = np.cumsum([0] + [ len(minigroups_modules[minigroup]) for minigroup in minigroup_ids ])
 
-    #Get binning from module hists
-    example_hist = next(iter(module_hists[0].values()))
-    nROverZBins = len(example_hist)
+    return module_order, minigroup_boundaries, getMiniGroupIndex(minigroup_ids)
 
-    for minigroup, modules in minigroups_modules.items():
-        
-        phidivisionX = np.zeros(nROverZBins)
-        phidivisionY = np.zeros(nROverZBins)
-        
-        for module in modules:
-            phidivisionX = phidivisionX + module_hists[0][module[0],module[1],module[2],module[3]]
-            phidivisionY = phidivisionY + module_hists[1][module[0],module[1],module[2],module[3]]
-        
-        minigroup_hists_phidivisionX[minigroup] = phidivisionX.copy()
-        minigroup_hists_phidivisionY[minigroup] = phidivisionY.copy()
-
-        
-    minigroup_hists.append(minigroup_hists_phidivisionX)
-    minigroup_hists.append(minigroup_hists_phidivisionY)
+def getMiniGroupHistsNumpy(module_hists, module_order, minigroup_boundaries):
+    #Returns an array of shape [minigroup, phi division, r/z bin]
+    
+    module_array = np.array([[ phiselection[module] for phiselection in module_hists ] for module in module_order ], dtype='float64')
 
-    return minigroup_hists
+    return sumGroupedHists(module_array, np.arange(len(module_order)), minigroup_boundaries)
 
 
 def getMiniGroupTCPtRawData(module_rawdata, minigroups_modules):
@@ -312,7 +301,6 @@ def checkFluctuations(initial_state, cmsswNtuple, outputName="alldata", tcPtConf
     #Load allocation information
     info = loadConfiguration(initial_state)
     data = info['data']
-    init_state = info['mapping']
     nBundles = info['nBundles']
     maxInputs = info['maxInputs']
     mappingFile = info['configuration']['MappingFile']
@@ -350,7 +338,8 @@ def checkFluctuations(initial_state, cmsswNtuple, outputName="alldata", tcPtConf
 
     #Get list of which modules are in each minigroup
     minigroups_modules = getMiniModuleGroups(data,minigroups_swap)
-    bundles = getBundles(minigroups_swap,init_state,nBundles,maxInputs)
+    bundles = info['bundles']
+    module_order, minigroup_boundaries, minigroup_index = getMiniGroupModuleOrder(minigroups_modules)
 
     bundled_lpgbthists_allevents = []
     bundled_pt_hists_allevents = []
@@ -524,10 +513,12 @@ def checkFluctuations(initial_state, cmsswNtuple, outputName="alldata", tcPtConf
                             hist.Fill( np.round(np.sum(module_hists[0][module]) + np.sum(module_hists[1][module])) )
                     
                     #Sum the individual module histograms to get the minigroup histograms
-                    minigroup_hists = getMiniGroupHistsNumpy(module_hists,minigroups_modules)
+                    minigroup_hists = getMiniGroupHistsNumpy(module_hists,module_order,minigroup_boundaries)
 
-                    #Sum the minigroup histograms to get the bundle histograms
-                    bundled_lpgbthists = getBundledlpgbtHists(minigroup_hists,bundles)
+                    #Sum the minigroup histograms to get the bundle histograms,
+                    #and store in the same format as getBundledlpgbtHists
+                    bundled_array = getBundledlpgbtHistsArray(minigroup_hists,minigroup_index,bundles)
+                    bundled_lpgbthists = [ dict(enumerate(bundled_array[:,p])) for p in range(bundled_array.shape[1]) ]
 
                     bundled_lpgbthists_allevents.append(bundled_lpgbthists)
                     
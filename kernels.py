@@ -0,0 +1,117 @@
+#!/usr/bin/env python3
+#Compiled versions of the steps performed in each call of the chi2 function during the minimisation:
+#the split of a state into bundles, the sum of the minigroup histograms in each bundle,
+#the chi2 of each bundle, and the update of the towers touched by each bundle.
+#Numba is used if it can be imported (set engine: numba in the study_mapping config),
+#otherwise the NumPy implementations in process.py are used
+import numpy as np
+
+try:
+    import numba
+    numba_available = True
+except ImportError:
+    numba_available = False
+
+def jit(function):
+    #Compile with numba if available, otherwise leave as a (slow) python function
+    if numba_available:
+        return numba.njit(cache=True)(function)
+    return function
+
+@jit
+def findBundleBoundaries(weights, values):
+    #Equivalent of process.getBundleBoundaries, with values = np.linspace(0, 1, nBundles, endpoint=False)[1:]
+    length = len(weights)
+    cumulative_arr = np.cumsum(weights) / np.sum(weights)
+
+    boundaries = np.empty(len(values)+2, dtype=np.int64)
+    boundaries[0] = 0
+    boundaries[-1] = length
+
+    for v in range(len(values)):
+        value = values[v]
+        above = np.searchsorted(cumulative_arr, value)
+        lower = min(max(above-1, 0), length-1)
+        upper = min(max(above, 0), length-1)
+
+        #find_nearest takes the lower index in case of a tie
+        index = lower
+        if abs(cumulative_arr[upper] - value) < abs(cumulative_arr[lower] - value):
+            index = upper
+        if cumulative_arr[index] - value > 0:
+            index += 1
+        boundaries[v+1] = index
+
+    return boundaries
+
+@jit
+def chiSquaredPerBundle(grouped, content, error, weight_proportionally, use_error_squares):
+    #Equivalent of process.calculateChiSquaredPerBundle with the phi division and r/z bin axes flattened,
+    #i.e. grouped has shape [bundle, bin] or [bundle, 2*bin] with the (value, squared error) interleaved
+    nBins = len(content)
+    chi2 = np.zeros(grouped.shape[0])
+
+    for b in range(grouped.shape[0]):
+        total = 0.
+        for i in range(nBins):
+            if not use_error_squares:
+                total += (grouped[b,i] - content[i])**2
+            else:
+                value = grouped[b,2*i]
+                squared_error = grouped[b,2*i+1]
+
+                weight_p = 1.
+                if weight_proportionally and value > 0:
+                    weight_p = value/500.
+
+                squared_diff = (value - content[i])**2 / weight_p
+
+                if squared_error == 0:
+                    squared_error = error[i]
+                if squared_error != 0:
+                    total += squared_diff/squared_error
+        chi2[b] = total
+
+    return chi2
+
+@jit
+def evaluateBundles(minigroup_array, minigroup_index, weights, module_counts, state, boundaries, bundle_list, content, error, weight_proportionally, use_error_squares):
+    #Equivalent of IncrementalChiSquared.evaluateBundles, with minigroup_array of shape [minigroup, bin]
+    #(the phi division, r/z bin and squared error axes flattened) and module_counts always given
+    #Returns the histograms, chi2, number of lpgbts and number of modules of the bundles in bundle_list
+    nSelected = len(bundle_list)
+    hists = np.zeros((nSelected, minigroup_array.shape[1]))
+    inputs = np.zeros(nSelected, dtype=np.int64)
+    modules = np.zeros(nSelected, dtype=np.int64)
+
+    for j in range(nSelected):
+        b = bundle_list[j]
+        #Minigroups are added in the same order as process.sumGroupedHists
+        for i in range(boundaries[b], boundaries[b+1]):
+            mg = state[i]
+            hists[j] += minigroup_array[minigroup_index[mg]]
+            inputs[j] += weights[mg]
+            modules[j] += module_counts[mg]
+
+    chi2 = chiSquaredPerBundle(hists, content, error, weight_proportionally, use_error_squares)
+
+    return hists, chi2, inputs, modules
+
+@jit
+def moveMiniGroups(minigroups, from_bundles, to_bundles, tower_offsets, pair_tower, tower_region, tower_counts, bundle_towers):
+    #Equivalent of the tower count update in IncrementalChiSquared.moveMiniGroups,
+    #with the towers of minigroup mg given by pair_tower[tower_offsets[mg]:tower_offsets[mg+1]]
+    for m in range(len(minigroups)):
+        mg = minigroups[m]
+        old = from_bundles[m]
+        new = to_bundles[m]
+        for t in range(tower_offsets[mg], tower_offsets[mg+1]):
+            tower = pair_tower[t]
+
+            tower_counts[old,tower] -= 1
+            if tower_counts[old,tower] == 0:
+                bundle_towers[old,tower_region[tower]] -= 1
+
+            tower_counts[new,tower] += 1
+            if tower_counts[new,tower] == 1:
+                bundle_towers[new,tower_region[tower]] += 1
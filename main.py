@@ -3,32 +3,22 @@ import sys
 sys.path.insert(1, './externals')
 import ROOT
 import numpy as np
-import mlrose_mod as mlrose # Author: Genevieve Hayes https://github.com/gkhayes/mlrose/tree/master/mlrose
 import yaml
 import signal
 import pickle
 import json
 import re
 import subprocess
-import random
 
-from sklearn.datasets import load_iris
-from sklearn.model_selection import train_test_split
-from sklearn.preprocessing import MinMaxScaler, OneHotEncoder
-from sklearn.metrics import accuracy_score
 from _ctypes import PyObj_FromPtr
 
-from process import getModuleHists, getCMSSWNtupleName, getlpGBTHists, getMiniGroupHists, getMinilpGBTGroups, getMiniModuleGroups, getBundles, getBundledlpgbtHists, getBundledlpgbtHistsRoot, calculateChiSquared, getMaximumNumberOfModulesInABundle
-from process import loadDataFile, loadModuleTowerMappingFile, loadConfiguration, getTCsPassing, getlpGBTLoadInfo, getHexModuleLoadInfo, getModuleTCHists, getMiniTowerGroups, getMaxTowersList
+from process import getMinilpGBTGroups, getMiniModuleGroups
+from process import calculateChiSquaredArray, getBundledlpgbtHistsArray, bundledArray2TH1D, getMiniGroupTowerBitsets, getMaxTowersListBitset
+from process import MappingOptimiser, StopMinimisation, getSeeds
+from process import loadDataFile, loadModuleTowerMappingFile, loadConfiguration, getTCsPassing, getlpGBTLoadInfo, getHexModuleLoadInfo, getModuleTCHists, getMiniTowerGroups
 from plotting import plot, plot2D
 
-from geometryCorrections import applyGeometryCorrections
-
-chi2_min = 50000000000000000000000
-combbest = []
-nCallsToMappingMax = 0
-
-class exitProgramSignal(LookupError):
+class exitProgramSignal(StopMinimisation):
     pass
  
 def handler(signum, frame):
@@ -81,16 +71,13 @@ def produce_AllocationFile(Configuration):
     #Load allocation information
     info = loadConfiguration(allocation)
     data = info['data']
-    mapping = info['mapping']
     minigroup_type = info['minigroup_type']
-    nBundles = info['nBundles']
-    maxInputs = info['maxInputs']
 
     #Get minigroups
     minigroups,minigroups_swap = getMinilpGBTGroups(data, minigroup_type)
 
     #Bundle together minigroup configuration
-    bundles = getBundles(minigroups_swap,mapping,nBundles,maxInputs)
+    bundles = info['bundles']
 
     #Open output file
     fileout = open(file_name, 'w')
@@ -167,10 +154,7 @@ def produce_JsonMappingFile(Configuration):
     #Load allocation information
     info = loadConfiguration(allocation)
     data = info['data']
-    mapping = info['mapping']
     minigroup_type = info['minigroup_type']
-    nBundles = info['nBundles']
-    maxInputs = info['maxInputs']
     configuration = info['configuration']
     random_seed = info['random_seed']
     nCallsToMappingMax = info['nCallsToMappingMax']
@@ -183,7 +167,18 @@ def produce_JsonMappingFile(Configuration):
     minigroups,minigroups_swap = getMinilpGBTGroups(data, minigroup_type)
     
     #Bundle together minigroup configuration
-    bundles = getBundles(minigroups_swap,mapping,nBundles,maxInputs)
+    bundles = info['bundles']
+
+    #If the maximum number of towers was not calculated during the minimisation
+    #calculate it here, if the tower mapping file is available
+    if not isinstance(max_towers_phi_region, list) and 'TowerMappingFile' in configuration.keys():
+        try:
+            towerdata = loadModuleTowerMappingFile(configuration['TowerMappingFile'])
+            minigroups_towers = getMiniTowerGroups(towerdata, getMiniModuleGroups(data,minigroups_swap))
+            minigroup_tower_bitsets = getMiniGroupTowerBitsets(minigroups_towers, configuration.get('TowerPhiSplit'))
+            max_towers_phi_region = getMaxTowersListBitset(minigroup_tower_bitsets, bundles)
+        except EnvironmentError:
+            print ( "File " + configuration['TowerMappingFile'] + " does not exist, max towers not calculated" )
 
     #Open output file
     json_main = {}
@@ -363,10 +358,7 @@ def produce_nTCsPerModuleHists(Configuration):
     #Load allocation information
     info = loadConfiguration(allocation)
     data = info['data']
-    mapping = info['mapping']
     minigroup_type = info['minigroup_type']
-    nBundles = info['nBundles']
-    maxInputs = info['maxInputs']
 
     #Get minigroups
     minigroups,minigroups_swap = getMinilpGBTGroups(data, minigroup_type)
@@ -375,7 +367,7 @@ def produce_nTCsPerModuleHists(Configuration):
     minigroups_modules = getMiniModuleGroups(data,minigroups_swap)
     
     #Bundle together minigroup configuration
-    bundles = getBundles(minigroups_swap,mapping,nBundles,maxInputs)
+    bundles = info['bundles']
 
     #Get nTC hists per module
     module_hists = getModuleTCHists(CMSSW_ModuleHists)
@@ -458,200 +450,15 @@ def study_mapping(Configuration):
     
     #Function specific settings
     subconfig = Configuration['study_mapping']
-    MappingFile = subconfig['MappingFile']
-    CMSSW_ModuleHists = subconfig['CMSSW_ModuleHists']
     algorithm = subconfig['algorithm']
-    initial_state = subconfig['initial_state']
-    max_iterations = subconfig['max_iterations']
-    max_calls = subconfig['max_calls']
-    minigroup_type = subconfig['minigroup_type']
-    TowerMappingFile = subconfig['TowerMappingFile']
-    TowerPhiSplit = subconfig['TowerPhiSplit']
-
-    random_seed = subconfig['random_seed']
-    if random_seed == None:
-        random_seed = random.randrange(2**32-1)
-    
-    fpgaConfig = None
-    correctionConfig = None
-    chi2Config = None
-    phisplitConfig = None
-    cmsswNtuple = ""
-    
-    if 'fpgas' in subconfig.keys():
-        fpgaConfig = subconfig['fpgas']
-    if 'corrections' in subconfig.keys():
-        correctionConfig = subconfig['corrections']
-    if 'chi2' in subconfig.keys():
-        chi2Config = subconfig['chi2']
-    if 'phisplit' in subconfig.keys():
-        phisplitConfig = subconfig['phisplit']            
-
-    #Load external data
-    data = loadDataFile(MappingFile) #dataframe
 
-    #Load FPGA Information
-    if ( fpgaConfig != None ):
-        nBundles = fpgaConfig["nBundles"]
-        maxInputs = fpgaConfig["maxInputs"]
-    else:
-        #Set defaults
-        nBundles = 14
-        maxInputs = 120
-    
+    #Loads and preprocesses the inputs, and keeps the number of calls and best state of the minimisation
     try:
-
-        #Configuration for how to divide TCs into phidivisionX and phidivisionY (traditionally phi > 60 and phi < 60)
-        split = "per_roverz_bin"
-        phidivisionX_fixvalue_min = 55
-        phidivisionY_fixvalue_max = None
-        
-        if phisplitConfig != None:
-            split = phisplitConfig['type']
-            if 'phidivisionX_fixvalue_min' in phisplitConfig.keys():
-                phidivisionX_fixvalue_min = phisplitConfig['phidivisionX_fixvalue_min']
-            if 'phidivisionY_fixvalue_max' in phisplitConfig.keys():
-                phidivisionY_fixvalue_max = phisplitConfig['phidivisionY_fixvalue_max']
-
-        inclusive_hists,module_hists = getModuleHists(CMSSW_ModuleHists, split = split, phidivisionX_fixvalue_min = phidivisionX_fixvalue_min, phidivisionY_fixvalue_max = phidivisionY_fixvalue_max)
-        cmsswNtuple = getCMSSWNtupleName(CMSSW_ModuleHists)
-
-    except EnvironmentError:
-        print ( "File " + CMSSW_ModuleHists + " does not exist" )
+        optimiser = MappingOptimiser(subconfig, print_level)
+    except (ImportError, ValueError, EnvironmentError) as error:
+        print ( error )
         exit()
-    # Apply various corrections to r/z distributions from CMSSW
-
-    if correctionConfig != None:
-        print ( "Applying geometry corrections" )
-        applyGeometryCorrections( inclusive_hists, module_hists, correctionConfig )
-
-    include_errors_in_chi2 = False
-    include_max_modules_in_chi2 = False
-    include_max_towers_in_chi2 = False
-    max_modules_weighting_factor = 1000
-    max_towers_weighting_factor = 30000
-    max_towers_weighting_option = 2
-    max_towers_step_point = 180
-    weight_bins_proportionally = True
-    if chi2Config != None:
-        if 'include_errors_in_chi2' in chi2Config.keys():
-            include_errors_in_chi2 = chi2Config['include_errors_in_chi2']
-        if 'include_max_modules_in_chi2' in chi2Config.keys():
-            include_max_modules_in_chi2 = chi2Config['include_max_modules_in_chi2']
-        if 'max_modules_weighting_factor' in chi2Config.keys():
-            max_modules_weighting_factor = chi2Config['max_modules_weighting_factor']
-        if 'include_max_towers_in_chi2' in chi2Config.keys():
-            include_max_towers_in_chi2 = chi2Config['include_max_towers_in_chi2']
-        if 'max_modules_weighting_factor' in chi2Config.keys():
-            max_towers_weighting_factor = chi2Config['max_towers_weighting_factor']
-        if 'max_towers_weighting_option' in chi2Config.keys():
-            max_towers_weighting_option = chi2Config['max_towers_weighting_option']
-        if 'max_towers_step_point' in chi2Config.keys():
-            max_towers_step_point = chi2Config['max_towers_step_point']
-        if 'weight_bins_proportionally' in chi2Config.keys():
-            weight_bins_proportionally = chi2Config['weight_bins_proportionally']
-            
-    #Load tower data if required
-    if include_max_towers_in_chi2:
-        try:
-            towerdata = loadModuleTowerMappingFile(TowerMappingFile)
-        except EnvironmentError:
-            print ( "File " + TowerMappingFile + " does not exist" )
-            exit()
-            
-    #Form hists corresponding to each lpGBT from module hists
-    lpgbt_hists = getlpGBTHists(data, module_hists)
-
-    minigroups,minigroups_swap = getMinilpGBTGroups(data, minigroup_type)
-    minigroup_hists = getMiniGroupHists(lpgbt_hists,minigroups_swap,return_error_squares=include_errors_in_chi2)
-    minigroup_hists_root = getMiniGroupHists(lpgbt_hists,minigroups_swap,root=True)
-    #Get list of which modules are in each minigroup
-    minigroups_modules = getMiniModuleGroups(data,minigroups_swap)
-
-    #Get list of which towers are in each minigroup
-    if include_max_towers_in_chi2:
-        minigroups_towers = getMiniTowerGroups(towerdata, minigroups_modules)
 
-    
-    def mapping_max(state):
-        global chi2_min
-        global combbest
-        global nCallsToMappingMax
-    
-        max_modules = None
-        max_towers = None
-        chi2 = 0
-    
-        bundles = getBundles(minigroups_swap,state,nBundles,maxInputs)
-        bundled_lpgbthists = getBundledlpgbtHists(minigroup_hists,bundles)
-
-        if include_max_modules_in_chi2:
-            max_modules = getMaximumNumberOfModulesInABundle(minigroups_modules,bundles)
-        if include_max_towers_in_chi2:
-            max_towers_list = getMaxTowersList(minigroups_towers, bundles, TowerPhiSplit)
-            max_towers = max(max_towers_list)
-
-        chi2 = calculateChiSquared(inclusive_hists,bundled_lpgbthists,nBundles,max_modules,max_modules_weighting_factor,max_towers,[max_towers_weighting_factor,max_towers_weighting_option,max_towers_step_point], weight_bins_proportionally)
-
-        typicalchi2 = 600000000000
-        if include_errors_in_chi2:
-            typicalchi2 = 10000000
-        if (chi2<chi2_min):
-            chi2_min = chi2
-            combbest = np.copy(state)
-            if ( print_level > 0 ):
-                print (algorithm," ", chi2_min, " ", chi2_min/typicalchi2)
-                if include_max_towers_in_chi2:
-                    print ("max_towers = ", max_towers)
-                if include_max_modules_in_chi2:
-                    print ("max_modules = ", max_modules)
-            if ( print_level > 1 ):
-                print (repr(combbest))
-
-        nCallsToMappingMax += 1
-        if max_calls != None:
-            if max_calls == nCallsToMappingMax:
-                raise exitProgramSignal
-        
-        return chi2
-
-    init_state = []
-    if (initial_state[-4:] == ".npy"):
-        print (initial_state)
-        previousConfig = loadConfiguration(initial_state)
-        init_state = previousConfig['mapping']
-        #Get the previous random seed, and number of calls
-        #to restart where previous run finished
-        #This does assume the rest of the config is the same
-        previousnCalls = previousConfig['nCallsToMappingMax']
-        previousRandomSeed = previousConfig['random_seed']    
-        global nCallsToMappingMax
-        nCallsToMappingMax += previousnCalls
-        np.random.seed(previousRandomSeed)
-        
-        if ( len(init_state) != len(minigroups_swap) ):
-            print ( "Initial state should be the same length as the number of mini groups")
-            exit()
-    elif (initial_state == "random"):
-        np.random.seed(random_seed)
-        init_state = np.arange(len(minigroups_swap))
-        np.random.shuffle(init_state)
-
-    
-    fitness_cust = mlrose.CustomFitness(mapping_max)
-    # Define optimization problem object
-    problem_cust = mlrose.DiscreteOpt(length = len(init_state), fitness_fn = fitness_cust, maximize = False, max_val = len(minigroups_swap), minigroups = minigroups_swap, nBundles = nBundles)
-
-    # Define decay schedule
-    decay_schedule = "ExponentialDecay"
-    if decay_schedule == "ExponentialDecay":
-        schedule = mlrose.ExpDecay()
-    elif decay_schedule == "ArithmeticDecay":
-        schedule = mlrose.ArithDecay()
-    else:
-        print ("Unknown decay schedule")
-        exit()
-        
     filename = "bundles_job_"
     filenumber = ""
     if ( len(sys.argv) > 2 ):
@@ -662,18 +469,18 @@ def study_mapping(Configuration):
     
     if ( algorithm == "save_root" ):
         #Save best combination so far into a root file
-        bundles = getBundles(minigroups_swap,init_state,nBundles,maxInputs)
+        bundles = optimiser.getStateBundles(optimiser.init_state)
 
-        bundled_hists_root = getBundledlpgbtHistsRoot(minigroup_hists_root,bundles)
-        bundled_hists = getBundledlpgbtHists(minigroup_hists,bundles)
+        bundled_hists = getBundledlpgbtHistsArray(optimiser.minigroup_hists,optimiser.minigroup_index,bundles)
+        bundled_hists_root = bundledArray2TH1D(getBundledlpgbtHistsArray(optimiser.minigroup_hists_errors,optimiser.minigroup_index,bundles),optimiser.inclusive_hists[0])
 
-        chi2 = calculateChiSquared(inclusive_hists,bundled_hists,nBundles,max_modules,max_modules_weighting_factor,max_towers,[max_towers_weighting_factor,max_towers_weighting_option,max_towers_step_point], weight_bins_proportionally)
+        chi2 = calculateChiSquaredArray(optimiser.chi2_targets,bundled_hists,None,optimiser.max_modules_weighting_factor,None,optimiser.max_towers_weighting, optimiser.weight_bins_proportionally)
         newfile = ROOT.TFile("bundles_roverz.root","RECREATE")
         for sector in bundled_hists_root:
             for key, value in sector.items():
                 value.Write()
-        for sector in inclusive_hists:
-            sector.Scale(1./float(nBundles))
+        for sector in optimiser.inclusive_hists:
+            sector.Scale(1./float(optimiser.nBundles))
             sector.Write()
         newfile.Close()
         print ("Chi2:",chi2)
@@ -682,38 +489,44 @@ def study_mapping(Configuration):
             print ("" )
             print ("bundle" + str(b) )
             for minigroup in bundle:
-                lpgbts = minigroups_swap[minigroup]
+                lpgbts = optimiser.minigroups_swap[minigroup]
                 for lpgbt in lpgbts:
                     print (str(lpgbt) + ", "  , end = '')
 
-    elif algorithm == "random_hill_climb" or algorithm == "simulated_annealing":
+    elif algorithm == "random_hill_climb" or algorithm == "simulated_annealing" or algorithm == "late_acceptance" or algorithm == "tabu_search" or algorithm == "genetic" or algorithm == "lockstep_annealing" or algorithm == "parallel_tempering":
 
         try:
-            if (algorithm == "random_hill_climb"):
-                best_state, best_fitness = mlrose.random_hill_climb(problem_cust, max_attempts=10000, max_iters=max_iterations, restarts=0, init_state=init_state, random_state=random_seed)
-            elif (algorithm == "simulated_annealing"):
-                best_state, best_fitness = mlrose.simulated_annealing(problem_cust, schedule = schedule, max_attempts = 100000, max_iters = 10000000, init_state = init_state, random_state=random_seed)
-                
+            optimiser.run(checkpoint_file = output_dir + "/checkpoint_" + filenumber + ".pkl",
+                          trace_file = output_dir + "/trace_" + filenumber + ".bin")
 
-        except exitProgramSignal:
-            print("interrupt received, stopping and saving")
+        except ValueError as error:
+            print ( error )
+            exit()
 
         finally:
             signal.signal(signal.SIGUSR1,dummy_handler) # avoid any interrupt when finalising
-            bundles = getBundles(minigroups_swap,combbest,nBundles,maxInputs)
-            if include_max_modules_in_chi2:
-                max_modules = getMaximumNumberOfModulesInABundle(minigroups_modules,bundles)
-            else:
-                max_modules = 'Not used in chi2'
-            if include_max_towers_in_chi2:
-                max_towers_list = getMaxTowersList(minigroups_towers, bundles, TowerPhiSplit)
-            else:
-                max_towers_list = 'Not used in chi2'
+            problem_cust = optimiser.problem
+            if len(optimiser.start_summary) > 0:
+                with open(output_dir + "/starts_"+filenumber+".txt","w") as file1:
+                    file1.write( "#start seed chi2 nCalls stop_reason\n" )
+                    for start in optimiser.start_summary:
+                        file1.write( " ".join( str(x) for x in start ) + "\n" )
+            if algorithm == "lockstep_annealing" and hasattr(problem_cust, 'best_pop_fitness'):
+                #Save the seed, chi2 and best state of each chain
+                chain_chi2 = problem_cust.get_maximize()*problem_cust.best_pop_fitness
+                with open(output_dir + "/chains_"+filenumber+".txt","w") as file1:
+                    file1.write( "#chain seed chi2\n" )
+                    for chain,seed in enumerate(getSeeds(optimiser.random_seed, len(chain_chi2))):
+                        file1.write( str(chain) + " " + str(seed) + " " + str(chain_chi2[chain]) + "\n" )
+                np.save(output_dir + "/chains_"+filenumber+".npy", problem_cust.best_population)
+
+            bundles = optimiser.getStateBundles(optimiser.combbest)
+            max_modules,max_towers_list = optimiser.getBundleLimits(bundles)
             with open( output_dir + "/" + filename + ".npy", "wb") as filep:
-                result_config_git = [bundles,subconfig,random_seed,nCallsToMappingMax,max_modules,max_towers_list,cmsswNtuple,git]
+                result_config_git = [bundles,subconfig,optimiser.random_seed,optimiser.n_calls,max_modules,max_towers_list,optimiser.cmsswNtuple,git,optimiser.run_info]
                 pickle.dump(result_config_git, filep)
             file1 = open(output_dir + "/chi2_"+filenumber+".txt","a")
-            file1.write( "bundles[" + filenumber + "] = " + str(chi2_min) + "\n" )
+            file1.write( "bundles[" + filenumber + "] = " + str(optimiser.chi2_min) + "\n" )
             file1.close( )
 
     else:
@@ -5,7 +5,8 @@ import sys,os
 import yaml
 import pickle
 import numpy as np
-from process import loadConfiguration,getMinilpGBTGroups,getBundles,getBundledlpgbtHistsRoot,getMiniGroupHists,getMinilpGBTGroups,getModuleHists,getlpGBTHists,calculateChiSquared
+from process import loadConfiguration,getMinilpGBTGroups,getBundledlpgbtHistsRoot,getMiniGroupHists,getMinilpGBTGroups,getModuleHists,getlpGBTHists,calculateChiSquared
+from process import getMiniGroupHistsArray,getBundledlpgbtHistsArray,bundledArray2TH1D
 from geometryCorrections import applyGeometryCorrections
 from root_numpy import hist2array
 import matplotlib.pyplot as pl
@@ -132,7 +133,6 @@ def main():
         #Load allocation information
         info = loadConfiguration(filein_str)
         data = info['data']
-        init_state = info['mapping']
         minigroup_type = info['minigroup_type']
         nBundles = info['nBundles']
         maxInputs = info['maxInputs']
@@ -164,9 +164,9 @@ def main():
             applyGeometryCorrections( inclusive_hists_input, module_hists, correctionConfig )
 
         lpgbt_hists = getlpGBTHists(data, module_hists)
-        minigroup_hists_root = getMiniGroupHists(lpgbt_hists,minigroups_swap,root=True)
-        bundles = getBundles(minigroups_swap,init_state,nBundles,maxInputs)
-        bundled_hists = getBundledlpgbtHistsRoot(minigroup_hists_root,bundles)
+        minigroup_hists,minigroup_index = getMiniGroupHistsArray(lpgbt_hists,minigroups_swap)
+        bundles = info['bundles']
+        bundled_hists = bundledArray2TH1D(getBundledlpgbtHistsArray(minigroup_hists,minigroup_index,bundles),inclusive_hists_input[0])
 
         if info['configuration']['chi2']['include_max_modules_in_chi2']:
             print ("max modules = ", max_modules)
@@ -208,7 +208,7 @@ def main():
         minigroups = None
         minigroups_swap = None
         lpgbt_hists = None
-        minigroup_hists_root = None
+        minigroup_hists = None
         bundled_hists = None
 
     elif useROOT:
@@ -1,17 +1,43 @@
 #!/usr/bin/env python3
 import pandas as pd
 import numpy as np
-import ROOT
 import sys
 import ctypes
 import pickle
 import os
+import shutil
+import collections
+import hashlib
+import threading
+import queue
+import time
+import random
+import signal
+import multiprocessing
+import kernels
+from geometryCorrections import applyGeometryCorrections
+
+#The minimisation algorithms in the externals directory are only needed by MappingOptimiser
+sys.path.insert(1, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'externals'))
+try:
+    import mlrose_mod as mlrose
+except ImportError:
+    mlrose = None
+
+#ROOT is only needed to read and write histograms, and not by the chi2 calculation and the minimisation
+try:
+    import ROOT
+except ImportError:
+    ROOT = None
 
 np.set_printoptions(threshold=sys.maxsize)
 pd.set_option('display.max_rows', None)
 
 infiles = {}
 
+#Number of bits set in each possible byte, used to count towers in packed bitmasks
+popcount_table = np.array([ bin(i).count('1') for i in range(256) ], dtype=np.uint8)
+
 def loadDataFile(MappingFile):
 
     column_names=['layer', 'u', 'v', 'density', 'shape', 'nDAQ', 'nTPG','DAQId1','nDAQeLinks1','DAQId2','nDAQeLinks2','TPGId1','nTPGeLinks1','TPGId2','nTPGeLinks2']
@@ -90,6 +116,9 @@ def loadConfiguration(config):
 
     #List of which minigroups are assigned to each bundle 
     infodict['mapping'] = np.hstack(info[0])
+    #The bundles themselves, which are not necessarily the split of the mapping
+    #given by getBundles if the minimisation assigned minigroups to bundles directly
+    infodict['bundles'] = info[0]
 
     #Other configurables
     infodict['configuration'] = info[1]
@@ -99,6 +128,8 @@ def loadConfiguration(config):
     infodict['max_towers_list'] = info[5]
     infodict['cmsswNtuple'] = info[6]
     infodict['git'] = info[7]
+    #Why and after how long the minimisation stopped, if recorded
+    infodict['run_info'] = info[8] if len(info) > 8 else None
 
     if 'fpgas' in infodict['configuration'].keys():
         fpgaConfig = infodict['configuration']['fpgas']
@@ -531,6 +562,75 @@ def getMiniGroupHists(lpgbt_hists, minigroups_swap, root=False, return_error_squ
     minigroup_hists.append(minigroup_hists_phiLess60)
 
     return minigroup_hists
+
+def getMiniGroupIndex(minigroup_ids):
+    #Array giving the position of each minigroup id in minigroup_ids (-1 if not present)
+    minigroup_index = np.full(max(minigroup_ids)+1, -1)
+    minigroup_index[minigroup_ids] = np.arange(len(minigroup_ids))
+
+    return minigroup_index
+
+def sumGroupedHists(hist_array, rows, boundaries, ufunc=np.add):
+    #Sum the rows of hist_array, taken in the order given by rows, between consecutive
+    #boundaries (i.e. group g is formed of rows[boundaries[g]:boundaries[g+1]])
+    #Another ufunc may be given to combine the rows, e.g. np.bitwise_or for tower bitsets
+    starts = boundaries[:-1]
+    grouped = ufunc.reduceat(hist_array[rows], np.minimum(starts, len(rows)-1), axis=0)
+
+    #reduceat returns a single row rather than zero for empty groups
+    grouped[starts == boundaries[1:]] = 0
+
+    return grouped
+
+def sumGroupedHistsBatch(hist_array, rows, boundaries, ufunc=np.add):
+    #Batched sumGroupedHists, for rows of shape [state, n] and boundaries of shape [state, nGroups+1]
+    #Returns an array of shape [state, nGroups, ...]
+    nStates, length = rows.shape
+    offsets = length * np.arange(nStates)[:,None]
+
+    #Treat the batch as a single list of nStates*nGroups consecutive groups
+    flat_boundaries = np.append((boundaries[:,:-1] + offsets).ravel(), nStates*length)
+    grouped = sumGroupedHists(hist_array, rows.ravel(), flat_boundaries, ufunc)
+
+    return grouped.reshape((nStates, boundaries.shape[1]-1) + grouped.shape[1:])
+
+def sortWithinGroups(rows, boundaries):
+    #Copy of rows with each group (rows[boundaries[g]:boundaries[g+1]]) sorted, such that a sum over
+    #a group (e.g. of the histograms of the minigroups in a bundle) does not depend on the order of its rows
+    group = np.repeat(np.arange(len(boundaries)-1), np.diff(boundaries))
+
+    return rows[np.lexsort((rows, group))]
+
+def sortWithinGroupsBatch(rows, boundaries):
+    #Batched sortWithinGroups, for rows of shape [state, n] and boundaries of shape [state, nGroups+1]
+    nStates, length = rows.shape
+    offsets = length * np.arange(nStates)[:,None]
+    flat_boundaries = np.append((boundaries[:,:-1] + offsets).ravel(), nStates*length)
+
+    return sortWithinGroups(rows.ravel(), flat_boundaries).reshape(rows.shape)
+
+def getMiniGroupSizes(minigroups):
+    #Array indexed by minigroup id giving the number of entries (e.g. lpgbts or modules) in each minigroup
+    sizes = np.zeros(max(minigroups.keys())+1, dtype=int)
+    for mg,entries in minigroups.items():
+        sizes[mg] = len(entries)
+
+    return sizes
+
+def getMiniGroupHistsArray(lpgbt_hists, minigroups_swap):
+    #Dense alternative to getMiniGroupHists, returning a contiguous array of shape
+    #[minigroup, phi division, r/z bin, 2] with the (value, squared error) in each r/z bin,
+    #and minigroup_index giving the position in the first axis of each minigroup id
+
+    minigroup_ids = sorted(minigroups_swap.keys())
+    lpgbts = [ lpgbt for minigroup in minigroup_ids for lpgbt in minigroups_swap[minigroup] ]
+
+    lpgbt_array = np.array([[ TH1D2array(phiselection[lpgbt],return_error_squares=True) for phiselection in lpgbt_hists ] for lpgbt in lpgbts ])
+    boundaries = np.cumsum([0] + [ len(minigroups_swap[minigroup]) for minigroup in minigroup_ids ])
+
+    minigroup_array = sumGroupedHists(lpgbt_array, np.arange(len(lpgbts)), boundaries)
+
+    return minigroup_array, getMiniGroupIndex(minigroup_ids)
     
 def getlpGBTHists(data, module_hists):
 
@@ -667,6 +767,81 @@ def getMaxTowersList(minigroups_towers, bundles, phisplit=None):
 
     return max_towers_list    
 
+def getMiniGroupTowerArrays(minigroups_towers, phisplit=None):
+    #Array description of minigroups_towers, as used by IncrementalChiSquared and getMiniGroupTowerBitsets
+    #Each unique tower is given an index, such that the towers in each of the phi regions
+    #defined by phisplit are contiguous, and each (minigroup, tower) pair is listed
+    if phisplit == None:
+        phisplit = []
+
+    towers = sorted({ tuple(tower) for towerlist in minigroups_towers.values() for tower in towerlist })
+    tower_region = np.searchsorted(phisplit, np.array([ tower[2] for tower in towers ], dtype=int), side='right')
+
+    order = np.argsort(tower_region, kind='stable')
+    tower_ids = { towers[t]:i for i,t in enumerate(order) }
+
+    pair_minigroup = []
+    pair_tower = []
+    for mg,towerlist in minigroups_towers.items():
+        for tower in { tuple(tower) for tower in towerlist }:
+            pair_minigroup.append(mg)
+            pair_tower.append(tower_ids[tower])
+
+    tower_arrays = {}
+    tower_arrays['minigroup'] = np.array(pair_minigroup, dtype=int)
+    tower_arrays['tower'] = np.array(pair_tower, dtype=int)
+    tower_arrays['region_boundaries'] = np.searchsorted(tower_region[order], np.arange(len(phisplit)+2))
+
+    return tower_arrays
+
+def getMiniGroupTowerBitsets(minigroups_towers, phisplit=None):
+    #Packed bitmask (uint8 array) for each minigroup id of the towers it touches, using the tower index of
+    #getMiniGroupTowerArrays. Each phi region defined by phisplit starts on a new byte, such that
+    #the towers in region r are in bytes region_bytes[r] to region_bytes[r+1]
+    tower_arrays = getMiniGroupTowerArrays(minigroups_towers, phisplit)
+    region_boundaries = tower_arrays['region_boundaries']
+    nRegions = len(region_boundaries) - 1
+
+    region_bytes = np.concatenate(([0], np.cumsum((np.diff(region_boundaries)+7)//8)))
+    tower_region = np.repeat(np.arange(nRegions), np.diff(region_boundaries))
+    tower_bit = 8*region_bytes[tower_region] + np.arange(region_boundaries[-1]) - region_boundaries[tower_region]
+
+    unpacked = np.zeros((max(minigroups_towers.keys())+1, 8*region_bytes[-1]), dtype=bool)
+    unpacked[tower_arrays['minigroup'], tower_bit[tower_arrays['tower']]] = True
+
+    tower_bitsets = {}
+    tower_bitsets['bits'] = np.packbits(unpacked, axis=1)
+    tower_bitsets['region_bytes'] = region_bytes
+
+    return tower_bitsets
+
+def countTowersBitset(bits, region_bytes):
+    #Number of towers set in packed bitmasks (final axis), in each phi region
+    counts = np.cumsum(popcount_table[bits], axis=-1, dtype=int)
+    counts = np.concatenate((np.zeros(counts.shape[:-1]+(1,), dtype=counts.dtype), counts), axis=-1)
+
+    return counts[...,region_bytes[1:]] - counts[...,region_bytes[:-1]]
+
+def getMaxTowersListBitset(tower_bitsets, bundles):
+    #Equivalent of getMaxTowersList, using the output of getMiniGroupTowerBitsets
+    #The towers of each bundle are found by OR-ing the bitmasks of its minigroups
+    state = np.concatenate(bundles).astype(int)
+    boundaries = np.cumsum([0] + [ len(bundle) for bundle in bundles ])
+
+    bundle_bits = sumGroupedHists(tower_bitsets['bits'], state, boundaries, np.bitwise_or)
+    bundle_towers = countTowersBitset(bundle_bits, tower_bitsets['region_bytes'])
+
+    return [ int(n) for n in np.max(bundle_towers, axis=0) ]
+
+def getMaxTowersListBatch(tower_bitsets, states, boundaries):
+    #Batched getMaxTowersList for states of shape [state, minigroup], using the output of
+    #getMiniGroupTowerBitsets and the bundle boundaries from getBundleBoundariesBatch
+    #Returns an array of shape [state, phi region]
+    bundle_bits = sumGroupedHistsBatch(tower_bitsets['bits'], states, boundaries, np.bitwise_or)
+    bundle_towers = countTowersBitset(bundle_bits, tower_bitsets['region_bytes'])
+
+    return np.max(bundle_towers, axis=1)
+
 def getMinilpGBTGroups(data, minigroup_type="minimal"):
 
     minigroups = {}
@@ -748,8 +923,49 @@ def find_nearest(array, values):
         
     return indices
 
+def find_nearest_batch(arrays, values):
+    #Equivalent of find_nearest for each row of arrays (each row must be increasing)
+    #Returns an array of shape [row, value]
+    length = arrays.shape[1]
+
+    #The nearest element is either side of the position at which the value would be inserted
+    if arrays.shape[0] == 1:
+        above = np.searchsorted(arrays[0], values)[None,:]
+    else:
+        above = (arrays[:,:,None] < values[None,None,:]).sum(axis=1)
+    lower = np.clip(above-1, 0, length-1)
+    upper = np.clip(above, 0, length-1)
+
+    difference_lower = np.abs(np.take_along_axis(arrays, lower, axis=1) - values)
+    difference_upper = np.abs(np.take_along_axis(arrays, upper, axis=1) - values)
+
+    #argmin in find_nearest takes the first (i.e. lower) index in case of a tie
+    indices = np.where(difference_upper < difference_lower, upper, lower)
+    indices += (np.take_along_axis(arrays, indices, axis=1) - values > 0)
+
+    return indices
+
+def getBundleBoundaries(weights, nBundles=24):
+    #Positions of the first minigroup of each bundle, with the length of the state appended,
+    #for the minigroup weights (numbers of lpgbts) in the order of the state
+    #The split is identical to that of find_nearest, but without a loop over the bundles
+    cumulative_arr = weights.cumsum() / weights.sum()
+    idx = find_nearest_batch(cumulative_arr[None,:], np.linspace(0, 1, nBundles, endpoint=False)[1:])[0]
+
+    return np.concatenate(([0], idx, [len(weights)]))
+
+def getBundleBoundariesBatch(weights, nBundles=24):
+    #Positions of the first minigroup of each bundle, with the length of the state appended,
+    #for the minigroup weights (numbers of lpgbts) of a batch of states, shape [state, minigroup]
+    #The split is identical to that in getBundles
+    cumulative_arr = weights.cumsum(axis=1) / weights.sum(axis=1)[:,None]
+    idx = find_nearest_batch(cumulative_arr, np.linspace(0, 1, nBundles, endpoint=False)[1:])
+
+    nStates, length = weights.shape
+    return np.concatenate((np.zeros((nStates,1),dtype=int), idx, np.full((nStates,1),length)), axis=1)
+
 def getBundles(minigroups_swap,combination,nBundles=24,maxInputs=72):
-    #Reimplemented in externals/mlrose_mod/opt_probs.py
+    #The same split (getBundleBoundaries) is used by DiscreteOpt in externals/mlrose_mod/opt_probs.py
     
     #Need to divide the minigroups into nBundles groups (24 by default) taking into account their different size
 
@@ -759,23 +975,84 @@ def getBundles(minigroups_swap,combination,nBundles=24,maxInputs=72):
     except KeyError:
         print ("Requested minigroup does not exist in input mapping file")
         exit()
-    cumulative_arr = weights.cumsum() / weights.sum()
     #Calculate the indices where to perform the split
 
     #Method 1
     #idx = np.searchsorted(cumulative_arr, np.linspace(0, 1, nBundles, endpoint=False)[1:])
-    #Method 2 (improved)
-    idx = find_nearest(cumulative_arr, np.linspace(0, 1, nBundles, endpoint=False)[1:])
+    #Method 2 (improved, see find_nearest)
+    idx = getBundleBoundaries(weights, nBundles)[1:-1]
 
     bundles = np.array_split(combination,idx)
 
-    for bundle in bundles:
-        weight_bundles = np.array([ len(minigroups_swap[x])  for x in bundle ])
+    for weight_bundles in np.split(weights,idx):
         if (weight_bundles.sum() > maxInputs ):
             print ( "Error: more than " + str(maxInputs) + " lpgbts in bundle")
             
     return bundles
             
+
+def getPermutationFromLabels(labels, nBundles=24):
+    #For a state giving the bundle of each minigroup id, return the equivalent state as an ordering
+    #of the minigroups (in order of bundle, then of minigroup id) and the boundaries between the bundles
+    state = np.argsort(labels, kind='stable')
+    boundaries = np.concatenate(([0], np.cumsum(np.bincount(labels, minlength=nBundles))))
+
+    return state, boundaries
+
+def getBundlesFromLabels(labels, nBundles=24):
+    #Bundles of a state giving the bundle of each minigroup id, in the format returned by getBundles
+    state, boundaries = getPermutationFromLabels(labels, nBundles)
+
+    return np.split(state, boundaries[1:-1])
+
+def getLabelsFromBundles(bundles):
+    #Bundle of each minigroup id, for bundles in the format returned by getBundles
+    labels = np.zeros(sum(len(bundle) for bundle in bundles), dtype=int)
+    for b,bundle in enumerate(bundles):
+        labels[bundle] = b
+
+    return labels
+
+def getGreedyLabels(minigroup_array, minigroup_index, weights, targets, nBundles=24, maxInputs=72):
+    #Constructive starting point for the minimisation, similar to a longest-processing-time schedule:
+    #the minigroups are taken in order of decreasing total histogram content, and each is added to the
+    #bundle whose r/z shape deficit (with respect to the chi2 target content) it best fills, i.e. that
+    #with the smallest sum of squared differences to the target after adding the minigroup
+    #(the chi2 itself is not used, as with weight_proportionally it penalises partially filled bins)
+    #Bundles are first filled up to the average number of lpgbts per bundle, such that the split of the
+    #equivalent ordering (getPermutationFromLabels) closely follows these bundles, and never above maxInputs
+    #minigroup_array and minigroup_index are as used by IncrementalChiSquared, and weights from getMiniGroupSizes
+    #Returns the bundle of each minigroup id
+    values = minigroup_array[...,0] if minigroup_array.ndim == 4 else minigroup_array
+    minigroup_ids = np.flatnonzero(minigroup_index >= 0)
+    values = values[minigroup_index].reshape(len(minigroup_index), -1)
+    content = targets['content'].ravel()
+
+    order = minigroup_ids[np.argsort(-values[minigroup_ids].sum(axis=1), kind='stable')]
+
+    deficit = np.tile(content, (nBundles,1))
+    inputs = np.zeros(nBundles, dtype=int)
+    average = int(np.ceil(weights[minigroup_ids].sum() / nBundles))
+
+    labels = np.zeros(len(minigroup_index), dtype=int)
+    for mg in order:
+        #Change in the sum of squared differences, sum((deficit - value)^2 - deficit^2)
+        change = np.sum(values[mg] * (values[mg] - 2*deficit), axis=1)
+
+        allowed = inputs + weights[mg] <= min(average, maxInputs)
+        if not allowed.any():
+            allowed = inputs + weights[mg] <= maxInputs
+        if not allowed.any():
+            print ( "Error: more than " + str(maxInputs) + " lpgbts in bundle")
+            allowed = inputs == inputs.min()
+
+        bundle = np.flatnonzero(allowed)[np.argmin(change[allowed])]
+        deficit[bundle] -= values[mg]
+        inputs[bundle] += weights[mg]
+        labels[mg] = bundle
+
+    return labels
+
 def getBundledlpgbtHistsRoot(minigroup_hists,bundles):
 
     bundled_lpgbthists = []
@@ -830,6 +1107,49 @@ def getBundledlpgbtHists(minigroup_hists,bundles):
 
     return bundled_lpgbthists_list
 
+def getBundledlpgbtHistsArray(minigroup_array,minigroup_index,bundles):
+    #Dense alternative to getBundledlpgbtHists, using the output of getMiniGroupHistsArray
+    #Returns an array of shape [bundle, phi division, r/z bin(, 2)]
+
+    state = np.concatenate(bundles)
+    boundaries = np.cumsum([0] + [ len(bundle) for bundle in bundles ])
+
+    return sumGroupedHists(minigroup_array, minigroup_index[state], boundaries)
+
+def getBundledlpgbtHistsBatch(minigroup_array,minigroup_index,states,boundaries):
+    #Batched getBundledlpgbtHistsArray for states of shape [state, minigroup],
+    #with the bundle boundaries from getBundleBoundariesBatch
+    #Returns an array of shape [state, bundle, phi division, r/z bin(, 2)]
+    return sumGroupedHistsBatch(minigroup_array, minigroup_index[states], boundaries)
+
+def bundledArray2TH1D(bundled_array,example_hist):
+    #Convert the output of getBundledlpgbtHistsArray (including squared errors)
+    #into ROOT histograms, in the format returned by getBundledlpgbtHistsRoot
+
+    bundled_lpgbthists_list = []
+
+    nROverZBins = example_hist.GetNbinsX()
+    rOverZMin = example_hist.GetXaxis().GetBinLowEdge(1)
+    rOverZMax = example_hist.GetXaxis().GetBinLowEdge(nROverZBins + 1)
+
+    for p in range(bundled_array.shape[1]):
+
+        temp = {}
+
+        for i in range(bundled_array.shape[0]):
+
+            lpgbt_hist = ROOT.TH1D( ("lpgbt_ROverZ_bundled_" + str(i) + "_" + str(p)),"",nROverZBins,rOverZMin,rOverZMax)
+
+            for b in range(nROverZBins):
+                lpgbt_hist.SetBinContent( b+1, bundled_array[i][p][b][0] )
+                lpgbt_hist.SetBinError( b+1, np.sqrt(bundled_array[i][p][b][1]) )
+
+            temp[i] = lpgbt_hist
+
+        bundled_lpgbthists_list.append(temp)
+
+    return bundled_lpgbthists_list
+
 def getNumberOfModulesInEachBundle(minigroups_modules,bundles):
 
     data = []
@@ -855,20 +1175,6 @@ def calculateChiSquared(inclusive,grouped,nBundles=24,max_modules=None,weight_ma
     if ( grouped[0][0].ndim == 2 ):
         use_error_squares = True
 
-    #If optimisation of the number of modules in a bundle is performed
-    #Aim for the maximum to be as low as possible -
-    #i.e. for the number of modules in each bundle to be similar
-    use_max_modules = False
-    if ( max_modules != None):
-        use_max_modules = True
-
-    #If optimisation of the number of towers touched in a bundle is performed
-    #Either aim for the maximum to be as low as possible (option 1) or
-    #use a function that penalises very high values, but allows lower values with no penalty (option 2)
-    use_max_towers = False
-    if ( max_towers != None):
-        use_max_towers = True
-
     chi2_total = 0
     
     for i in range(len(inclusive)):
@@ -897,14 +1203,1645 @@ def calculateChiSquared(inclusive,grouped,nBundles=24,max_modules=None,weight_ma
                         chi2_total+=(squared_diff/squared_error)
 
 
-    if use_max_modules:
-        chi2_total += weight_max_modules * max_modules
+    chi2_total += getChiSquaredPenalty(max_modules,weight_max_modules,max_towers,weight_max_towers)
+            
+    return chi2_total
+
+def getChiSquaredPenalty(max_modules=None,weight_max_modules=1000,max_towers=None,weight_max_towers=[1000,1,180]):
+    #Additional chi2 terms for the maximum number of modules and towers in a bundle
+    penalty = 0
+
+    #If optimisation of the number of modules in a bundle is performed
+    #Aim for the maximum to be as low as possible -
+    #i.e. for the number of modules in each bundle to be similar
+    #max_modules and max_towers may also be arrays, with one entry per state in a batch
+    if ( max_modules is not None ):
+        penalty = penalty + weight_max_modules * max_modules
 
-    if use_max_towers:
+    #If optimisation of the number of towers touched in a bundle is performed
+    #Either aim for the maximum to be as low as possible (option 1) or
+    #use a function that penalises very high values, but allows lower values with no penalty (option 2)
+    if ( max_towers is not None ):
         if weight_max_towers[1] == 1:
-            chi2_total += weight_max_towers[0] * max_towers
+            penalty = penalty + weight_max_towers[0] * max_towers
         elif weight_max_towers[1] == 2:
-            if max_towers > weight_max_towers[2]:
-                chi2_total += weight_max_towers[0] * pow((max_towers-weight_max_towers[2]),2)
-            
+            penalty = penalty + weight_max_towers[0] * (max_towers > weight_max_towers[2]) * pow((max_towers-weight_max_towers[2]),2)
+
+    return penalty
+
+def getChiSquaredTargets(inclusive,nBundles=24):
+    #Convert the inclusive histograms into arrays (shape [phi division, r/z bin])
+    #of the target content and error of each bundle, so that ROOT is
+    #only accessed once rather than in every call of the chi2 function
+    targets = {}
+    nROverZBins = inclusive[0].GetNbinsX()
+
+    targets['content'] = np.array([[ hist.GetBinContent(b+1)/nBundles for b in range(nROverZBins) ] for hist in inclusive ])
+    targets['error'] = np.array([[ hist.GetBinError(b+1)/nBundles for b in range(nROverZBins) ] for hist in inclusive ])
+
+    return targets
+
+def bundledHists2array(grouped):
+    #Convert the output of getBundledlpgbtHists into a single array of shape
+    #[bundle, phi division, r/z bin] (with an additional final axis of (value, squared error)
+    #if the squared errors are included), as returned by getBundledlpgbtHistsArray
+    return np.swapaxes(np.array([ list(phiselection.values()) for phiselection in grouped ]), 0, 1)
+
+def calculateChiSquaredPerBundle(targets,grouped,weight_proportionally=True,use_error_squares=None):
+    #Array implementation of the r/z part of calculateChiSquared, returning the contribution of each bundle
+    #grouped has shape [bundle, phi division, r/z bin] or [bundle, phi division, r/z bin, 2]
+    #Any leading axes (e.g. for a batch of states) are kept in the output,
+    #in which case use_error_squares must be given explicitly
+
+    if ( use_error_squares == None ):
+        use_error_squares = ( grouped.ndim == 4 )
+
+    content = targets['content']
+
+    if not use_error_squares:
+        chi2 = np.power( grouped - content, 2 )
+    else:
+        values = grouped[...,0]
+        squared_error = grouped[...,1]
+
+        weight_p = np.ones(values.shape)
+        if weight_proportionally:
+            positive = values > 0
+            weight_p[positive] = values[positive]/500.
+
+        squared_diff = np.power( values - content, 2 ) / weight_p
+
+        #If a bundle has no error in a given bin use the inclusive error instead
+        squared_error = np.where( squared_error == 0, targets['error'], squared_error )
+
+        chi2 = np.divide( squared_diff, squared_error, out=np.zeros(squared_diff.shape), where=(squared_error != 0) )
+
+    #Sum over phi divisions and r/z bins, such that the sum for a given bundle
+    #does not depend on how many bundles are evaluated together
+    chi2 = chi2.reshape(chi2.shape[:-2] + (-1,))
+
+    return chi2.sum(axis=-1)
+
+def sumChiSquaredPerBundle(chi2):
+    #Total of the chi2 contributions of the bundles (final axis), added in increasing order
+    #such that the total does not depend on the order of the bundles
+    return np.sort(chi2, axis=-1).sum(axis=-1)
+
+def calculateChiSquaredArray(targets,grouped,max_modules=None,weight_max_modules=1000,max_towers=None,weight_max_towers=[1000,1,180],weight_proportionally=True):
+    #Equivalent of calculateChiSquared using the arrays from getChiSquaredTargets and
+    #getBundledlpgbtHistsArray (or bundledHists2array)
+    chi2_total = sumChiSquaredPerBundle(calculateChiSquaredPerBundle(targets,grouped,weight_proportionally))
+    chi2_total += getChiSquaredPenalty(max_modules,weight_max_modules,max_towers,weight_max_towers)
+
+    return chi2_total
+
+def calculateChiSquaredBatch(targets,grouped,max_modules=None,weight_max_modules=1000,max_towers=None,weight_max_towers=[1000,1,180],weight_proportionally=True,use_error_squares=None):
+    #Batched calculateChiSquaredArray, with grouped of shape [state, bundle, phi division, r/z bin(, 2)]
+    #as returned by getBundledlpgbtHistsBatch, and max_modules and max_towers arrays with one entry per state
+    #Returns an array of the chi2 of each state
+    if ( use_error_squares == None ):
+        use_error_squares = ( grouped.ndim == 5 )
+
+    chi2_total = sumChiSquaredPerBundle(calculateChiSquaredPerBundle(targets,grouped,weight_proportionally,use_error_squares))
+    chi2_total = chi2_total + getChiSquaredPenalty(max_modules,weight_max_modules,max_towers,weight_max_towers)
+
     return chi2_total
+
+class IncrementalChiSquared:
+    #Calculates the r/z part of the chi2 for a given state (ordering of minigroups),
+    #keeping the bundle histograms and per-bundle chi2 contributions of the current state.
+    #If the state to be evaluated differs from the current state by the swap of two minigroups
+    #only the affected bundles are recalculated. The proposed state is committed if it is
+    #evaluated a second time (as is done by OptProb.set_state when a move is accepted),
+    #or passed to setCurrent, and is otherwise discarded when the next state is evaluated.
+    #Optionally the number of modules in each bundle, and the number of towers touched by
+    #each bundle in each phi region, are also kept up to date.
+    #If labels is True the states instead give the bundle of each minigroup id, and only the
+    #bundles whose minigroups differ from those of the current state are recalculated.
+
+    def __init__(self, minigroups_swap, minigroup_array, minigroup_index, targets, nBundles=24, maxInputs=72, weight_proportionally=True, minigroups_modules=None, minigroups_towers=None, phisplit=None, engine='numpy', labels=False):
+        #minigroup_array and minigroup_index are as returned by getMiniGroupHistsArray,
+        #with the squared errors removed if they are not to be used in the chi2
+        #minigroups_modules and minigroups_towers (from getMiniModuleGroups and getMiniTowerGroups)
+        #are only needed if the maximum number of modules or towers in a bundle is required
+        #engine is either 'numpy' or 'numba' (using the compiled functions in kernels.py)
+
+        self.nBundles = nBundles
+        self.maxInputs = maxInputs
+        self.targets = targets
+        self.weight_proportionally = weight_proportionally
+
+        self.minigroup_array = np.ascontiguousarray(minigroup_array)
+        self.minigroup_index = minigroup_index
+        self.use_error_squares = ( self.minigroup_array.ndim == 4 )
+
+        #The weights are the numbers of lpgbts in each mini-group
+        self.weights = getMiniGroupSizes(minigroups_swap)
+
+        self.module_counts = None
+        if minigroups_modules != None:
+            self.module_counts = getMiniGroupSizes(minigroups_modules)
+
+        self.minigroup_towers = None
+        if minigroups_towers != None:
+            tower_arrays = getMiniGroupTowerArrays(minigroups_towers, phisplit)
+            region_boundaries = tower_arrays['region_boundaries']
+            self.nTowers = region_boundaries[-1]
+            self.nRegions = len(region_boundaries) - 1
+            self.tower_region = np.repeat(np.arange(self.nRegions), np.diff(region_boundaries))
+
+            #Towers touched by each minigroup id
+            order = np.argsort(tower_arrays['minigroup'], kind='stable')
+            pair_minigroup = tower_arrays['minigroup'][order]
+            pair_tower = tower_arrays['tower'][order]
+            offsets = np.searchsorted(pair_minigroup, np.arange(len(self.weights)+1))
+            self.minigroup_towers = [ pair_tower[offsets[mg]:offsets[mg+1]] for mg in range(len(self.weights)) ]
+            self.pair_minigroup = pair_minigroup
+            self.pair_tower = pair_tower
+            self.tower_offsets = offsets
+
+        self.state = None
+        self.pending = None
+        self.labels = False
+
+        self.engine = 'numpy'
+        if engine == 'numba':
+            self.minigroup_array_flat = self.minigroup_array.reshape(len(self.minigroup_array), -1)
+            self.targets_flat = { key:np.ascontiguousarray(value).ravel() for key,value in targets.items() }
+            self.split_values = np.linspace(0, 1, self.nBundles, endpoint=False)[1:]
+            if kernels.numba_available:
+                self.engine = 'numba'
+                self.checkEngine()
+            else:
+                print ( "Warning: numba could not be imported, using the numpy engine" )
+        elif engine != 'numpy':
+            print ( "Unknown engine " + str(engine) + ", using the numpy engine" )
+
+        #Set after checkEngine, which evaluates orderings of the minigroups
+        self.labels = labels
+
+    def checkEngine(self, rtol=1e-9):
+        #Check that the numba engine agrees with the numpy engine, for a full evaluation
+        #and a swap (of the first and last minigroups), otherwise revert to the numpy engine
+        state = np.flatnonzero(self.weights > 0)
+        swapped = state.copy()
+        swapped[[0,-1]] = swapped[[-1,0]]
+
+        results = {}
+        for engine in ['numba', 'numpy']:
+            self.engine = engine
+            result = [ self.evaluateFull(state), self.evaluate(swapped) ]
+            if self.module_counts is not None:
+                result.append(self.getMaxModules())
+            if self.minigroup_towers is not None:
+                result.extend(self.getMaxTowersList())
+            self.rollback()
+            result.append(self.chi2)
+            results[engine] = np.array(result, dtype=float)
+
+        self.state = None
+        self.pending = None
+        self.engine = 'numba'
+
+        if not np.allclose(results['numba'], results['numpy'], rtol=rtol, atol=0):
+            print ( "Warning: numba and numpy engines disagree (", results['numba'], "vs", results['numpy'], "), using the numpy engine" )
+            self.engine = 'numpy'
+
+    def calculateBundleBoundaries(self, state):
+        #Split of state into bundles, identical to getBundleBoundaries
+        if self.engine == 'numba':
+            return kernels.findBundleBoundaries(self.weights[state], self.split_values)
+
+        return getBundleBoundaries(self.weights[state], self.nBundles)
+
+    def getBundleBoundaries(self, state):
+        #Positions in the state of the first minigroup of each bundle, with the length of the state appended
+        #The split of the current state is kept, so it is not recalculated when proposing a move from it
+        if self.state is not None and np.array_equal(state, self.state):
+            return self.boundaries
+
+        return self.calculateBundleBoundaries(state)
+
+    def getPartition(self, state):
+        #Ordering of the minigroups and the boundaries between the bundles, for either type of state
+        if self.labels:
+            return getPermutationFromLabels(state, self.nBundles)
+
+        return state, self.getBundleBoundaries(state)
+
+    def evaluateBundles(self, state, boundaries, bundle_list):
+        #Return the histograms, chi2 contributions, number of lpgbts and number of modules of the bundles in bundle_list
+
+        modules = None
+
+        if len(bundle_list) == self.nBundles:
+            minigroups = state
+            local_boundaries = boundaries
+        else:
+            #Minigroups of the selected bundles only, and the boundaries between them
+            minigroups = np.concatenate([ state[boundaries[b]:boundaries[b+1]] for b in bundle_list ])
+            local_boundaries = np.cumsum(np.concatenate(([0], boundaries[bundle_list+1] - boundaries[bundle_list])))
+
+        #The minigroups of each bundle are added in order of id, such that the chi2 of a bundle
+        #does not depend on the order of its minigroups in the state
+        minigroups = sortWithinGroups(minigroups, local_boundaries)
+
+        if self.engine == 'numba':
+            #The kernels use the histograms with the phi division, r/z bin (and squared error) axes flattened
+            module_counts = self.weights if self.module_counts is None else self.module_counts
+            hists, chi2, inputs, modules = kernels.evaluateBundles(self.minigroup_array_flat, self.minigroup_index, self.weights, module_counts,
+                                                                   minigroups, local_boundaries, np.arange(len(bundle_list)), self.targets_flat['content'], self.targets_flat['error'],
+                                                                   self.weight_proportionally, self.use_error_squares)
+            hists = hists.reshape((len(hists),) + self.minigroup_array.shape[1:])
+            if self.module_counts is None:
+                modules = None
+
+        else:
+            hists = sumGroupedHists(self.minigroup_array, self.minigroup_index[minigroups], local_boundaries)
+            chi2 = calculateChiSquaredPerBundle(self.targets, hists, self.weight_proportionally, self.use_error_squares)
+            inputs = sumGroupedHists(self.weights, minigroups, local_boundaries)
+            if self.module_counts is not None:
+                modules = sumGroupedHists(self.module_counts, minigroups, local_boundaries)
+
+        for n in inputs:
+            if ( n > self.maxInputs ):
+                print ( "Error: more than " + str(self.maxInputs) + " lpgbts in bundle")
+
+        return hists, chi2, inputs, modules
+
+    def evaluate(self, state):
+
+        state = np.asarray(state)
+
+        if self.labels:
+            return self.evaluateLabels(state)
+
+        if self.isPending(state):
+            self.commit()
+            return self.chi2
+        elif self.pending != None:
+            self.rollback()
+
+        if self.state is None or len(state) != len(self.state):
+            return self.evaluateFull(state)
+
+        changed = np.flatnonzero(state != self.state)
+
+        if len(changed) == 0:
+            return self.chi2
+        elif len(changed) == 2 and state[changed[0]] == self.state[changed[1]] and state[changed[1]] == self.state[changed[0]]:
+            return self.proposeSwap(state, changed[0], changed[1])
+        else:
+            return self.evaluateFull(state)
+
+    def evaluateLabels(self, labels):
+        #Evaluate a state giving the bundle of each minigroup id
+        if self.isPending(labels):
+            self.commit()
+            return self.chi2
+        elif self.pending != None:
+            self.rollback()
+
+        state, boundaries = getPermutationFromLabels(labels, self.nBundles)
+
+        if self.state is None or len(state) != len(self.state):
+            return self.evaluateFull(state, boundaries)
+
+        #Minigroups whose bundle has changed, and the bundles they are moved from and to
+        changed = np.flatnonzero(labels != self.minigroup_bundle)
+
+        if len(changed) == 0:
+            return self.chi2
+
+        old_bundles = self.minigroup_bundle[changed]
+        new_bundles = labels[changed]
+        chi2 = self.proposeMoves(state, boundaries, np.union1d(old_bundles, new_bundles), (changed, old_bundles, new_bundles))
+        self.pending['labels'] = np.array(labels)
+
+        return chi2
+
+    def evaluateFull(self, state, boundaries=None):
+        #Recalculate all bundles, and set the state as the current state
+        state = np.array(state)
+        if boundaries is None:
+            boundaries = self.calculateBundleBoundaries(state)
+        hists, chi2, inputs, modules = self.evaluateBundles(state, boundaries, np.arange(self.nBundles))
+
+        self.state = state
+        self.boundaries = boundaries
+        self.bundle_hists = hists
+        self.bundle_chi2 = chi2
+        self.bundle_inputs = inputs
+        self.bundle_modules = modules
+        self.chi2 = sumChiSquaredPerBundle(chi2)
+        self.pending = None
+        self.last_state = state
+        self.last_boundaries = boundaries
+        self.last_modules = modules
+
+        #Bundle containing each minigroup id
+        self.minigroup_bundle = np.zeros(len(self.weights), dtype=int)
+        self.minigroup_bundle[state] = np.repeat(np.arange(self.nBundles), np.diff(boundaries))
+
+        if self.minigroup_towers is not None:
+            #Number of minigroups in each bundle touching each tower,
+            #and the number of towers touched by each bundle in each phi region
+            self.tower_counts = np.zeros((self.nBundles, self.nTowers), dtype=int)
+            np.add.at(self.tower_counts, (self.minigroup_bundle[self.pair_minigroup], self.pair_tower), 1)
+
+            self.bundle_towers = np.zeros((self.nBundles, self.nRegions), dtype=int)
+            for r in range(self.nRegions):
+                self.bundle_towers[:,r] = np.count_nonzero(self.tower_counts[:,self.tower_region == r], axis=1)
+
+        return self.chi2
+
+    def proposeSwap(self, state, position1, position2):
+        #Evaluate a state in which the minigroups at position1 and position2 of the current state are swapped
+
+        #The bundle boundaries only move if the minigroups have a different number of lpgbts
+        if self.weights[state[position1]] == self.weights[state[position2]]:
+            boundaries = self.boundaries
+        else:
+            boundaries = self.calculateBundleBoundaries(state)
+
+        #Bundles whose boundaries have moved, and those containing the swapped minigroups
+        moved = (boundaries[:-1] != self.boundaries[:-1]) | (boundaries[1:] != self.boundaries[1:])
+        swapped = np.searchsorted(boundaries, [position1, position2], side='right') - 1
+        bundle_list = np.union1d(np.flatnonzero(moved), swapped)
+
+        #Only the swapped minigroups, and those next to a bundle boundary that has moved, can change bundle
+        positions = [position1, position2]
+        for old,new in zip(self.boundaries[1:-1], boundaries[1:-1]):
+            if old != new:
+                positions.extend(range(min(old,new), max(old,new)))
+        positions = np.unique(positions)
+        minigroups = state[positions]
+        old_bundles = self.minigroup_bundle[minigroups]
+        new_bundles = np.searchsorted(boundaries, positions, side='right') - 1
+        change = old_bundles != new_bundles
+
+        return self.proposeMoves(state, boundaries, bundle_list, (minigroups[change], old_bundles[change], new_bundles[change]))
+
+    def proposeMoves(self, state, boundaries, bundle_list, moves):
+        #Evaluate a state in which only the bundles in bundle_list differ from the current state,
+        #with moves giving the minigroups that change bundle, and the bundles they are moved from and to
+        hists, chi2, inputs, modules = self.evaluateBundles(state, boundaries, bundle_list)
+
+        bundle_chi2 = self.bundle_chi2.copy()
+        bundle_chi2[bundle_list] = chi2
+
+        self.pending = {'state': np.array(state), 'boundaries': boundaries, 'bundle_list': bundle_list,
+                        'hists': hists, 'bundle_chi2': bundle_chi2, 'inputs': inputs, 'modules': modules, 'chi2': sumChiSquaredPerBundle(bundle_chi2)}
+        self.last_state = self.pending['state']
+        self.last_boundaries = boundaries
+
+        if modules is not None:
+            self.last_modules = self.bundle_modules.copy()
+            self.last_modules[bundle_list] = modules
+
+        #The tower counts are updated in place (and reverted in rollback) rather than copied
+        self.pending['moves'] = moves
+        self.moveMiniGroups(*moves)
+
+        return self.pending['chi2']
+
+    def moveMiniGroups(self, minigroups, from_bundles, to_bundles):
+        #Update the bundle of each minigroup, and the tower counts of the bundles involved
+        self.minigroup_bundle[minigroups] = to_bundles
+
+        if self.minigroup_towers is None:
+            return
+
+        if self.engine == 'numba':
+            kernels.moveMiniGroups(minigroups, from_bundles, to_bundles, self.tower_offsets, self.pair_tower, self.tower_region, self.tower_counts, self.bundle_towers)
+            return
+
+        for mg,old,new in zip(minigroups, from_bundles, to_bundles):
+            towers = self.minigroup_towers[mg]
+
+            self.tower_counts[old,towers] -= 1
+            removed = self.tower_region[towers[self.tower_counts[old,towers] == 0]]
+            self.bundle_towers[old] -= np.bincount(removed, minlength=self.nRegions)
+
+            self.tower_counts[new,towers] += 1
+            added = self.tower_region[towers[self.tower_counts[new,towers] == 1]]
+            self.bundle_towers[new] += np.bincount(added, minlength=self.nRegions)
+
+    def commit(self):
+        #Accept the proposed state as the current state
+        pending = self.pending
+        self.state = pending['state']
+        self.boundaries = pending['boundaries']
+        self.bundle_hists[pending['bundle_list']] = pending['hists']
+        self.bundle_inputs[pending['bundle_list']] = pending['inputs']
+        if pending['modules'] is not None:
+            self.bundle_modules[pending['bundle_list']] = pending['modules']
+        self.bundle_chi2 = pending['bundle_chi2']
+        self.chi2 = pending['chi2']
+        self.pending = None
+
+    def rollback(self):
+        #Discard the proposed state
+        if self.pending != None:
+            minigroups, from_bundles, to_bundles = self.pending['moves']
+            self.moveMiniGroups(minigroups, to_bundles, from_bundles)
+
+        self.pending = None
+        self.last_state = self.state
+        self.last_boundaries = self.boundaries
+        self.last_modules = self.bundle_modules
+
+    def isPending(self, state):
+        #Whether state is the proposed state, which will be committed if it is evaluated again
+        return self.pending != None and np.array_equal(state, self.pending['labels' if self.labels else 'state'])
+
+    def isIncremental(self, state):
+        #Whether evaluate only recalculates the bundles changed by state, i.e. state is the proposed state, or
+        #at most a swap of two minigroups from the current state (moves of up to two minigroups for labels)
+        if self.isPending(state):
+            return True
+        if self.state is None or len(state) != len(self.state):
+            return False
+        if self.labels:
+            #The bundles of the current state, before the moves of the proposed state
+            minigroup_bundle = self.minigroup_bundle
+            if self.pending != None:
+                minigroups, from_bundles, to_bundles = self.pending['moves']
+                minigroup_bundle = minigroup_bundle.copy()
+                minigroup_bundle[minigroups] = from_bundles
+            return np.count_nonzero(state != minigroup_bundle) <= 2
+        changed = np.flatnonzero(state != self.state)
+        return len(changed) == 0 or (len(changed) == 2 and state[changed[0]] == self.state[changed[1]] and state[changed[1]] == self.state[changed[0]])
+
+    def isCurrent(self, state):
+        #Whether state is the current state (when there is no proposed state)
+        if self.state is None:
+            return False
+        return np.array_equal(state, self.minigroup_bundle if self.labels else self.state)
+
+    def getBundles(self):
+        #Bundles of the most recently evaluated state, in the format returned by getBundles
+        return np.split(self.last_state, self.last_boundaries[1:-1])
+
+    def getMaxModules(self):
+        #Maximum number of modules in a bundle for the most recently evaluated state
+        return int(np.max(self.last_modules))
+
+    def getMaxTowersList(self):
+        #Equivalent of getMaxTowersList for the most recently evaluated state
+        return [ int(n) for n in np.max(self.bundle_towers, axis=0) ]
+
+    def setCurrent(self, state):
+        #Make state the current state, e.g. when a move is accepted without evaluating the state again
+        state = np.asarray(state)
+        if self.isPending(state):
+            self.commit()
+        else:
+            if self.pending != None:
+                self.rollback()
+            if not self.isCurrent(state):
+                self.evaluate(state)
+                if self.pending != None:
+                    self.commit()
+
+    def getBundleWeights(self, state, quantity='chi2'):
+        #Contribution of each bundle of state to the chi2 ('chi2'), or its number of modules ('modules')
+        #or of towers in its fullest phi region ('towers'), used to choose which bundles to change
+        self.setCurrent(state)
+
+        if quantity == 'chi2':
+            return self.bundle_chi2
+        elif quantity == 'modules':
+            return self.bundle_modules
+        elif quantity == 'towers':
+            return np.max(self.bundle_towers, axis=1)
+
+def getCanonicalPartition(state, boundaries):
+    #Key identifying how the minigroups are partitioned into bundles, which does not depend on
+    #the order of the bundles or on the order of the minigroups within each bundle
+    #The bundle of each minigroup (in order of minigroup id) is found, with the bundles
+    #numbered in order of their lowest minigroup id, and hashed
+    #The chi2 does not depend on either order (see sortWithinGroups and sumChiSquaredPerBundle),
+    #so a cached value is identical to that of evaluating the state again
+    bundle = np.repeat(np.arange(len(boundaries)-1), np.diff(boundaries))
+    bundle_by_id = bundle[np.argsort(state, kind='stable')]
+
+    labels, first = np.unique(bundle_by_id, return_index=True)
+    relabel = np.zeros(len(boundaries)-1, dtype=int)
+    relabel[bundle_by_id[np.sort(first)]] = np.arange(len(labels))
+
+    return hashlib.blake2b(relabel[bundle_by_id].astype(np.int32).tobytes(), digest_size=16).digest()
+
+class FitnessCache:
+    #Bounded least-recently-used cache of values (e.g. the chi2) for each partition
+    #of the minigroups into bundles, keyed on the output of getCanonicalPartition
+
+    def __init__(self, size):
+        self.size = size
+        self.entries = collections.OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        #Return the stored value, or None if the key is not present
+        if key in self.entries:
+            self.hits += 1
+            self.entries.move_to_end(key)
+            return self.entries[key]
+
+        self.misses += 1
+        return None
+
+    def put(self, key, value):
+        self.entries[key] = value
+        self.entries.move_to_end(key)
+        if len(self.entries) > self.size:
+            self.entries.popitem(last=False)
+
+class StoppingRule:
+    #Early termination of a minimisation, checked after every call of the chi2 function:
+    #either when the best chi2 has improved by no more than a fraction plateau_tolerance
+    #during the last plateau_calls calls, or when more than time_limit seconds have passed
+
+    def __init__(self, plateau_calls = None, plateau_tolerance = 0., time_limit = None):
+        self.plateau_calls = plateau_calls
+        self.plateau_tolerance = plateau_tolerance
+        self.time_limit = time_limit
+        self.start_time = time.time()
+        self.reset()
+
+    def reset(self):
+        #Start a new plateau window, e.g. for the next start of a multi-start minimisation
+        #The number of calls and best chi2 are stored each time the best chi2 improves
+        self.improvements = collections.deque()
+        self.reason = None
+
+    def check(self, calls, chi2_min):
+        #Return the reason for stopping ('plateau' or 'time_limit'), or None to continue
+        if self.time_limit != None and time.time() - self.start_time > self.time_limit:
+            self.reason = 'time_limit'
+
+        elif self.plateau_calls != None:
+            if len(self.improvements) == 0 or chi2_min < self.improvements[-1][1]:
+                self.improvements.append((calls, chi2_min))
+
+            #Best chi2 plateau_calls calls ago, once that many calls have been made
+            window_start = calls - self.plateau_calls
+            if self.improvements[0][0] <= window_start:
+                while len(self.improvements) > 1 and self.improvements[1][0] <= window_start:
+                    self.improvements.popleft()
+                reference = self.improvements[0][1]
+                if reference - chi2_min <= self.plateau_tolerance * abs(reference):
+                    self.reason = 'plateau'
+
+        return self.reason
+
+def getInputsCacheDirectory(cache_dir, settings):
+    #Directory of the preprocessed inputs for the given settings, i.e. a list of the
+    #input file names, their modification times and the options the inputs depend on
+    key = hashlib.blake2b(repr(settings).encode(), digest_size=8).hexdigest()
+    return os.path.join(cache_dir, "inputs_" + key)
+
+def saveInputsCache(directory, arrays):
+    #Save each array to directory/<name>.npy. The files are written to a temporary
+    #directory which is then renamed, such that other processes never see a partial cache
+    temporary = directory + ".tmp" + str(os.getpid())
+    os.makedirs(temporary)
+    for name,array in arrays.items():
+        np.save(os.path.join(temporary, name + ".npy"), array)
+    try:
+        os.rename(temporary, directory)
+    except OSError:
+        #Another process has already written the same cache
+        shutil.rmtree(temporary)
+
+def loadInputsCache(directory):
+    #Memory-map the arrays saved by saveInputsCache read-only, such that all processes on
+    #a node share a single copy of them in the page cache. Returns None if there is no cache
+    if not os.path.isdir(directory):
+        return None
+
+    arrays = {}
+    for filename in os.listdir(directory):
+        if filename.endswith(".npy"):
+            arrays[filename[:-4]] = np.asarray(np.load(os.path.join(directory, filename), mmap_mode='r'))
+
+    return arrays
+
+#Fields of each record written by ConvergenceTrace
+#max_towers and max_modules are NaN if they are not included in the chi2
+traceDtype = np.dtype([('iteration', np.int64), ('calls', np.int64), ('chi2', np.float64), ('chi2_best', np.float64),
+                       ('accepted', np.bool_), ('max_towers', np.float64), ('max_modules', np.float64), ('wall_time', np.float64)])
+
+class ConvergenceTrace:
+    #Writes a record with the fields of traceDtype for each iteration of a minimisation to a binary file
+    #The records are collected in an array, which is written when full by a background thread,
+    #such that the minimisation never waits for the file. Read the file with loadConvergenceTrace
+
+    def __init__(self, filename, batch_size = 10000, append = False):
+        self.file = open(filename, "ab" if append else "wb")
+        self.batch_size = batch_size
+        self.buffer = np.zeros(batch_size, dtype=traceDtype)
+        self.n = 0
+        self.start_time = time.perf_counter()
+
+        self.batches = queue.Queue()
+        self.writer = threading.Thread(target=self.writeBatches, daemon=True)
+        self.writer.start()
+
+    def writeBatches(self):
+        batch = self.batches.get()
+        while batch is not None:
+            self.file.write(batch.tobytes())
+            self.file.flush()
+            batch = self.batches.get()
+
+    def record(self, iteration, calls, chi2, chi2_best, accepted, max_towers, max_modules):
+        self.buffer[self.n] = (iteration, calls, chi2, chi2_best, accepted,
+                               np.nan if max_towers is None else max_towers,
+                               np.nan if max_modules is None else max_modules,
+                               time.perf_counter() - self.start_time)
+        self.n += 1
+        if self.n == self.batch_size:
+            self.flush()
+
+    def flush(self):
+        #Pass the records so far to the writer, and continue in a new buffer
+        if self.n > 0:
+            self.batches.put(self.buffer[:self.n])
+            self.buffer = np.zeros(self.batch_size, dtype=traceDtype)
+            self.n = 0
+
+    def close(self):
+        self.flush()
+        self.batches.put(None)
+        self.writer.join()
+        self.file.close()
+
+def loadConvergenceTrace(filename):
+    #Structured array of the records written by ConvergenceTrace
+    return np.fromfile(filename, dtype=traceDtype)
+
+class StopMinimisation(LookupError):
+    #Raised in a call of the chi2 function to end the minimisation, with the reason
+    #('max_calls', 'plateau', 'time_limit' or 'interrupted') as its argument
+    pass
+
+#Optimiser used by the worker processes of the parallel algorithms
+#It is set by initWorker from the initargs of the pool, in the worker process only: each worker process
+#belongs to a single pool, so several pools (e.g. of optimisers in different threads) can be used in one
+#process, while the main process never reads it
+worker_optimiser = None
+
+def initWorker(optimiser):
+    #Interrupts are handled by the main process, which saves the best state found so far
+    global worker_optimiser
+    worker_optimiser = optimiser
+    signal.signal(signal.SIGINT,signal.SIG_IGN)
+    signal.signal(signal.SIGUSR1,signal.SIG_IGN)
+    signal.signal(signal.SIGXCPU,signal.SIG_IGN)
+
+def createWorkerPool(optimiser, n_workers):
+    #The workers are forked, such that they inherit the optimiser without it being pickled
+    return multiprocessing.get_context('fork').Pool(n_workers, initializer=initWorker, initargs=(optimiser,))
+
+def evaluationWorker(args):
+    #Evaluate a part of a batch of states, returning the chi2, max_modules and max_towers of each,
+    #without counting the calls (which is done by the main process)
+    orderings, boundaries = args
+    return worker_optimiser.evaluateOrderings(orderings, boundaries)
+
+def temperingWorker(args):
+    #Run one replica of parallel tempering for n_steps at a fixed temperature, starting from
+    #a state with a known chi2, which is not evaluated again
+    #If max_calls is not None the replica stops once fewer calls remain than a step can make
+    #(two, as an accepted neighbour is evaluated again), such that it never makes more calls
+    #Returns the reason if the replica stopped early ('max_calls' or 'no_feasible_swap'), otherwise None
+    state, chi2, temperature, n_steps, seed, chi2_best, max_calls = args
+    optimiser = worker_optimiser
+    problem = optimiser.problem
+
+    #Only keep states better than the best found so far by all replicas
+    #The stopping rule is applied by the main process after each exchange
+    optimiser.reset(chi2_best)
+    optimiser.budget = None
+    optimiser.stopping_rule = None
+    if max_calls != None and max_calls < 2:
+        return state, chi2, optimiser.chi2_min, optimiser.combbest, optimiser.n_calls, problem.n_rejected, 'max_calls'
+
+    def stopAtMaxCalls(iters, accepted):
+        if max_calls != None and optimiser.n_calls > max_calls - 2:
+            raise StopMinimisation('max_calls')
+
+    optimiser.random_generator.seed(seed)
+    if problem.proposal_rng is not None:
+        problem.set_proposal_rng(seed)
+    schedule = mlrose.CustomSchedule(lambda t: temperature)
+    stop_reason = None
+    try:
+        state, chi2 = mlrose.simulated_annealing(problem, schedule = schedule, max_attempts = n_steps+1, max_iters = n_steps, init_state = state, init_fitness = problem.get_maximize()*chi2, callback = stopAtMaxCalls)
+    except StopMinimisation:
+        stop_reason = 'max_calls'
+    except mlrose.NoFeasibleSwap:
+        stop_reason = 'no_feasible_swap'
+    if stop_reason != None:
+        state, chi2 = problem.get_state(), problem.get_maximize()*problem.get_fitness()
+
+    return state, chi2, optimiser.chi2_min, optimiser.combbest, optimiser.n_calls, problem.n_rejected, stop_reason
+
+def multiStartWorker(args):
+    #Run one of the independent starts of a multi-start minimisation
+    #If init_state is None a random initial state is drawn with the seed of the start,
+    #such that the start can be reproduced by a single run with random_seed set to this seed
+    #The number of calls starts from n_calls, e.g. that of the output file given as initial_state
+    algorithm, init_state, seed, n_calls = args
+    optimiser = worker_optimiser
+    optimiser.reset()
+    optimiser.n_calls = n_calls
+    optimiser.stopping_rule = optimiser.createStoppingRule()
+
+    optimiser.random_generator.seed(seed)
+    if optimiser.problem.proposal_rng is not None:
+        optimiser.problem.set_proposal_rng(seed)
+    if init_state is None:
+        init_state = np.arange(optimiser.problem.length)
+        optimiser.random_generator.shuffle(init_state)
+        init_state = optimiser.problem.permutation_to_state(init_state)
+
+    #The budget and the stopping rule are applied to each start
+    stop_reason = 'finished'
+    try:
+        optimiser.minimise(algorithm, init_state, seed)
+    except StopMinimisation as stop:
+        stop_reason = stop.args[0] if len(stop.args) > 0 else 'interrupted'
+    except mlrose.NoFeasibleSwap:
+        stop_reason = 'no_feasible_swap'
+
+    return optimiser.chi2_min, optimiser.combbest, optimiser.n_calls, optimiser.problem.n_rejected, stop_reason, optimiser.combbest_proposals
+
+def getSeeds(random_seed, n):
+    #Independent seeds derived from random_seed, for the starts of multiStart or the chains of lockstep_annealing
+    return [ int(np.random.SeedSequence([random_seed,i]).generate_state(1)[0]) for i in range(n) ]
+
+class MappingOptimiser:
+    #Minimisation of the chi2 of the assignment of minigroups to bundles, with the settings of the
+    #study_mapping configuration. The optimiser owns the preprocessed inputs, the number of calls of
+    #the chi2 function and the best state found so far, such that several minimisations can be run
+    #in one process (e.g. a parameter sweep, or one optimiser per thread)
+
+    def __init__(self, subconfig, print_level = 0):
+        if mlrose == None:
+            raise ImportError( "externals/mlrose_mod could not be imported, which is needed for the minimisation" )
+
+        self.subconfig = subconfig
+        self.print_level = print_level
+        self.problem = None
+        self.stopping_rule = None
+        self.budget = None
+        self.start_summary = []
+        self.run_info = None
+        self.reset()
+
+        #Generator of the random numbers of the problem and the algorithms, with the same sequence
+        #as np.random for a given seed, but not shared with other optimisers in the process
+        self.random_generator = np.random.RandomState()
+
+        self.loadSettings(subconfig)
+        self.checkAlgorithm(self.algorithm)
+        self.loadInputs()
+        self.createEvaluator()
+        self.createProblem()
+
+    def loadSettings(self, subconfig):
+        #Function specific settings
+        self.MappingFile = subconfig['MappingFile']
+        self.CMSSW_ModuleHists = subconfig['CMSSW_ModuleHists']
+        self.algorithm = subconfig['algorithm']
+        self.initial_state = subconfig['initial_state']
+        self.max_iterations = subconfig['max_iterations']
+        self.max_calls = subconfig['max_calls']
+        self.minigroup_type = subconfig['minigroup_type']
+        self.TowerMappingFile = subconfig['TowerMappingFile']
+        self.TowerPhiSplit = subconfig['TowerPhiSplit']
+
+        self.fitness_cache_size = None
+        if 'fitness_cache_size' in subconfig.keys():
+            self.fitness_cache_size = subconfig['fitness_cache_size']
+        self.engine = 'numpy'
+        if 'engine' in subconfig.keys():
+            self.engine = subconfig['engine']
+        self.n_workers = None
+        if 'n_workers' in subconfig.keys():
+            self.n_workers = subconfig['n_workers']
+        if self.n_workers == None:
+            self.n_workers = os.cpu_count()
+        self.n_starts = 1
+        if 'n_starts' in subconfig.keys():
+            self.n_starts = subconfig['n_starts']
+        self.inputs_cache = None
+        if 'inputs_cache' in subconfig.keys():
+            self.inputs_cache = subconfig['inputs_cache']
+        self.checkpoint_interval = None
+        if 'checkpoint_interval' in subconfig.keys():
+            self.checkpoint_interval = subconfig['checkpoint_interval']
+        self.move_strategy = 'uniform'
+        if 'move_strategy' in subconfig.keys():
+            self.move_strategy = subconfig['move_strategy']
+        self.representation = 'permutation'
+        if 'representation' in subconfig.keys():
+            self.representation = subconfig['representation']
+        self.decay_schedule = 'ExponentialDecay'
+        if 'decay_schedule' in subconfig.keys():
+            self.decay_schedule = subconfig['decay_schedule']
+        self.trace_interval = None
+        if 'trace_interval' in subconfig.keys():
+            self.trace_interval = subconfig['trace_interval']
+        self.plateau_calls = None
+        if 'plateau_calls' in subconfig.keys():
+            self.plateau_calls = subconfig['plateau_calls']
+        self.plateau_tolerance = 0.
+        if 'plateau_tolerance' in subconfig.keys():
+            self.plateau_tolerance = subconfig['plateau_tolerance']
+        self.time_limit = None
+        if 'time_limit' in subconfig.keys():
+            self.time_limit = subconfig['time_limit']
+        self.rng = 'legacy'
+        if 'rng' in subconfig.keys():
+            self.rng = subconfig['rng']
+
+        self.random_seed = subconfig['random_seed']
+        if self.random_seed == None:
+            self.random_seed = random.randrange(2**32-1)
+
+        self.fpgaConfig = None
+        self.correctionConfig = None
+        self.chi2Config = None
+        self.phisplitConfig = None
+        temperingConfig = None
+        self.calibrationConfig = None
+        lateAcceptanceConfig = None
+        tabuConfig = None
+        geneticConfig = None
+        lockstepConfig = None
+
+        if 'fpgas' in subconfig.keys():
+            self.fpgaConfig = subconfig['fpgas']
+        if 'corrections' in subconfig.keys():
+            self.correctionConfig = subconfig['corrections']
+        if 'chi2' in subconfig.keys():
+            self.chi2Config = subconfig['chi2']
+        if 'phisplit' in subconfig.keys():
+            self.phisplitConfig = subconfig['phisplit']
+        if 'parallel_tempering' in subconfig.keys():
+            temperingConfig = subconfig['parallel_tempering']
+        if 'calibrated_decay' in subconfig.keys():
+            self.calibrationConfig = subconfig['calibrated_decay']
+        if 'late_acceptance' in subconfig.keys():
+            lateAcceptanceConfig = subconfig['late_acceptance']
+        if 'tabu_search' in subconfig.keys():
+            tabuConfig = subconfig['tabu_search']
+        if 'genetic' in subconfig.keys():
+            geneticConfig = subconfig['genetic']
+        if 'lockstep_annealing' in subconfig.keys():
+            lockstepConfig = subconfig['lockstep_annealing']
+
+        #Load parallel tempering settings
+        self.n_replicas = 8
+        self.min_temperature = 1.
+        self.max_temperature = 100000.
+        self.exchange_interval = 1000
+        if temperingConfig != None:
+            if 'n_replicas' in temperingConfig.keys():
+                self.n_replicas = temperingConfig['n_replicas']
+            if 'min_temperature' in temperingConfig.keys():
+                self.min_temperature = temperingConfig['min_temperature']
+            if 'max_temperature' in temperingConfig.keys():
+                self.max_temperature = temperingConfig['max_temperature']
+            if 'exchange_interval' in temperingConfig.keys():
+                self.exchange_interval = temperingConfig['exchange_interval']
+
+        #Load late acceptance, tabu search, genetic algorithm and lockstep annealing settings
+        self.search_options = {'history_length' : 1000, 'n_neighbors' : 20, 'tabu_tenure' : 50,
+                               'pop_size' : 100, 'mutation_prob' : 0.2, 'crossover' : 'order', 'n_elite' : 2, 'tournament_size' : 3,
+                               'n_chains' : 16}
+        if lateAcceptanceConfig != None:
+            if 'history_length' in lateAcceptanceConfig.keys():
+                self.search_options['history_length'] = lateAcceptanceConfig['history_length']
+        if tabuConfig != None:
+            if 'n_neighbors' in tabuConfig.keys():
+                self.search_options['n_neighbors'] = tabuConfig['n_neighbors']
+            if 'tabu_tenure' in tabuConfig.keys():
+                self.search_options['tabu_tenure'] = tabuConfig['tabu_tenure']
+        if geneticConfig != None:
+            for key in ['pop_size', 'mutation_prob', 'crossover', 'n_elite', 'tournament_size']:
+                if key in geneticConfig.keys():
+                    self.search_options[key] = geneticConfig[key]
+        if lockstepConfig != None:
+            if 'n_chains' in lockstepConfig.keys():
+                self.search_options['n_chains'] = lockstepConfig['n_chains']
+
+        #Load FPGA Information
+        self.enforceMaxInputs = False
+        if ( self.fpgaConfig != None ):
+            self.nBundles = self.fpgaConfig["nBundles"]
+            self.maxInputs = self.fpgaConfig["maxInputs"]
+            if 'enforceMaxInputs' in self.fpgaConfig.keys():
+                self.enforceMaxInputs = self.fpgaConfig["enforceMaxInputs"]
+        else:
+            #Set defaults
+            self.nBundles = 14
+            self.maxInputs = 120
+
+        #Configuration for how to divide TCs into phidivisionX and phidivisionY (traditionally phi > 60 and phi < 60)
+        self.split = "per_roverz_bin"
+        self.phidivisionX_fixvalue_min = 55
+        self.phidivisionY_fixvalue_max = None
+
+        if self.phisplitConfig != None:
+            self.split = self.phisplitConfig['type']
+            if 'phidivisionX_fixvalue_min' in self.phisplitConfig.keys():
+                self.phidivisionX_fixvalue_min = self.phisplitConfig['phidivisionX_fixvalue_min']
+            if 'phidivisionY_fixvalue_max' in self.phisplitConfig.keys():
+                self.phidivisionY_fixvalue_max = self.phisplitConfig['phidivisionY_fixvalue_max']
+
+        self.include_errors_in_chi2 = False
+        self.include_max_modules_in_chi2 = False
+        self.include_max_towers_in_chi2 = False
+        self.max_modules_weighting_factor = 1000
+        self.max_towers_weighting_factor = 30000
+        self.max_towers_weighting_option = 2
+        self.max_towers_step_point = 180
+        self.weight_bins_proportionally = True
+        if self.chi2Config != None:
+            if 'include_errors_in_chi2' in self.chi2Config.keys():
+                self.include_errors_in_chi2 = self.chi2Config['include_errors_in_chi2']
+            if 'include_max_modules_in_chi2' in self.chi2Config.keys():
+                self.include_max_modules_in_chi2 = self.chi2Config['include_max_modules_in_chi2']
+            if 'max_modules_weighting_factor' in self.chi2Config.keys():
+                self.max_modules_weighting_factor = self.chi2Config['max_modules_weighting_factor']
+            if 'include_max_towers_in_chi2' in self.chi2Config.keys():
+                self.include_max_towers_in_chi2 = self.chi2Config['include_max_towers_in_chi2']
+            if 'max_modules_weighting_factor' in self.chi2Config.keys():
+                self.max_towers_weighting_factor = self.chi2Config['max_towers_weighting_factor']
+            if 'max_towers_weighting_option' in self.chi2Config.keys():
+                self.max_towers_weighting_option = self.chi2Config['max_towers_weighting_option']
+            if 'max_towers_step_point' in self.chi2Config.keys():
+                self.max_towers_step_point = self.chi2Config['max_towers_step_point']
+            if 'weight_bins_proportionally' in self.chi2Config.keys():
+                self.weight_bins_proportionally = self.chi2Config['weight_bins_proportionally']
+        self.max_towers_weighting = [self.max_towers_weighting_factor,self.max_towers_weighting_option,self.max_towers_step_point]
+
+        #Typical size of the chi2, used to print its relative improvement
+        self.typical_chi2 = 600000000000
+        if self.include_errors_in_chi2:
+            self.typical_chi2 = 10000000
+
+    def loadInputs(self):
+        #Load external data
+        if not os.path.exists(self.MappingFile):
+            raise EnvironmentError( "Mapping file " + self.MappingFile + " does not exist" )
+        data = loadDataFile(self.MappingFile) #dataframe
+        self.cmsswNtuple = ""
+        self.inclusive_hists = None
+
+        #The arrays derived from the ROOT histograms can be taken from a cache written by a previous
+        #run with the same inputs, which is memory-mapped and so shared between processes on a node
+        cached_inputs = None
+        if self.inputs_cache != None:
+            input_settings = [ [ f, os.path.getmtime(f) if os.path.exists(f) else None ] for f in [self.MappingFile,self.CMSSW_ModuleHists] ]
+            input_settings += [ self.split, self.phidivisionX_fixvalue_min, self.phidivisionY_fixvalue_max, self.correctionConfig, self.minigroup_type, self.nBundles ]
+            cache_directory = getInputsCacheDirectory(self.inputs_cache, input_settings)
+            cached_inputs = loadInputsCache(cache_directory)
+
+        if cached_inputs == None or self.algorithm == "save_root":
+            try:
+                self.inclusive_hists,module_hists = getModuleHists(self.CMSSW_ModuleHists, split = self.split, phidivisionX_fixvalue_min = self.phidivisionX_fixvalue_min, phidivisionY_fixvalue_max = self.phidivisionY_fixvalue_max)
+                self.cmsswNtuple = getCMSSWNtupleName(self.CMSSW_ModuleHists)
+
+            except EnvironmentError:
+                raise EnvironmentError( "File " + self.CMSSW_ModuleHists + " does not exist" )
+            # Apply various corrections to r/z distributions from CMSSW
+
+            if self.correctionConfig != None:
+                print ( "Applying geometry corrections" )
+                applyGeometryCorrections( self.inclusive_hists, module_hists, self.correctionConfig )
+
+        #Load tower data if required
+        if self.include_max_towers_in_chi2:
+            try:
+                towerdata = loadModuleTowerMappingFile(self.TowerMappingFile)
+            except EnvironmentError:
+                raise EnvironmentError( "File " + self.TowerMappingFile + " does not exist" )
+
+        minigroups,self.minigroups_swap = getMinilpGBTGroups(data, self.minigroup_type)
+
+        if cached_inputs != None:
+            self.minigroup_hists_errors = cached_inputs['minigroup_hists']
+            self.minigroup_index = cached_inputs['minigroup_index']
+            self.chi2_targets = { 'content' : cached_inputs['targets_content'], 'error' : cached_inputs['targets_error'] }
+            self.cmsswNtuple = str(cached_inputs['cmsswNtuple'])
+        else:
+            #Form hists corresponding to each lpGBT from module hists
+            lpgbt_hists = getlpGBTHists(data, module_hists)
+            self.minigroup_hists_errors,self.minigroup_index = getMiniGroupHistsArray(lpgbt_hists,self.minigroups_swap)
+
+            #Convert the inclusive r/z histograms into the arrays used in the chi2 function
+            self.chi2_targets = getChiSquaredTargets(self.inclusive_hists,self.nBundles)
+
+            if self.inputs_cache != None:
+                saveInputsCache(cache_directory, { 'minigroup_hists' : self.minigroup_hists_errors, 'minigroup_index' : self.minigroup_index,
+                                                   'targets_content' : self.chi2_targets['content'], 'targets_error' : self.chi2_targets['error'],
+                                                   'cmsswNtuple' : np.array(self.cmsswNtuple) })
+
+        self.minigroup_hists = self.minigroup_hists_errors
+        if not self.include_errors_in_chi2:
+            self.minigroup_hists = self.minigroup_hists_errors[...,0]
+        #Get list of which modules are in each minigroup
+        self.minigroups_modules = getMiniModuleGroups(data,self.minigroups_swap)
+
+        #Get list of which towers are in each minigroup
+        self.minigroups_towers = None
+        if self.include_max_towers_in_chi2:
+            self.minigroups_towers = getMiniTowerGroups(towerdata, self.minigroups_modules)
+
+    def createEvaluator(self):
+        #Keeps the bundle histograms (and module and tower counts) of the current state, such
+        #that swaps of two minigroups only require the affected bundles to be recalculated
+        self.chi2_evaluator = IncrementalChiSquared(self.minigroups_swap,self.minigroup_hists,self.minigroup_index,self.chi2_targets,self.nBundles,self.maxInputs,self.weight_bins_proportionally,
+                                                    minigroups_modules = self.minigroups_modules if self.include_max_modules_in_chi2 else None,
+                                                    minigroups_towers = self.minigroups_towers if self.include_max_towers_in_chi2 else None,
+                                                    phisplit = self.TowerPhiSplit, engine = self.engine, labels = ( self.representation == 'labels' ))
+
+        #Arrays used to evaluate many states at once (evaluateBatch)
+        self.minigroup_weights = getMiniGroupSizes(self.minigroups_swap)
+        self.minigroup_module_counts = getMiniGroupSizes(self.minigroups_modules)
+        self.minigroup_tower_bitsets = None
+        if self.include_max_towers_in_chi2:
+            self.minigroup_tower_bitsets = getMiniGroupTowerBitsets(self.minigroups_towers, self.TowerPhiSplit)
+
+        #Optional cache of the chi2 of previously seen partitions of minigroups into bundles
+        self.fitness_cache = None
+        if self.fitness_cache_size != None and self.fitness_cache_size > 0:
+            self.fitness_cache = FitnessCache(self.fitness_cache_size)
+
+        #Pool of worker processes evaluating the population of the genetic algorithm
+        self.evaluation_pool = None
+
+        #Trace of the minimisation, with the max_towers and max_modules of the last two calls
+        #and of the current state
+        self.convergence_trace = None
+        self.last_calls = []
+        self.current_call = []
+
+    def createProblem(self):
+        init_state = []
+        previousConfig = None
+        if (self.initial_state[-4:] == ".npy"):
+            print (self.initial_state)
+            if not os.path.exists(self.initial_state):
+                raise EnvironmentError( "Initial state " + self.initial_state + " does not exist" )
+            previousConfig = loadConfiguration(self.initial_state)
+            init_state = previousConfig['mapping']
+            #Get the previous random seed, and number of calls
+            #to restart where previous run finished
+            #This does assume the rest of the config is the same
+            self.n_calls += previousConfig['nCallsToMappingMax']
+            self.random_generator.seed(previousConfig['random_seed'])
+
+            if ( len(init_state) != len(self.minigroups_swap) ):
+                raise ValueError( "Initial state should be the same length as the number of mini groups" )
+        elif (self.initial_state == "random"):
+            self.random_generator.seed(self.random_seed)
+            init_state = np.arange(len(self.minigroups_swap))
+            self.random_generator.shuffle(init_state)
+        elif (self.initial_state == "greedy"):
+            #Bundles filled in order of decreasing minigroup content, as an ordering of the minigroups
+            self.random_generator.seed(self.random_seed)
+            greedy_labels = getGreedyLabels(self.minigroup_hists, self.minigroup_index, self.minigroup_weights, self.chi2_targets, self.nBundles, self.maxInputs)
+            init_state = getPermutationFromLabels(greedy_labels, self.nBundles)[0]
+
+        #The bundles of each swap are either chosen uniformly, or preferentially
+        #those with the largest chi2, number of modules or number of towers
+        move_strategy = self.move_strategy
+        bundle_weights_fn = None
+        if move_strategy == 'chi2' or (move_strategy == 'modules' and self.include_max_modules_in_chi2) or (move_strategy == 'towers' and self.include_max_towers_in_chi2):
+            bundle_weights_fn = lambda state: self.chi2_evaluator.getBundleWeights(state, move_strategy)
+        elif move_strategy != 'uniform':
+            raise ValueError( "Move strategy " + move_strategy + " is not available (modules and towers must be included in the chi2)" )
+
+        fitness_cust = mlrose.CustomFitness(self.evaluate, fitness_fn_batch = self.evaluateBatch, commit_fn = self.commitState)
+        # Define optimization problem object
+        if self.representation == 'labels':
+            #The state gives the bundle of each minigroup, starting from the same bundles as the ordering
+            #of the minigroups would give, and the number of lpgbts in each bundle is limited to maxInputs
+            self.problem = mlrose.BundleOpt(length = len(init_state), fitness_fn = fitness_cust, maximize = False, minigroups = self.minigroups_swap, nBundles = self.nBundles, max_inputs = self.maxInputs, bundle_weights_fn = bundle_weights_fn, random_state = self.random_generator)
+            if (self.initial_state[-4:] == ".npy"):
+                init_state = getLabelsFromBundles(previousConfig['bundles'])
+            elif (self.initial_state == "greedy"):
+                init_state = greedy_labels
+            else:
+                init_state = self.problem.permutation_to_state(init_state)
+        elif self.representation == 'permutation':
+            self.problem = mlrose.DiscreteOpt(length = len(init_state), fitness_fn = fitness_cust, maximize = False, max_val = len(self.minigroups_swap), minigroups = self.minigroups_swap, nBundles = self.nBundles, bundle_boundaries_fn = self.chi2_evaluator.getBundleBoundaries, max_inputs = self.maxInputs if self.enforceMaxInputs else None, bundle_weights_fn = bundle_weights_fn, random_state = self.random_generator)
+        else:
+            raise ValueError( "Unknown state representation " + self.representation )
+        self.init_state = init_state
+
+        #With the counter-based generator the random numbers of each proposed swap are a pure function of
+        #the seed and the number of earlier proposals. A minimisation started from the output file of one
+        #with the same generator then continues with the proposal after that which found its best state
+        if self.rng == 'philox':
+            proposal_counter = 0
+            if previousConfig != None and previousConfig['run_info'] != None and previousConfig['run_info'].get('proposals') != None:
+                self.random_seed = previousConfig['random_seed']
+                proposal_counter = previousConfig['run_info']['proposals']
+            self.problem.set_proposal_rng(self.random_seed, proposal_counter)
+        elif self.rng != 'legacy':
+            raise ValueError( "Unknown random number generator " + self.rng )
+
+        # Define decay schedule
+        if self.decay_schedule == "ExponentialDecay":
+            self.schedule = mlrose.ExpDecay()
+        elif self.decay_schedule == "ArithmeticDecay":
+            self.schedule = mlrose.ArithDecay()
+        elif self.decay_schedule == "CalibratedDecay":
+            #The temperatures are set from the chi2 changes of random swaps when the minimisation starts,
+            #and decay over max_iterations steps
+            calibrationConfig = self.calibrationConfig
+            if calibrationConfig == None:
+                calibrationConfig = {}
+            self.schedule = mlrose.CalibratedDecay(n_steps = self.max_iterations, **calibrationConfig)
+        else:
+            raise ValueError( "Unknown decay schedule " + str(self.decay_schedule) )
+
+    def reset(self, chi2_min = 50000000000000000000000):
+        #Forget the best state and the number of calls, e.g. before each start of a multi-start minimisation
+        self.chi2_min = chi2_min
+        self.combbest = []
+        self.n_calls = 0
+        #Number of proposals drawn when combbest was found, with the counter-based generator (rng: philox)
+        self.combbest_proposals = None
+        self.stop_requested = False
+        if self.stopping_rule != None:
+            self.stopping_rule.reset()
+        if self.problem != None:
+            self.problem.n_rejected = 0
+
+    def stop(self):
+        #Ask a running minimisation (e.g. in another thread) to stop after the current call of the chi2 function
+        self.stop_requested = True
+
+    def evaluate(self, state):
+        #The chi2 of a state, counted as a call of the chi2 function
+        max_modules = None
+        max_towers = None
+        chi2 = 0
+
+        #The cache is only used for states that the evaluator would recalculate in full, such that
+        #the evaluator follows the minimisation and neighbours are evaluated incrementally
+        #The evaluator commits the proposed state when it is evaluated again, as set_state does when it is accepted,
+        #so a proposal that is repeated (e.g. after being rejected) is instead discarded and proposed again
+        state = np.asarray(state)
+        if self.problem != None and self.chi2_evaluator.isPending(state) and not np.array_equal(state, self.problem.get_state()):
+            self.chi2_evaluator.rollback()
+        use_cache = self.fitness_cache != None and not self.chi2_evaluator.isIncremental(state)
+        if use_cache:
+            key = getCanonicalPartition(*self.chi2_evaluator.getPartition(state))
+            cached = self.fitness_cache.get(key)
+            if cached != None:
+                return self.recordCall(state, *cached)
+
+        chi2 = self.chi2_evaluator.evaluate(state)
+
+        if self.include_max_modules_in_chi2:
+            max_modules = self.chi2_evaluator.getMaxModules()
+        if self.include_max_towers_in_chi2:
+            max_towers_list = self.chi2_evaluator.getMaxTowersList()
+            max_towers = max(max_towers_list)
+
+        chi2 += getChiSquaredPenalty(max_modules,self.max_modules_weighting_factor,max_towers,self.max_towers_weighting)
+
+        if use_cache:
+            self.fitness_cache.put(key, (chi2, max_modules, max_towers))
+
+        return self.recordCall(state, chi2, max_modules, max_towers)
+
+    def evaluateBatch(self, states):
+        #Equivalent to calling evaluate for each row of states, with a single vectorised calculation
+
+        states = np.asarray(states)
+        #Orderings of the minigroups and the bundle boundaries used in the calculation
+        if self.representation == 'labels':
+            partitions = [ getPermutationFromLabels(labels, self.nBundles) for labels in states ]
+            orderings = np.array([ partition[0] for partition in partitions ])
+            boundaries = np.array([ partition[1] for partition in partitions ])
+        else:
+            orderings = states
+            boundaries = getBundleBoundariesBatch(self.minigroup_weights[states], self.nBundles)
+
+        results = [None]*len(states)
+        #States that are not cached, and are not the same partition as an earlier state of the batch, are evaluated
+        #once, and the states repeating them (their index in repeats) take their result
+        repeats = {}
+        if self.fitness_cache != None:
+            keys = [ getCanonicalPartition(ordering, b) for ordering,b in zip(orderings,boundaries) ]
+            results = [ self.fitness_cache.get(key) for key in keys ]
+            first = {}
+            for i,key in enumerate(keys):
+                if results[i] == None:
+                    if key in first:
+                        repeats[i] = first[key]
+                    else:
+                        first[key] = i
+
+        evaluate = np.array([ i for i,result in enumerate(results) if result == None and i not in repeats ], dtype=int)
+
+        if len(evaluate) > 0:
+            if self.evaluation_pool != None:
+                #Split the states between the worker processes, keeping their order
+                chunks = [ chunk for chunk in np.array_split(evaluate, self.n_workers) if len(chunk) > 0 ]
+                evaluated = sum(self.evaluation_pool.map(evaluationWorker, [ (orderings[chunk],boundaries[chunk]) for chunk in chunks ]), [])
+            else:
+                evaluated = self.evaluateOrderings(orderings[evaluate], boundaries[evaluate])
+
+            for i,result in zip(evaluate,evaluated):
+                results[i] = result
+                if self.fitness_cache != None:
+                    self.fitness_cache.put(keys[i], results[i])
+            for i,j in repeats.items():
+                results[i] = results[j]
+
+        return np.array([ self.recordCall(state, *result) for state,result in zip(states,results) ])
+
+    def evaluateOrderings(self, orderings, boundaries):
+        #The chi2, max_modules and max_towers of each ordering of the minigroups, split into bundles at boundaries
+        max_modules = None
+        max_towers = None
+
+        #As in IncrementalChiSquared, the minigroups of each bundle are added in order of id
+        orderings = sortWithinGroupsBatch(orderings, boundaries)
+        bundled_hists = getBundledlpgbtHistsBatch(self.minigroup_hists, self.minigroup_index, orderings, boundaries)
+
+        if self.include_max_modules_in_chi2:
+            max_modules = sumGroupedHistsBatch(self.minigroup_module_counts, orderings, boundaries).max(axis=1)
+        if self.include_max_towers_in_chi2:
+            max_towers = getMaxTowersListBatch(self.minigroup_tower_bitsets, orderings, boundaries).max(axis=1)
+
+        chi2 = calculateChiSquaredBatch(self.chi2_targets,bundled_hists,max_modules,self.max_modules_weighting_factor,max_towers,self.max_towers_weighting,self.weight_bins_proportionally,self.include_errors_in_chi2)
+
+        return [ (chi2[j],
+                  None if max_modules is None else max_modules[j],
+                  None if max_towers is None else max_towers[j]) for j in range(len(orderings)) ]
+
+    def recordCall(self, state, chi2, max_modules, max_towers):
+        #Keep track of the best state and the number of calls to the chi2 function, and
+        #end the minimisation once the budget is used up, the stopping rule applies or a stop is requested
+        if (chi2<self.chi2_min):
+            self.chi2_min = chi2
+            self.combbest = np.copy(state)
+            if self.problem.proposal_rng is not None:
+                self.combbest_proposals = self.problem.proposal_rng.counter
+            if ( self.print_level > 0 ):
+                print (self.algorithm," ", self.chi2_min, " ", self.chi2_min/self.typical_chi2)
+                if self.include_max_towers_in_chi2:
+                    print ("max_towers = ", max_towers)
+                if self.include_max_modules_in_chi2:
+                    print ("max_modules = ", max_modules)
+            if ( self.print_level > 1 ):
+                print (repr(self.combbest))
+
+        if self.convergence_trace != None:
+            self.last_calls.append((max_towers, max_modules))
+            del self.last_calls[:-2]
+
+        self.n_calls += 1
+        if self.budget != None:
+            if self.budget == self.n_calls:
+                raise StopMinimisation('max_calls')
+        if self.stopping_rule != None:
+            if self.stopping_rule.check(self.n_calls, self.chi2_min) != None:
+                raise StopMinimisation(self.stopping_rule.reason)
+        if self.stop_requested:
+            raise StopMinimisation('interrupted')
+
+        return chi2
+
+    def commitState(self, state):
+        #An accepted neighbour whose chi2 is passed to set_state (as in tabu_search) is not evaluated again,
+        #so it is made the current state of the evaluator without counting a call
+        self.chi2_evaluator.setCurrent(state)
+
+        if self.convergence_trace != None:
+            max_modules = self.chi2_evaluator.getMaxModules() if self.include_max_modules_in_chi2 else None
+            max_towers = max(self.chi2_evaluator.getMaxTowersList()) if self.include_max_towers_in_chi2 else None
+            self.last_calls.append((max_towers, max_modules))
+            del self.last_calls[:-2]
+
+    def traceIteration(self, iteration, accepted):
+        #set_state evaluates an accepted neighbour again (or commitState records it), so the last call is the current state,
+        #and until a neighbour is accepted the current state is the one evaluated before the first neighbour
+        if accepted:
+            self.current_call[:] = self.last_calls[-1]
+        elif len(self.current_call) == 0 and len(self.last_calls) == 2:
+            self.current_call[:] = self.last_calls[0]
+
+        if iteration % self.trace_interval == 0:
+            max_towers, max_modules = self.current_call if len(self.current_call) > 0 else (None, None)
+            chi2 = self.problem.get_maximize()*self.problem.get_fitness()
+            self.convergence_trace.record(iteration, self.n_calls, chi2, self.chi2_min, accepted, max_towers, max_modules)
+
+    def getStateBundles(self, state):
+        #Bundles of a state, in the format returned by getBundles
+        if self.representation == 'labels':
+            return getBundlesFromLabels(state, self.nBundles)
+        return getBundles(self.minigroups_swap,state,self.nBundles,self.maxInputs)
+
+    def getBundleLimits(self, bundles):
+        #Maximum number of modules in a bundle, and of towers in each bundle, if used in the chi2
+        if self.include_max_modules_in_chi2:
+            max_modules = getMaximumNumberOfModulesInABundle(self.minigroups_modules,bundles)
+        else:
+            max_modules = 'Not used in chi2'
+        if self.include_max_towers_in_chi2:
+            max_towers_list = getMaxTowersListBitset(self.minigroup_tower_bitsets, bundles)
+        else:
+            max_towers_list = 'Not used in chi2'
+        return max_modules, max_towers_list
+
+    def minimise(self, algorithm, init_state, random_seed, checkpoint = None, checkpoint_interval = 0, resume = None, callback = None):
+        #A single minimisation with one of the mlrose algorithms (all except parallel_tempering)
+        #search_options holds the settings of late_acceptance (history_length), tabu_search (n_neighbors, tabu_tenure)
+        #genetic (pop_size, mutation_prob, crossover, n_elite, tournament_size) and lockstep_annealing (n_chains)
+        problem = self.problem
+        schedule = self.schedule
+        search_options = self.search_options
+        max_iterations = self.max_iterations
+        if (algorithm == "random_hill_climb"):
+            return mlrose.random_hill_climb(problem, max_attempts=10000, max_iters=max_iterations, restarts=0, init_state=init_state, random_state=random_seed, checkpoint=checkpoint, checkpoint_interval=checkpoint_interval, resume=resume, callback=callback)
+        elif (algorithm == "simulated_annealing"):
+            #Calibrated schedules sample neighbours of the starting state to set the temperatures
+            #A resumed run takes the calibrated schedule from the checkpoint instead
+            if hasattr(schedule, 'calibrate') and resume == None:
+                init_temp, final_temp = schedule.calibrate(problem, init_state)
+                print ( "Calibrated temperatures = " + str(init_temp) + " to " + str(final_temp) )
+            return mlrose.simulated_annealing(problem, schedule = schedule, max_attempts = 100000, max_iters = 10000000, init_state = init_state, random_state=random_seed, checkpoint=checkpoint, checkpoint_interval=checkpoint_interval, resume=resume, callback=callback)
+        elif (algorithm == "late_acceptance"):
+            return mlrose.late_acceptance_hill_climb(problem, history_length=search_options['history_length'], max_attempts=10000, max_iters=max_iterations, init_state=init_state, random_state=random_seed, checkpoint=checkpoint, checkpoint_interval=checkpoint_interval, resume=resume, callback=callback)
+        elif (algorithm == "tabu_search"):
+            #Each iteration evaluates n_neighbors states, so fewer iterations without improvement are allowed
+            return mlrose.tabu_search(problem, n_neighbors=search_options['n_neighbors'], tabu_tenure=search_options['tabu_tenure'], max_attempts=1000, max_iters=max_iterations, init_state=init_state, random_state=random_seed, checkpoint=checkpoint, checkpoint_interval=checkpoint_interval, resume=resume, callback=callback)
+        elif (algorithm == "lockstep_annealing"):
+            #All chains start from init_state, each with its own seed derived from random_seed
+            if hasattr(schedule, 'calibrate') and resume == None:
+                init_temp, final_temp = schedule.calibrate(problem, init_state)
+                print ( "Calibrated temperatures = " + str(init_temp) + " to " + str(final_temp) )
+            n_chains = search_options['n_chains']
+            return mlrose.lockstep_simulated_annealing(problem, n_chains = n_chains, schedule = schedule, max_attempts = 100000, max_iters = max_iterations, init_states = np.tile(init_state, (n_chains,1)), random_states = getSeeds(random_seed, n_chains), checkpoint=checkpoint, checkpoint_interval=checkpoint_interval, resume=resume)
+        elif (algorithm == "genetic"):
+            #Each iteration is a generation, stopping after 100 generations without improvement
+            return mlrose.permutation_genetic_alg(problem, pop_size=search_options['pop_size'], mutation_prob=search_options['mutation_prob'], crossover=search_options['crossover'], n_elite=search_options['n_elite'], tournament_size=search_options['tournament_size'], max_attempts=100, max_iters=max_iterations, init_state=init_state, random_state=random_seed, checkpoint=checkpoint, checkpoint_interval=checkpoint_interval, resume=resume)
+
+    def writeCheckpoint(self, checkpoint_file, algorithm_state):
+        #Save everything needed to continue the minimisation exactly where it stopped
+        #The file is written under a temporary name and then renamed, such that
+        #an interrupt while writing never leaves a partial checkpoint
+        checkpoint = {'algorithm_state' : algorithm_state, 'subconfig' : self.subconfig, 'random_seed' : self.random_seed,
+                      'chi2_min' : self.chi2_min, 'combbest' : self.combbest, 'nCallsToMappingMax' : self.n_calls, 'n_rejected' : self.problem.n_rejected,
+                      'proposal_counter' : self.problem.proposal_rng.counter if self.problem.proposal_rng is not None else None,
+                      'combbest_proposals' : self.combbest_proposals}
+        with open(checkpoint_file + ".tmp", "wb") as filep:
+            pickle.dump(checkpoint, filep)
+        os.replace(checkpoint_file + ".tmp", checkpoint_file)
+
+    def loadCheckpoint(self, checkpoint_file):
+        #Restore the best state, number of calls and random numbers saved by writeCheckpoint,
+        #and return the state of the algorithm
+        with open(checkpoint_file, "rb") as filep:
+            checkpoint = pickle.load(filep)
+
+        if checkpoint['subconfig'] != self.subconfig:
+            raise ValueError( "Checkpoint " + checkpoint_file + " was written with a different study_mapping configuration" )
+
+        self.chi2_min = checkpoint['chi2_min']
+        self.combbest = checkpoint['combbest']
+        self.n_calls = checkpoint['nCallsToMappingMax']
+        self.combbest_proposals = checkpoint['combbest_proposals']
+        self.random_seed = checkpoint['random_seed']
+        self.problem.n_rejected = checkpoint['n_rejected']
+        if self.problem.proposal_rng is not None:
+            self.problem.set_proposal_rng(self.random_seed, checkpoint['proposal_counter'])
+
+        return checkpoint['algorithm_state']
+
+    def multiStart(self, algorithm):
+        #Run n_starts independent minimisations in a pool of worker processes, each with a seed derived from random_seed
+        #Each start draws its own random initial state, unless the initial state is greedy or given in a file
+        #The seed, chi2, number of calls and stop reason of each finished start are appended to start_summary
+        seeds = getSeeds(self.random_seed, self.n_starts)
+        init_state = self.init_state if self.initial_state != "random" else None
+        tasks = [ (algorithm,init_state,seed,self.n_calls) for seed in seeds ]
+        stop_reason = 'interrupted'
+
+        try:
+            with createWorkerPool(self, min(self.n_workers,self.n_starts)) as pool:
+                for i,(start_chi2_min,start_combbest,start_nCalls,start_rejected,start_stop_reason,start_combbest_proposals) in enumerate(pool.imap(multiStartWorker, tasks)):
+                    self.start_summary.append([i,seeds[i],start_chi2_min,start_nCalls,start_stop_reason])
+                    self.problem.n_rejected += start_rejected
+                    if start_chi2_min < self.chi2_min:
+                        self.chi2_min = start_chi2_min
+                        self.combbest = start_combbest
+                        self.combbest_proposals = start_combbest_proposals
+        finally:
+            #Keep the seed and number of calls of the best start, with which it can be reproduced
+            if len(self.start_summary) > 0:
+                best_start = min(self.start_summary, key = lambda start: start[2])
+                self.random_seed = best_start[1]
+                self.n_calls = best_start[3]
+                stop_reason = best_start[4]
+
+        return stop_reason
+
+    def parallelTempering(self):
+        #Run one replica per temperature in a pool of worker processes, and attempt to exchange
+        #the states of neighbouring temperatures every exchange_interval steps
+        #Temperatures are spaced geometrically, with the calls of all replicas counted towards the budget
+        temperatures = np.geomspace(self.min_temperature, self.max_temperature, self.n_replicas)
+        n_replicas = len(temperatures)
+        states = [ np.copy(self.init_state) for t in temperatures ]
+        #The chi2 of each replica's state, passed to the next round such that the state is not evaluated again
+        energies = np.full(n_replicas, self.evaluate(self.init_state))
+        attempted = np.zeros(n_replicas-1)
+        accepted = np.zeros(n_replicas-1)
+        stop_reason = 'finished'
+
+        #The seed of each replica in each round is derived from random_seed, such that
+        #the result does not depend on the number of workers
+        exchange_rng = np.random.RandomState(self.random_seed)
+        n_rounds = int(np.ceil(self.max_iterations/self.exchange_interval))
+
+        with createWorkerPool(self, min(self.n_workers,n_replicas)) as pool:
+            for r in range(n_rounds):
+                n_steps = min(self.exchange_interval, self.max_iterations - r*self.exchange_interval)
+                seeds = [ np.random.SeedSequence([self.random_seed,r,i]).generate_state(1)[0] for i in range(n_replicas) ]
+
+                #If the budget could be reached in this round (each step makes at most two calls)
+                #the remaining calls are shared between the replicas
+                max_calls = [ None ] * n_replicas
+                if self.budget != None and self.budget - self.n_calls < 2 * n_steps * n_replicas:
+                    remaining = self.budget - self.n_calls
+                    max_calls = [ remaining // n_replicas + (i < remaining % n_replicas) for i in range(n_replicas) ]
+
+                results = pool.map(temperingWorker, [ (states[i],energies[i],temperatures[i],n_steps,seeds[i],self.chi2_min,max_calls[i]) for i in range(n_replicas) ])
+
+                replica_stop_reasons = []
+                for i,(state,chi2,replica_chi2_min,replica_combbest,replica_nCalls,replica_rejected,replica_stop_reason) in enumerate(results):
+                    states[i] = state
+                    energies[i] = chi2
+                    self.n_calls += replica_nCalls
+                    self.problem.n_rejected += replica_rejected
+                    replica_stop_reasons.append(replica_stop_reason)
+                    if len(replica_combbest) > 0 and replica_chi2_min < self.chi2_min:
+                        self.chi2_min = replica_chi2_min
+                        self.combbest = replica_combbest
+
+                if 'no_feasible_swap' in replica_stop_reasons:
+                    stop_reason = 'no_feasible_swap'
+                    break
+                if 'max_calls' in replica_stop_reasons or (self.budget != None and self.n_calls >= self.budget):
+                    stop_reason = 'max_calls'
+                    break
+                if self.stopping_rule != None and self.stopping_rule.check(self.n_calls, self.chi2_min) != None:
+                    stop_reason = self.stopping_rule.reason
+                    break
+                if self.stop_requested:
+                    stop_reason = 'interrupted'
+                    break
+
+                #Alternate between the even and odd pairs of neighbouring temperatures
+                for i in range(r%2, n_replicas-1, 2):
+                    attempted[i] += 1
+                    delta = (energies[i] - energies[i+1]) * (1./temperatures[i] - 1./temperatures[i+1])
+                    if delta >= 0 or exchange_rng.uniform() < np.exp(delta):
+                        states[i], states[i+1] = states[i+1], states[i]
+                        energies[i], energies[i+1] = energies[i+1], energies[i]
+                        accepted[i] += 1
+
+        if ( self.print_level > 0 ):
+            print ("Exchange acceptance rates = ", accepted/np.maximum(attempted,1))
+
+        return stop_reason
+
+    def createStoppingRule(self):
+        #Stop early on a plateau of the best chi2, or once the time limit (in seconds) is reached
+        #A new rule is created for each run, and each start of a multi-start minimisation
+        if self.plateau_calls != None or self.time_limit != None:
+            return StoppingRule(self.plateau_calls, self.plateau_tolerance, self.time_limit)
+        return None
+
+    def checkAlgorithm(self, algorithm):
+        #Raise a ValueError if the settings cannot be used with the algorithm
+        if self.rng == 'philox' and (algorithm == "genetic" or algorithm == "lockstep_annealing"):
+            raise ValueError( "The philox generator is not available for the " + algorithm + " algorithm" )
+        #The genetic algorithm changes the states by crossover and mutation rather than by swaps, and the
+        #chains of lockstep annealing are evaluated together, without the per-bundle chi2 of each chain
+        if self.move_strategy != 'uniform' and (algorithm == "genetic" or algorithm == "lockstep_annealing"):
+            raise ValueError( "Move strategy " + self.move_strategy + " is not available for the " + algorithm + " algorithm" )
+
+    def run(self, algorithm = None, budget = None, checkpoint_file = None, trace_file = None):
+        #Minimise with the given algorithm (by default that of the configuration) until it finishes,
+        #or the number of calls of the chi2 function reaches budget (by default max_calls)
+        #With n_starts > 1 the starts are run in parallel, and their results kept in start_summary
+        #If checkpoint_interval is set the minimisation is saved to checkpoint_file, and continued from it if it
+        #exists, and if trace_interval is set the convergence trace is written to trace_file
+        #Returns why the minimisation stopped: 'finished' (max_iterations, or no improvement in the
+        #algorithm's max_attempts), 'max_calls', 'plateau', 'time_limit', 'no_feasible_swap' or 'interrupted'
+        if algorithm == None:
+            algorithm = self.algorithm
+        if budget == None:
+            budget = self.max_calls
+        self.algorithm = algorithm
+        self.budget = budget
+        self.stop_requested = False
+        self.checkAlgorithm(algorithm)
+
+        #Seed, chi2, number of calls and stop reason of each start when n_starts > 1
+        self.start_summary = []
+
+        self.stopping_rule = self.createStoppingRule()
+        start_time = time.time()
+        stop_reason = 'interrupted'
+        self.run_info = { 'stop_reason' : stop_reason, 'wall_time' : 0. }
+
+        try:
+            if (algorithm == "parallel_tempering"):
+                stop_reason = self.parallelTempering()
+            elif (self.n_starts > 1):
+                stop_reason = self.multiStart(algorithm)
+            else:
+                #Periodically save the state of the minimisation, and continue from
+                #the saved state if a previous run of the same job was interrupted
+                checkpoint = None
+                resume = None
+                if self.checkpoint_interval != None and checkpoint_file != None:
+                    if os.path.exists(checkpoint_file):
+                        print ( "Resuming from " + checkpoint_file )
+                        resume = self.loadCheckpoint(checkpoint_file)
+                    checkpoint = lambda algorithm_state: self.writeCheckpoint(checkpoint_file, algorithm_state)
+
+                #Record every trace_interval iterations, continuing the trace of an interrupted run
+                #The genetic algorithm and lockstep annealing have no single current state, so are not traced
+                callback = None
+                if self.trace_interval != None and trace_file != None and algorithm != "genetic" and algorithm != "lockstep_annealing":
+                    self.convergence_trace = ConvergenceTrace(trace_file, append = resume != None)
+                    callback = self.traceIteration
+
+                #Each generation of the genetic algorithm, or step of the lockstep chains, is evaluated by n_workers processes
+                if (algorithm == "genetic" or algorithm == "lockstep_annealing") and self.n_workers > 1:
+                    self.evaluation_pool = createWorkerPool(self, self.n_workers)
+
+                self.minimise(algorithm, self.init_state, self.random_seed, checkpoint, self.checkpoint_interval, resume, callback)
+                stop_reason = 'finished'
+
+                #The minimisation has finished, so there is nothing left to resume
+                if checkpoint != None and os.path.exists(checkpoint_file):
+                    os.remove(checkpoint_file)
+
+        except StopMinimisation as stop:
+            stop_reason = stop.args[0] if len(stop.args) > 0 else 'interrupted'
+            if stop_reason == 'interrupted':
+                print("interrupt received, stopping and saving")
+            else:
+                print("stopping (" + stop_reason + ") and saving")
+
+        except mlrose.NoFeasibleSwap:
+            stop_reason = 'no_feasible_swap'
+            print("no swap within maxInputs found after " + str(self.problem.max_rejections) + " attempts, stopping and saving")
+
+        finally:
+            #A minimisation stopped on a plateau, or without any allowed swap, has finished, so there is nothing left to resume
+            if (stop_reason == 'plateau' or stop_reason == 'no_feasible_swap') and checkpoint_file != None and os.path.exists(checkpoint_file):
+                os.remove(checkpoint_file)
+            #Calls of evaluate outside run are not limited
+            self.budget = None
+            self.stopping_rule = None
+            self.stop_requested = False
+            if self.convergence_trace != None:
+                self.convergence_trace.close()
+                self.convergence_trace = None
+            if self.evaluation_pool != None:
+                self.evaluation_pool.terminate()
+                self.evaluation_pool = None
+            if self.fitness_cache != None and self.print_level > 0:
+                print ("Fitness cache hits = ", self.fitness_cache.hits, ", misses = ", self.fitness_cache.misses)
+            if (self.enforceMaxInputs or self.representation == 'labels') and self.print_level > 0:
+                print ("Swaps rejected for exceeding maxInputs = ", self.problem.n_rejected)
+            self.run_info = { 'stop_reason' : stop_reason, 'wall_time' : time.time() - start_time }
+            if self.enforceMaxInputs or self.representation == 'labels':
+                self.run_info['n_rejected'] = self.problem.n_rejected
+            #With rng: philox, the number of proposals drawn when the best state was found
+            if self.problem.proposal_rng is not None and algorithm != "parallel_tempering":
+                self.run_info['proposals'] = self.combbest_proposals
+            if ( self.print_level > 0 ):
+                print ("Stop reason = ", stop_reason)
+
+        return stop_reason
@@ -0,0 +1,197 @@
+#Checks of the chi2 calculation of study_mapping and of the minimisation algorithms, using small synthetic inputs
+#Run with: python -m pytest tests
+import os
+import sys
+import pickle
+import numpy as np
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+sys.path.insert(1, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'externals'))
+import process
+import kernels
+import mlrose_mod as mlrose
+
+class SyntheticHist:
+    #The parts of a ROOT TH1D used by getChiSquaredTargets and calculateChiSquared
+    def __init__(self, content, error):
+        self.content = content
+        self.error = error
+    def GetNbinsX(self):
+        return len(self.content)
+    def GetBinContent(self, b):
+        return self.content[b-1]
+    def GetBinError(self, b):
+        return self.error[b-1]
+
+#40 minigroups of 1 to 3 lpgbts, each with a few modules and towers (some of the towers shared
+#between minigroups), and two phi divisions of 8 r/z bins with the squared error in each bin
+nBundles = 6
+nBins = 8
+phisplit = [3,6]
+rng = np.random.RandomState(3)
+
+minigroups_swap = {}
+minigroups_modules = {}
+minigroups_towers = {}
+lpgbt = 0
+for mg in range(40):
+    size = rng.randint(1,4)
+    minigroups_swap[mg] = list(range(lpgbt, lpgbt+size))
+    lpgbt += size
+    minigroups_modules[mg] = [ [0, mg, m, 1] for m in range(rng.randint(1,4)) ]
+    minigroups_towers[mg] = [ [0, rng.randint(5), rng.randint(9)] for t in range(rng.randint(1,6)) ]
+minigroup_weights = np.array([ len(minigroups_swap[mg]) for mg in minigroups_swap ])
+
+minigroup_array = np.empty((len(minigroups_swap), 2, nBins, 2))
+minigroup_array[...,0] = rng.gamma(2., 30., (len(minigroups_swap), 2, nBins)) * (rng.uniform(size=(len(minigroups_swap), 2, nBins)) > 0.2)
+minigroup_array[...,1] = minigroup_array[...,0] * rng.uniform(0.5, 1.5, (len(minigroups_swap), 2, nBins))
+minigroup_index = process.getMiniGroupIndex(list(minigroups_swap))
+minigroup_hists = [ { mg : minigroup_array[mg,p] for mg in minigroups_swap } for p in range(2) ]
+
+inclusive = [ SyntheticHist(minigroup_array[:,p,:,0].sum(axis=0), np.sqrt(minigroup_array[:,p,:,1].sum(axis=0))) for p in range(2) ]
+targets = process.getChiSquaredTargets(inclusive, nBundles)
+
+#A few random states, followed by a sequence of single swaps
+states = [ rng.permutation(len(minigroups_swap)) for i in range(4) ]
+for i in range(30):
+    state = np.copy(states[-1])
+    a,b = rng.choice(len(minigroups_swap), size=2, replace=False)
+    state[a], state[b] = state[b], state[a]
+    states.append(state)
+states = np.array(states)
+
+def getEvaluator(**options):
+    return process.IncrementalChiSquared(minigroups_swap, minigroup_array, minigroup_index, targets, nBundles, minigroups_modules=minigroups_modules, minigroups_towers=minigroups_towers, phisplit=phisplit, **options)
+
+def getProblem(evaluator, **options):
+    #Minimisation of the r/z chi2 of an ordering of the minigroups, as in study_mapping
+    fitness = mlrose.CustomFitness(evaluator.evaluate, commit_fn=evaluator.setCurrent)
+    return mlrose.DiscreteOpt(length = len(minigroups_swap), fitness_fn = fitness, maximize = False, max_val = len(minigroups_swap), minigroups = minigroups_swap, nBundles = nBundles, bundle_boundaries_fn = evaluator.getBundleBoundaries, **options)
+
+@pytest.mark.parametrize('errors', [True, False])
+@pytest.mark.parametrize('weight_proportionally', [True, False])
+def test_chi2_array_matches_calculateChiSquared(errors, weight_proportionally):
+    hists = minigroup_hists if errors else [ { mg : hist[:,0] for mg,hist in phiselection.items() } for phiselection in minigroup_hists ]
+    for state in states[:4]:
+        grouped = process.getBundledlpgbtHists(hists, np.array_split(state, nBundles))
+        chi2 = process.calculateChiSquaredArray(targets, process.bundledHists2array(grouped), 20, 1000, 30, [1000,1,180], weight_proportionally)
+        assert np.isclose(chi2, process.calculateChiSquared(inclusive, grouped, nBundles, 20, 1000, 30, [1000,1,180], weight_proportionally), rtol=1e-9)
+
+def test_incremental_chi2_matches_full_calculation():
+    evaluator = getEvaluator()
+    for state in states:
+        chi2 = evaluator.evaluate(state)
+        bundles = evaluator.getBundles()
+        assert np.isclose(chi2, process.calculateChiSquared(inclusive, process.getBundledlpgbtHists(minigroup_hists, bundles), nBundles), rtol=1e-9)
+        assert evaluator.getMaxModules() == process.getMaximumNumberOfModulesInABundle(minigroups_modules, bundles)
+        assert evaluator.getMaxTowersList() == process.getMaxTowersList(minigroups_towers, bundles, phisplit)
+        #Accept every other swap
+        if state[0] % 2 == 0:
+            evaluator.evaluate(state)
+
+def test_batch_chi2_matches_incremental():
+    boundaries = process.getBundleBoundariesBatch(minigroup_weights[states], nBundles)
+    chi2 = process.calculateChiSquaredBatch(targets, process.getBundledlpgbtHistsBatch(minigroup_array, minigroup_index, states, boundaries))
+    np.testing.assert_allclose(chi2, [ getEvaluator().evaluate(state) for state in states ], rtol=1e-12)
+
+def test_max_towers_bitset():
+    tower_bitsets = process.getMiniGroupTowerBitsets(minigroups_towers, phisplit)
+    for state in states[:4]:
+        bundles = np.array_split(state, nBundles)
+        assert list(process.getMaxTowersListBitset(tower_bitsets, bundles)) == process.getMaxTowersList(minigroups_towers, bundles, phisplit)
+
+def test_chi2_does_not_depend_on_order():
+    #Reversing the order of the bundles, and of the minigroups within each bundle, gives the same partition and the same chi2
+    evaluator = getEvaluator()
+    for state in states[:4]:
+        boundaries = evaluator.getBundleBoundaries(state)
+        bundles = np.split(state, boundaries[1:-1])
+        reordered = np.concatenate([ bundle[::-1] for bundle in bundles[::-1] ])
+        reordered_boundaries = np.cumsum([0] + [ len(bundle) for bundle in bundles[::-1] ])
+        assert process.getCanonicalPartition(state, boundaries) == process.getCanonicalPartition(reordered, reordered_boundaries)
+        chi2 = evaluator.evaluateBundles(state, boundaries, np.arange(nBundles))[1]
+        reordered_chi2 = evaluator.evaluateBundles(reordered, reordered_boundaries, np.arange(nBundles))[1]
+        assert process.sumChiSquaredPerBundle(chi2) == process.sumChiSquaredPerBundle(reordered_chi2)
+
+def test_only_jumps_are_looked_up_in_the_cache():
+    evaluator = getEvaluator()
+    evaluator.evaluate(states[4])
+    #A single swap is evaluated incrementally, as is the proposed state when it is accepted
+    assert evaluator.isIncremental(states[5])
+    evaluator.evaluate(states[5])
+    assert evaluator.isIncremental(states[5])
+    assert not evaluator.isIncremental(states[0])
+    assert not getEvaluator().isIncremental(states[5])
+
+    #While a move of one minigroup is proposed, the current labels are still a neighbour
+    evaluator = getEvaluator(labels=True)
+    labels = np.arange(len(minigroups_swap)) % nBundles
+    evaluator.evaluate(labels)
+    moved = labels.copy()
+    moved[0] = labels[1]
+    evaluator.evaluate(moved)
+    assert evaluator.isIncremental(labels)
+    assert not evaluator.isIncremental((labels + 1) % nBundles)
+
+@pytest.mark.skipif(not kernels.numba_available, reason="numba is not available")
+def test_numba_engine_matches_numpy():
+    numpy_evaluator = getEvaluator()
+    numba_evaluator = getEvaluator(engine='numba')
+    for state in states:
+        assert np.isclose(numba_evaluator.evaluate(state), numpy_evaluator.evaluate(state), rtol=1e-12)
+        assert numba_evaluator.getMaxTowersList() == numpy_evaluator.getMaxTowersList()
+        assert numba_evaluator.getMaxModules() == numpy_evaluator.getMaxModules()
+
+def test_no_feasible_swap():
+    #The first bundle holds a single minigroup of 3 lpgbts and the second two of 1 lpgbt,
+    #so every swap takes the second bundle above 3 lpgbts
+    problem = mlrose.DiscreteOpt(length = 3, fitness_fn = mlrose.CustomFitness(lambda state: 0.), maximize = False, max_val = 3,
+                                 minigroups = { 0 : [0,1,2], 1 : [3], 2 : [4] }, nBundles = 2, bundle_boundaries_fn = lambda state: np.array([0,1,3]),
+                                 max_inputs = 3, max_rejections = 20)
+    problem.set_state(np.array([0,1,2]))
+    with pytest.raises(mlrose.NoFeasibleSwap):
+        problem.random_neighbor_swap()
+    assert problem.n_rejected == 20
+
+@pytest.mark.parametrize('algorithm', ['simulated_annealing', 'late_acceptance', 'tabu_search'])
+def test_checkpoint_resume_is_exact(algorithm):
+    minimise = { 'simulated_annealing' : lambda problem, **options : mlrose.simulated_annealing(problem, schedule = mlrose.GeomDecay(init_temp = 1000.), max_attempts = 10000, max_iters = 400, **options),
+                 'late_acceptance' : lambda problem, **options : mlrose.late_acceptance_hill_climb(problem, history_length = 20, max_attempts = 10000, max_iters = 400, **options),
+                 'tabu_search' : lambda problem, **options : mlrose.tabu_search(problem, n_neighbors = 5, tabu_tenure = 5, max_attempts = 10000, max_iters = 40, **options) }[algorithm]
+
+    checkpoints = []
+    uninterrupted = minimise(getProblem(getEvaluator()), init_state = states[0], random_state = 5,
+                             checkpoint = lambda algorithm_state: checkpoints.append(pickle.dumps(algorithm_state)), checkpoint_interval = 10)
+
+    #Continue from a checkpoint part of the way through, with a new evaluator and problem
+    resumed = minimise(getProblem(getEvaluator()), resume = pickle.loads(checkpoints[len(checkpoints)//2]))
+
+    assert list(resumed[0]) == list(uninterrupted[0])
+    assert resumed[1] == uninterrupted[1]
+
+def test_tabu_search_does_not_evaluate_accepted_neighbour_again():
+    evaluator = getEvaluator()
+    calls = []
+    def countCalls(state):
+        calls.append(state)
+        return evaluator.evaluate(state)
+    problem = getProblem(evaluator)
+    problem.fitness_fn = mlrose.CustomFitness(countCalls, commit_fn=evaluator.setCurrent)
+
+    mlrose.tabu_search(problem, n_neighbors = 5, tabu_tenure = 5, max_attempts = 10000, max_iters = 20, init_state = states[0], random_state = 5)
+    assert len(calls) == 1 + 20*5
+    assert problem.get_maximize()*problem.get_fitness() == getEvaluator().evaluate(problem.get_state())
+
+def test_bundle_neighbour_differs_from_state():
+    #With all minigroups in one bundle most draws pick two empty bundles
+    problem = mlrose.BundleOpt(length = len(minigroups_swap), fitness_fn = mlrose.CustomFitness(lambda state: 0.), maximize = False, minigroups = minigroups_swap, nBundles = nBundles)
+    problem.set_state(np.zeros(len(minigroups_swap), dtype=int))
+    for i in range(100):
+        assert np.count_nonzero(problem.random_neighbor_swap() != problem.get_state()) > 0
+
+def test_calibrate_without_worse_neighbours():
+    problem = mlrose.DiscreteOpt(length = len(minigroups_swap), fitness_fn = mlrose.CustomFitness(lambda state: 0.), maximize = False, max_val = len(minigroups_swap), minigroups = minigroups_swap, nBundles = nBundles)
+    problem.set_state(states[0])
+    assert mlrose.CalibratedDecay(n_samples = 20).calibrate(problem) == (1.0, 1.0)
+    assert mlrose.CalibratedDecay(n_samples = 20, default_temp = 50.).calibrate(problem) == (50.0, 50.0)